@@ -0,0 +1,126 @@
+"""專案備份的核心功能：掃描、排除規則、增量清單與平行複製
+
+這個套件不依賴 tkinter，圖形介面 (專案備份.py) 與命令列 (python -m backup_core) 共用同一套流程。
+"""
+from .archive import (
+    ARCHIVE_FORMATS,
+    OUTPUT_MODES,
+    OUTPUT_PACK,
+    ArchiveResult,
+    archive_path_for,
+    archive_scan,
+    archive_tree,
+    write_archive,
+)
+from .checksum import CHECKSUM_FILE, VerifyResult, hash_path, load_checksums, verify_backup
+from .config import (
+    CONFIG_FILE,
+    DEFAULT_COPY_WORKERS,
+    DEFAULT_SCAN_WORKERS,
+    MAX_COPY_WORKERS,
+    clamp_workers,
+    default_config,
+    get_actual_dest_dir,
+    get_extra_dest_dirs,
+    load_config,
+    save_config,
+)
+from .copier import CopyResult, copy_file, copy_files, link_or_copy
+from .delta import delta_copy_file
+from .dirtree import apply_directory_times, create_directories, plan_directories
+from .exclusion import ExclusionRules, make_exclusion_rules
+from .fanout import FanoutResult, fanout_copy, unsupported_options
+from .fastcopy import COPY_METHODS, copy_file_fast
+from .fileplan import FilePlan
+from .journal import JOURNAL_FILE, CopyJournal, find_unfinished_snapshot
+from .manifest import MANIFEST_FILE, hash_file, load_manifest, save_manifest
+from .mirror import MirrorPlan, MirrorResult, plan_mirror, run_mirror
+from .packstore import PackResult, PackStore, pack_scan, pack_store_path, pack_tree, write_pack
+from .pipeline import StreamResult, stream_backup
+from .preview import PreviewIndex
+from .restore import RestoreSelection, find_restore_point, list_restore_points, plan_restore
+from .scancache import ScanCache
+from .scanner import ScanResult, read_directory, scan_files, validate_paths, walk_tree
+from .snapshot import find_previous_snapshot, list_snapshots
+from .stats import RunStats, save_run_stats
+from .utils import format_size
+from .watch import SyncRound, watch_backup
+
+__all__ = [
+    'ARCHIVE_FORMATS',
+    'CHECKSUM_FILE',
+    'CONFIG_FILE',
+    'COPY_METHODS',
+    'DEFAULT_COPY_WORKERS',
+    'DEFAULT_SCAN_WORKERS',
+    'MAX_COPY_WORKERS',
+    'JOURNAL_FILE',
+    'MANIFEST_FILE',
+    'OUTPUT_MODES',
+    'OUTPUT_PACK',
+    'ArchiveResult',
+    'CopyJournal',
+    'CopyResult',
+    'ExclusionRules',
+    'FanoutResult',
+    'FilePlan',
+    'MirrorPlan',
+    'MirrorResult',
+    'PackResult',
+    'PackStore',
+    'PreviewIndex',
+    'RestoreSelection',
+    'RunStats',
+    'ScanCache',
+    'ScanResult',
+    'StreamResult',
+    'SyncRound',
+    'VerifyResult',
+    'archive_path_for',
+    'archive_scan',
+    'apply_directory_times',
+    'archive_tree',
+    'clamp_workers',
+    'copy_file',
+    'copy_file_fast',
+    'copy_files',
+    'create_directories',
+    'default_config',
+    'delta_copy_file',
+    'fanout_copy',
+    'find_previous_snapshot',
+    'find_restore_point',
+    'find_unfinished_snapshot',
+    'format_size',
+    'get_actual_dest_dir',
+    'get_extra_dest_dirs',
+    'hash_file',
+    'hash_path',
+    'link_or_copy',
+    'list_restore_points',
+    'list_snapshots',
+    'load_checksums',
+    'load_config',
+    'load_manifest',
+    'make_exclusion_rules',
+    'pack_scan',
+    'pack_store_path',
+    'pack_tree',
+    'plan_directories',
+    'plan_mirror',
+    'plan_restore',
+    'read_directory',
+    'run_mirror',
+    'save_config',
+    'save_manifest',
+    'save_run_stats',
+    'scan_files',
+    'stream_backup',
+    'unsupported_options',
+    'validate_paths',
+    'verify_backup',
+    'walk_tree',
+    'watch_backup',
+    'write_archive',
+    'write_pack',
+]
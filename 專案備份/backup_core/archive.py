@@ -0,0 +1,285 @@
+"""封存檔輸出模式：把要複製的檔案直接串流寫成單一 .tar.gz / .tar.xz / .tar.zst / .zip
+
+tar.gz 與 tar.xz 把 tar 資料流切成固定大小的區塊，交給多個執行緒各自壓縮成獨立的
+gzip member / xz stream 再依序寫出 (兩種格式都允許串接，gzip、xz、tar 都能直接解開)，
+zlib 與 lzma 壓縮時會釋放 GIL，因此能用滿多核心。tar.zst 使用 zstandard 套件本身的多執行緒壓縮
+(未安裝時不可選)。zip 的每個檔案各自壓縮、無法切塊，標準函式庫也沒有寫入預先壓縮內容的方法，
+因此 zip 維持單執行緒寫入 (需要多核心壓縮時請選 tar 格式)。
+"""
+import lzma
+import os
+import tarfile
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from .config import DEFAULT_COPY_WORKERS, DEFAULT_SCAN_WORKERS, clamp_workers
+from .copier import CopyResult
+from .scanner import walk_tree
+
+try:
+    import zstandard
+except ImportError:  # zstd 為選用功能
+    zstandard = None
+
+# 輸出模式：'folder' 為原本的資料夾複製，'pack' 為去重的封包庫 (見 packstore.py)，其餘為封存格式
+OUTPUT_FOLDER = 'folder'
+OUTPUT_PACK = 'pack'
+ARCHIVE_FORMATS = ('tar.gz', 'tar.xz', 'zip') + (('tar.zst',) if zstandard is not None else ())
+OUTPUT_MODES = (OUTPUT_FOLDER,) + ARCHIVE_FORMATS + (OUTPUT_PACK,)
+# 每個壓縮區塊的大小：愈大壓縮率愈好，愈小愈早開始平行
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_LEVELS = {'tar.gz': 6, 'tar.xz': 6, 'tar.zst': 3, 'zip': 6}
+
+
+@dataclass
+class ArchiveResult(CopyResult):
+    """封存輸出的結果"""
+    archive_path: str = ''
+    bytes_read: int = 0     # 讀入的檔案內容位元組數
+    bytes_written: int = 0  # 封存檔大小
+
+
+def archive_path_for(dest_dir, fmt):
+    """封存檔路徑：與資料夾模式相同的命名 (含時間戳記) 再加上副檔名"""
+    return f"{dest_dir}.{fmt}"
+
+
+def _gzip_chunk(level):
+    def compress(chunk):
+        c = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31：輸出完整的 gzip member
+        return c.compress(chunk) + c.flush()
+    return compress
+
+
+def _xz_chunk(level):
+    def compress(chunk):
+        return lzma.compress(chunk, format=lzma.FORMAT_XZ, preset=level)
+    return compress
+
+
+class ParallelChunkWriter:
+    """類檔案物件：寫入的資料切成區塊平行壓縮，依原順序寫到底層檔案
+
+    同時進行中的區塊數有上限，慢的磁碟會讓 tar 寫入端等待，記憶體不會無限增加。
+    """
+
+    def __init__(self, fileobj, compress_chunk, workers, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._fileobj = fileobj
+        self._compress = compress_chunk
+        self._chunk_size = chunk_size
+        self._max_pending = workers * 2
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self._chunk_size:
+            self._submit(bytes(self._buffer[:self._chunk_size]))
+            del self._buffer[:self._chunk_size]
+        return len(data)
+
+    def _submit(self, chunk):
+        self._pending.append(self._executor.submit(self._compress, chunk))
+        while len(self._pending) > self._max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        data = self._pending.popleft().result()
+        self._fileobj.write(data)
+        self.bytes_written += len(data)
+
+    def close(self):
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_next()
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class _PaddedReader:
+    """只讀取標頭記載的大小：讀取失敗或檔案變短時以零補足，已寫出的標頭與內容大小才會一致
+
+    補零的檔案內容不正確，錯誤記在 error，由呼叫端記錄為失敗；封存檔本身仍可完整解開。
+    """
+
+    def __init__(self, f, size):
+        self._f = f
+        self._remaining = size
+        self.error = None
+
+    def read(self, n=-1):
+        if n < 0 or n > self._remaining:
+            n = self._remaining
+        data = b''
+        if n and self.error is None:
+            try:
+                data = self._f.read(n)
+            except OSError as e:
+                self.error = e
+            else:
+                if len(data) < n:
+                    self.error = OSError(f"檔案在封存途中變短：{self._f.name}")
+        if len(data) < n:
+            data += bytes(n - len(data))
+        self._remaining -= n
+        return data
+
+
+class _ArchiveFile:
+    """封存暫存檔：記錄寫入本身的錯誤，用來分辨讀取來源失敗 (略過這個檔案) 與寫入封存檔失敗 (中止)"""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.error = None
+
+    def write(self, data):
+        try:
+            return self._raw.write(data)
+        except OSError as e:
+            self.error = e
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def _open_member(archive, source_path, arcname):
+    """開啟來源檔案並建立 tar 標頭 (尚未寫入封存檔)，回傳 (檔案, 標頭, 大小)
+
+    大小以開啟後的 fstat 為準，避免檔案在掃描後改變大小。這裡的錯誤只需略過這個檔案。
+    """
+    f = open(source_path, 'rb')
+    try:
+        info = archive.gettarinfo(arcname=arcname, fileobj=f)
+        return f, info, info.size
+    except BaseException:
+        f.close()
+        raise
+
+
+def _write_member(archive, f, info, size):
+    """寫入 tar 標頭與內容，回傳讀取來源時的錯誤 (None 為成功)；寫入封存檔本身的錯誤直接丟出"""
+    reader = _PaddedReader(f, size)
+    archive.addfile(info, reader)
+    return reader.error
+
+
+def _write_zip_member(archive, target, source_path, arcname):
+    """以 ZipFile.write 寫入一個檔案 (套用封存檔的壓縮方式與等級)，回傳 (讀取來源時的錯誤, 讀入的位元組數)
+
+    zip 寫完內容後會回頭修正標頭，檔案在掃描後改變大小也不影響封存檔；讀取途中失敗時
+    已寫入的部分仍是完整的成員。寫入封存檔本身的錯誤 (記在 target.error) 直接丟出。
+    """
+    count = len(archive.filelist)
+    error = None
+    try:
+        archive.write(source_path, arcname)
+    except OSError as e:
+        if target.error is not None:
+            raise
+        error = e
+    size = archive.filelist[-1].file_size if len(archive.filelist) > count else 0
+    return error, size
+
+
+def write_archive(entries, archive_path, fmt, workers=DEFAULT_COPY_WORKERS, level=None,
+                  total=None, progress_callback=None):
+    """將 entries [(來源路徑, 相對路徑)] 依序寫成封存檔，回傳 ArchiveResult
+
+    entries 可以是產生器 (例如邊掃描邊產生)，此時 total 為 None。
+    無法開啟的檔案記錄為失敗並略過；已寫出標頭後才讀取失敗的檔案內容補零，同樣記錄為失敗。
+    寫入封存檔本身失敗時中止。封存先寫到 .partial 暫存檔，完成後才改名。
+    progress_callback(已完成數, 總數或 None) 大約每 1% (或每 100 個檔案) 呼叫一次。
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"不支援的封存格式：{fmt}")
+    level = DEFAULT_LEVELS[fmt] if level is None else level
+    worker_count = clamp_workers(workers)
+    result = ArchiveResult(archive_path=archive_path)
+    temp_path = archive_path + ".partial"
+    os.makedirs(os.path.dirname(archive_path) or '.', exist_ok=True)
+    update_interval = max(1, total // 100) if total else 100
+
+    try:
+        with open(temp_path, 'wb') as f:
+            raw = _ArchiveFile(f)
+            _write_entries(raw, entries, fmt, level, worker_count, result, update_interval, total, progress_callback)
+            result.bytes_written = raw.tell()
+    except BaseException:
+        # 失敗時不留下不完整的封存檔
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    os.replace(temp_path, archive_path)
+    if progress_callback:
+        progress_callback(result.copied_count + len(result.failed_files), total)
+    return result
+
+
+def _write_entries(raw, entries, fmt, level, worker_count, result, update_interval, total, progress_callback):
+    """把所有檔案寫進已開啟的封存暫存檔"""
+    if fmt == 'zip':
+        writer = None
+        archive = zipfile.ZipFile(raw, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=level)
+    else:
+        if fmt == 'tar.zst':
+            writer = zstandard.ZstdCompressor(level=level, threads=worker_count).stream_writer(raw, closefd=False)
+        else:
+            compress = _gzip_chunk(level) if fmt == 'tar.gz' else _xz_chunk(level)
+            writer = ParallelChunkWriter(raw, compress, worker_count)
+        archive = tarfile.open(fileobj=writer, mode='w|', format=tarfile.PAX_FORMAT)
+
+    done_count = 0
+    try:
+        for source_path, relative_path in entries:
+            arcname = relative_path.replace(os.sep, '/')
+            if fmt == 'zip':
+                error, size = _write_zip_member(archive, raw, source_path, arcname)
+            else:
+                try:
+                    f, info, size = _open_member(archive, source_path, arcname)
+                except OSError as e:
+                    error, size = e, 0
+                else:
+                    with f:
+                        error = _write_member(archive, f, info, size)
+            result.bytes_read += size
+            if error is None:
+                result.record_method(fmt)
+            else:
+                result.failed_files.append((source_path, error))
+            done_count += 1
+            if progress_callback and done_count % update_interval == 0:
+                progress_callback(done_count, total)
+    finally:
+        archive.close()
+        if writer is not None:
+            writer.close()
+
+
+def archive_scan(scan, fmt, workers=DEFAULT_COPY_WORKERS, level=None, progress_callback=None):
+    """依掃描結果寫出封存檔 (路徑由 scan.dest_dir 加上副檔名)，回傳 ArchiveResult"""
+    source_prefix = scan.files.source_prefix
+    entries = ((source_prefix + relative_path, relative_path) for relative_path, _, _ in scan.files.iter_entries())
+    return write_archive(entries, archive_path_for(scan.dest_dir, fmt), fmt, workers, level,
+                         total=scan.total_files, progress_callback=progress_callback)
+
+
+def archive_tree(source_dir, archive_path, fmt, rules=None, workers=DEFAULT_COPY_WORKERS,
+                 scan_workers=DEFAULT_SCAN_WORKERS, level=None, progress_callback=None):
+    """串流模式：邊走訪來源資料夾邊寫入封存檔，不先建立完整的檔案清單"""
+    entries = ((source_path, relative_path)
+               for batch in walk_tree(source_dir, rules, scan_workers)
+               for source_path, relative_path, _, _ in batch)
+    return write_archive(entries, archive_path, fmt, workers, level, progress_callback=progress_callback)
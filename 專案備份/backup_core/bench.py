@@ -0,0 +1,265 @@
+"""效能測試：產生可重現的合成專案資料夾，量測掃描、篩選與各種複製方式的速度
+
+    python -m backup_core.bench                      # small 規模，測試所有複製方式
+    python -m backup_core.bench --scale medium --methods auto buffered --workers 1 8
+    python -m backup_core.bench --root D:/bench --json bench.json   # 保留合成資料夾，下次直接沿用
+
+合成資料夾包含大量小檔案、少數大檔案、很深的資料夾層級，以及會被排除的大型
+node_modules、.git 與 firebase-export-* 資料夾 (用來測試排除規則的比對速度)。
+同樣的 --seed 與 --scale 產生完全相同的內容，不同版本之間的結果可以直接比較。
+不需要圖形介面，全部在本機的暫存資料夾中執行。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+
+from .config import DEFAULT_COPY_WORKERS, DEFAULT_SCAN_WORKERS, default_config
+from .copier import copy_files
+from .exclusion import make_exclusion_rules
+from .fastcopy import COPY_METHODS
+from .pipeline import stream_backup
+from .scancache import ScanCache
+from .scanner import scan_files
+
+# 各規模的資料夾內容：小檔案數、每個資料夾的檔案數、大檔案數與大小、深層資料夾層數、
+# node_modules 套件數、.git 物件數、firebase-export 資料夾數
+SCALES = {
+    'tiny': dict(small_files=300, files_per_dir=20, huge_files=1, huge_size=4 << 20, depth=8,
+                 node_modules=200, git_objects=100, exports=1),
+    'small': dict(small_files=3000, files_per_dir=25, huge_files=2, huge_size=32 << 20, depth=16,
+                  node_modules=2000, git_objects=1000, exports=2),
+    'medium': dict(small_files=20000, files_per_dir=40, huge_files=4, huge_size=128 << 20, depth=32,
+                   node_modules=15000, git_objects=8000, exports=3),
+    'large': dict(small_files=100000, files_per_dir=50, huge_files=8, huge_size=512 << 20, depth=64,
+                  node_modules=80000, git_objects=40000, exports=4),
+}
+DEFAULT_SCALE = 'small'
+# 合成資料夾額外使用的 gitignore 規則 (與預設的排除資料夾一起測試)
+BENCH_PATTERNS = ['*.log', 'dist/', '!keep.log']
+# 記錄產生參數的檔案 (放在合成資料夾旁邊，相同參數時可沿用既有的資料夾)
+TREE_MARKER_SUFFIX = ".bench.json"
+_HUGE_BLOCK = 1 << 20
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def generate_tree(root, scale=DEFAULT_SCALE, seed=0):
+    """在 root 產生合成專案資料夾，回傳 (會被備份的檔案數, 位元組數)
+
+    root 已是相同參數產生的資料夾時直接沿用。
+    """
+    params = SCALES[scale]
+    marker_path = os.path.normpath(root) + TREE_MARKER_SUFFIX
+    marker = {'scale': scale, 'seed': seed}
+    try:
+        with open(marker_path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+        if {k: existing.get(k) for k in marker} == marker:
+            return existing['files'], existing['bytes']
+    except (OSError, ValueError):
+        pass
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+
+    rng = random.Random(seed)
+    kept_files = 0
+    kept_bytes = 0
+
+    def kept(path, data):
+        nonlocal kept_files, kept_bytes
+        _write(path, data)
+        kept_files += 1
+        kept_bytes += len(data)
+
+    # 一般原始碼：許多小檔案分散在兩層資料夾中，夾雜會被 *.log 與 dist/ 排除的檔案
+    per_dir = params['files_per_dir']
+    for i in range(params['small_files']):
+        directory = os.path.join(root, 'src', f'pkg{i // (per_dir * 20):03d}', f'mod{i // per_dir:05d}')
+        kept(os.path.join(directory, f'file{i:06d}.js'), rng.randbytes(rng.randint(50, 4096)))
+        if i % per_dir == 0:
+            _write(os.path.join(directory, 'debug.log'), rng.randbytes(256))
+            _write(os.path.join(directory, 'dist', 'bundle.js'), rng.randbytes(1024))
+    kept(os.path.join(root, 'src', 'keep.log'), rng.randbytes(128))
+
+    # 很深的資料夾層級
+    directory = os.path.join(root, 'deep')
+    for level in range(params['depth']):
+        directory = os.path.join(directory, f'level{level:02d}')
+        kept(os.path.join(directory, 'note.txt'), rng.randbytes(rng.randint(10, 200)))
+
+    # 少數大檔案 (以重複的隨機區塊組成，產生速度快且不會被壓縮或去重)
+    for i in range(params['huge_files']):
+        block = rng.randbytes(_HUGE_BLOCK)
+        path = os.path.join(root, 'media', f'video{i:02d}.bin')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for offset in range(0, params['huge_size'], _HUGE_BLOCK):
+                f.write(block[:params['huge_size'] - offset])
+        kept_files += 1
+        kept_bytes += params['huge_size']
+
+    # 會被排除的資料夾：node_modules、.git、firebase-export-*
+    for i in range(params['node_modules']):
+        _write(os.path.join(root, 'node_modules', f'package{i // 10:05d}', f'index{i % 10}.js'),
+               rng.randbytes(rng.randint(50, 2048)))
+    for i in range(params['git_objects']):
+        name = f'{rng.getrandbits(160):040x}'
+        _write(os.path.join(root, '.git', 'objects', name[:2], name[2:]), rng.randbytes(rng.randint(50, 1024)))
+    for i in range(params['exports']):
+        for j in range(50):
+            _write(os.path.join(root, f'firebase-export-{i:04d}', 'firestore_export', f'output-{j}'),
+                   rng.randbytes(512))
+
+    marker.update(files=kept_files, bytes=kept_bytes)
+    with open(marker_path, 'w', encoding='utf-8') as f:
+        json.dump(marker, f)
+    return kept_files, kept_bytes
+
+
+def _row(name, seconds, files, total_bytes):
+    """一列結果 (dict)"""
+    return {
+        'name': name,
+        'seconds': round(seconds, 4),
+        'files': files,
+        'bytes': total_bytes,
+        'files_per_second': round(files / seconds, 1) if seconds > 0 else None,
+        'mb_per_second': round(total_bytes / seconds / 1e6, 1) if seconds > 0 else None,
+    }
+
+
+def _clear(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+def run_benchmarks(source_dir, work_dir, methods=None, workers_list=None, scan_workers=DEFAULT_SCAN_WORKERS,
+                   include_stream=True, include_verify=True):
+    """對 source_dir 執行所有測試，回傳結果列 (list of dict)
+
+    每個複製測試都寫到 work_dir 下的新資料夾，測完即刪除。
+    作業系統的檔案快取無法在程式中清除，第一次掃描之後的讀取都是熱快取的結果。
+    """
+    methods = methods or list(COPY_METHODS)
+    workers_list = workers_list or [DEFAULT_COPY_WORKERS]
+    config = default_config()
+    config['exclude_patterns'] = BENCH_PATTERNS
+    rules = make_exclusion_rules(config)
+    dest_dir = os.path.join(work_dir, 'dest')
+    rows = []
+
+    # 掃描：排除模式與完整模式 (完整模式需要走訪 node_modules 與 .git)
+    started = time.perf_counter()
+    scan = scan_files(source_dir, dest_dir, rules, workers=scan_workers)
+    rows.append(_row('scan (排除)', time.perf_counter() - started, scan.total_files, scan.total_bytes))
+    started = time.perf_counter()
+    full_scan = scan_files(source_dir, dest_dir, None, workers=scan_workers)
+    rows.append(_row('scan (完整)', time.perf_counter() - started, full_scan.total_files, full_scan.total_bytes))
+    started = time.perf_counter()
+    scan_files(source_dir, dest_dir, rules, workers=1)
+    rows.append(_row('scan (單執行緒)', time.perf_counter() - started, scan.total_files, scan.total_bytes))
+
+    # 篩選：資料夾內容已在快取中，只剩套用排除規則的時間
+    cache = ScanCache(source_dir)
+    scan_files(source_dir, dest_dir, None, workers=scan_workers, cache=cache)
+    started = time.perf_counter()
+    scan_files(source_dir, dest_dir, rules, workers=scan_workers, cache=cache)
+    rows.append(_row('filter (快取)', time.perf_counter() - started, scan.total_files, scan.total_bytes))
+
+    # 複製：各種方式與執行緒數
+    for workers in workers_list:
+        for method in methods:
+            _clear(dest_dir)
+            result = copy_files(scan, workers=workers, method=method)
+            stats = result.stats.snapshot()
+            row = _row(f'copy {method} x{workers}', stats['elapsed_seconds'], result.copied_count, stats['bytes_done'])
+            row['methods'] = result.methods
+            row['failed'] = len(result.failed_files)
+            rows.append(row)
+        if include_verify:
+            _clear(dest_dir)
+            result = copy_files(scan, workers=workers, verify=True)
+            stats = result.stats.snapshot()
+            rows.append(_row(f'copy verify x{workers}', stats['elapsed_seconds'], result.copied_count, stats['bytes_done']))
+        if include_stream:
+            _clear(dest_dir)
+            started = time.perf_counter()
+            result = stream_backup(source_dir, dest_dir, rules, workers=workers, scan_workers=scan_workers)
+            rows.append(_row(f'stream (掃描+複製) x{workers}', time.perf_counter() - started,
+                             result.copied_count, result.total_bytes))
+    _clear(dest_dir)
+    return rows
+
+
+def _display_width(text):
+    """文字在終端機中的寬度 (中文字佔兩格)"""
+    return sum(2 if unicodedata.east_asian_width(ch) in 'WF' else 1 for ch in text)
+
+
+def _pad(text, width, right=False):
+    padding = ' ' * (width - _display_width(text))
+    return padding + text if right else text + padding
+
+
+def format_table(rows):
+    """將結果排成文字表格"""
+    headers = ('測試', '秒', '檔案數', 'files/s', 'MB/s')
+    lines = [(row['name'], f"{row['seconds']:.3f}", str(row['files']),
+              f"{row['files_per_second']:.0f}" if row['files_per_second'] is not None else '-',
+              f"{row['mb_per_second']:.1f}" if row['mb_per_second'] is not None else '-')
+             for row in rows]
+    widths = [max(_display_width(cell) for cell in column) for column in zip(headers, *lines)]
+    return "\n".join("  ".join(_pad(cell, width, right=i > 0) for i, (cell, width) in enumerate(zip(line, widths)))
+                     for line in [headers] + lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="backup_core.bench", description="專案備份效能測試 (合成資料夾)")
+    parser.add_argument('--scale', choices=SCALES, default=DEFAULT_SCALE, help="合成資料夾的規模")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子 (相同種子產生相同內容)")
+    parser.add_argument('--root', help="測試使用的資料夾 (會保留合成資料夾，下次可直接沿用；預設為用完即刪的暫存資料夾)")
+    parser.add_argument('--methods', nargs='+', choices=COPY_METHODS, help="要測試的複製方式 (預設全部)")
+    parser.add_argument('--workers', nargs='+', type=int, help=f"要測試的複製執行緒數 (預設 {DEFAULT_COPY_WORKERS})")
+    parser.add_argument('--scan-workers', type=int, default=DEFAULT_SCAN_WORKERS, help="掃描執行緒數")
+    parser.add_argument('--no-stream', action='store_true', help="不測試串流模式")
+    parser.add_argument('--no-verify', action='store_true', help="不測試複製時計算校驗碼")
+    parser.add_argument('--json', help="將結果另存為 JSON 檔")
+    return parser
+
+
+def main(argv=None):
+    """效能測試主程式，回傳結束代碼"""
+    args = build_parser().parse_args(argv)
+    work_dir = args.root or tempfile.mkdtemp(prefix="backup_bench_")
+    source_dir = os.path.join(work_dir, 'source')
+    try:
+        started = time.perf_counter()
+        files, total_bytes = generate_tree(source_dir, args.scale, args.seed)
+        print(f"合成資料夾：{source_dir} ({files} 個要備份的檔案，{total_bytes / 1e6:.1f} MB，"
+              f"產生耗時 {time.perf_counter() - started:.1f} 秒)", file=sys.stderr)
+        rows = run_benchmarks(source_dir, work_dir, methods=args.methods, workers_list=args.workers,
+                              scan_workers=args.scan_workers, include_stream=not args.no_stream,
+                              include_verify=not args.no_verify)
+    finally:
+        if not args.root:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(format_table(rows))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'scale': args.scale, 'seed': args.seed, 'results': rows}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
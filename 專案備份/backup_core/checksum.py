@@ -0,0 +1,198 @@
+"""備份完整性驗證：複製時順便計算校驗碼並寫入目標資料夾，之後可平行重新檢查
+
+複製時資料只讀一次，邊寫入目標邊更新雜湊 (見 fastcopy.copy_file_fast 的 hasher 參數)，
+不需要複製後再讀一次來源與目標。安裝了 xxhash 套件時使用速度快很多的 xxh3_128，
+否則使用標準函式庫的 blake2b。校驗碼檔案記錄使用的演算法，驗證時依記錄選擇。
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from .config import DEFAULT_COPY_WORKERS, clamp_workers
+from .manifest import manifest_key
+
+try:
+    import xxhash
+except ImportError:  # xxhash 為選用功能
+    xxhash = None
+
+# 校驗碼檔名 (寫在目標資料夾內)
+CHECKSUM_FILE = ".backup_checksums.json"
+CHECKSUM_VERSION = 1
+CHECKSUM_ALGORITHMS = ('blake2b',) + (('xxh3_128',) if xxhash is not None else ())
+DEFAULT_CHECKSUM_ALGORITHM = 'xxh3_128' if xxhash is not None else 'blake2b'
+_READ_SIZE = 1024 * 1024
+
+
+class StreamHasher:
+    """邊複製邊計算的雜湊，同時記錄經過的位元組數"""
+
+    def __init__(self, algorithm=DEFAULT_CHECKSUM_ALGORITHM):
+        self.algorithm = algorithm
+        self._hash = xxhash.xxh3_128() if algorithm == 'xxh3_128' else hashlib.blake2b()
+        self.size = 0
+
+    def update(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+
+    def reset(self):
+        """捨棄已計算的部分 (複製失敗後改用其他方式重新複製時)"""
+        self.__init__(self.algorithm)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def hash_path(path, algorithm=DEFAULT_CHECKSUM_ALGORITHM):
+    """計算檔案的校驗碼，回傳 (位元組數, 雜湊值)"""
+    hasher = StreamHasher(algorithm)
+    buf = bytearray(_READ_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.size, hasher.hexdigest()
+
+
+def load_checksums(dest_dir):
+    """讀取目標資料夾內的校驗碼，回傳 (演算法, {清單鍵值: [大小, 雜湊]})；沒有時回傳 (None, {})"""
+    path = os.path.join(dest_dir, CHECKSUM_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None, {}
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"讀取校驗碼 {path} 時發生錯誤: {e}")
+        return None, {}
+    if not isinstance(data, dict) or data.get('version') != CHECKSUM_VERSION:
+        return None, {}
+    return data.get('algorithm'), data.get('files', {})
+
+
+def save_checksums(dest_dir, algorithm, entries):
+    """將校驗碼寫入目標資料夾 (先寫暫存檔再取代)"""
+    os.makedirs(dest_dir, exist_ok=True)
+    path = os.path.join(dest_dir, CHECKSUM_FILE)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CHECKSUM_VERSION, 'algorithm': algorithm, 'files': entries},
+                  f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+def update_checksums(dest_dir, algorithm, new_entries, removed_keys=()):
+    """合併本次複製的校驗碼到既有的檔案 (演算法不同時捨棄舊的記錄)"""
+    previous_algorithm, entries = load_checksums(dest_dir)
+    if previous_algorithm != algorithm:
+        entries = {}
+    for key in removed_keys:
+        entries.pop(key, None)
+    entries.update(new_entries)
+    save_checksums(dest_dir, algorithm, entries)
+
+
+class ChecksumRecorder:
+    """複製過程中收集每個檔案的校驗碼，結束時合併寫入目標資料夾
+
+    以硬連結共用的檔案沒有經過複製，優先沿用 link_dest 快照記錄的校驗碼，沒有時才讀取檔案計算。
+    """
+
+    def __init__(self, dest_dir, algorithm=DEFAULT_CHECKSUM_ALGORITHM, link_dest=None):
+        self.dest_dir = dest_dir
+        self.algorithm = algorithm
+        self.entries = {}
+        linked_algorithm, linked = load_checksums(link_dest) if link_dest else (None, {})
+        self._linked = linked if linked_algorithm == algorithm else {}
+
+    def hasher(self):
+        return StreamHasher(self.algorithm)
+
+    def record(self, relative_path, dest_path, hasher, used):
+        """記錄一個已完成的檔案 (可在複製執行緒中呼叫)，回傳其雜湊值"""
+        key = manifest_key(relative_path)
+        entry = self._linked.get(key) if used == 'hardlink' else None
+        if entry is None:
+            entry = list(hash_path(dest_path, self.algorithm)) if used == 'hardlink' else [hasher.size, hasher.hexdigest()]
+        self.entries[key] = entry
+        return entry[1]
+
+    def save(self):
+        if self.entries:
+            update_checksums(self.dest_dir, self.algorithm, self.entries)
+
+
+@dataclass
+class VerifyResult:
+    """驗證既有備份的結果"""
+    algorithm: str = ''
+    checked_count: int = 0
+    ok_count: int = 0
+    mismatched: list = field(default_factory=list)  # [(相對路徑, 說明)]
+    missing: list = field(default_factory=list)     # [相對路徑]
+    errors: list = field(default_factory=list)      # [(相對路徑, 例外)]
+    bytes_checked: int = 0
+
+    @property
+    def is_ok(self):
+        return not (self.mismatched or self.missing or self.errors)
+
+
+def _verify_one(dest_dir, key, expected_size, expected_digest, algorithm):
+    """檢查單一檔案，回傳 ('ok' | 'missing' | 'mismatch', 說明, 讀取位元組數)"""
+    path = os.path.join(dest_dir, *key.split('/'))
+    try:
+        actual_size = os.path.getsize(path)
+    except FileNotFoundError:
+        return 'missing', None, 0
+    if actual_size != expected_size:  # 大小不同就不必讀內容
+        return 'mismatch', f"大小不符：預期 {expected_size}，實際 {actual_size}", 0
+    size, digest = hash_path(path, algorithm)
+    if digest != expected_digest:
+        return 'mismatch', "內容校驗碼不符", size
+    return 'ok', None, size
+
+
+def verify_backup(dest_dir, workers=DEFAULT_COPY_WORKERS, progress_callback=None):
+    """依校驗碼檔案平行檢查目標資料夾，回傳 VerifyResult
+
+    沒有校驗碼檔案時丟出 ValueError (訊息可直接顯示給使用者)。
+    progress_callback(已檢查數, 總數) 只會在呼叫端執行緒中被呼叫，大約呼叫 100 次。
+    """
+    algorithm, entries = load_checksums(dest_dir)
+    if algorithm is None:
+        raise ValueError(f"找不到校驗碼檔案，請先以驗證模式備份：\n{os.path.join(dest_dir, CHECKSUM_FILE)}")
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"校驗碼使用的演算法 {algorithm} 無法使用 (可能需要安裝 xxhash 套件)")
+
+    result = VerifyResult(algorithm=algorithm)
+    total = len(entries)
+    update_interval = max(1, total // 100)
+    with ThreadPoolExecutor(max_workers=clamp_workers(workers)) as executor:
+        futures = {executor.submit(_verify_one, dest_dir, key, size, digest, algorithm): key
+                   for key, (size, digest) in entries.items()}
+        for done_count, future in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            result.checked_count += 1
+            try:
+                status, message, size = future.result()
+            except OSError as e:
+                result.errors.append((key, e))
+            else:
+                result.bytes_checked += size
+                if status == 'ok':
+                    result.ok_count += 1
+                elif status == 'missing':
+                    result.missing.append(key)
+                else:
+                    result.mismatched.append((key, message))
+            if progress_callback and (done_count % update_interval == 0 or done_count == total):
+                progress_callback(done_count, total)
+    return result
+
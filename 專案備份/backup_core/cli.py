@@ -0,0 +1,683 @@
+"""命令列入口：不需要圖形介面即可執行備份 (例如排程在無螢幕的建置主機上)
+
+    python -m backup_core --source D:/friedg --dest D:/備份/friedg --timestamp --jobs 16
+
+    python -m backup_core --output tar.gz --stream   # 直接寫成壓縮封存檔
+
+    python -m backup_core --verify-backup D:/備份/friedg   # 依校驗碼檢查既有的備份
+
+    python -m backup_core --watch --mirror   # 持續同步，直到按 Ctrl+C
+
+    python -m backup_core --output pack   # 寫入去重的封包庫 (目標路徑加上 .pack)
+
+    python -m backup_core --pack-extract D:/還原 --only src/app.js   # 從封包庫的最新快照取出檔案
+
+    python -m backup_core --also Z:/NAS/friedg   # 來源只讀一次，同時寫入目標資料夾與 NAS
+
+    python -m backup_core --restore D:/friedg --only src "**/*.json"   # 從最新的快照還原選取的檔案
+
+執行結果以 JSON 輸出到標準輸出；有檔案複製失敗 (或驗證發現問題) 時結束代碼為 1，參數錯誤為 2。
+持續同步時每一輪輸出一行 JSON。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from .archive import OUTPUT_FOLDER, OUTPUT_MODES, OUTPUT_PACK, archive_path_for, archive_scan, archive_tree
+from .checksum import verify_backup
+from .config import CONFIG_FILE, clamp_workers, get_actual_dest_dir, get_extra_dest_dirs, load_config
+from .copier import copy_files
+from .exclusion import make_exclusion_rules
+from .fanout import fanout_copy, unsupported_options
+from .fastcopy import COPY_METHODS
+from .journal import find_unfinished_snapshot
+from .mirror import plan_mirror, run_mirror
+from .packstore import PackStore, pack_scan, pack_store_path, pack_tree
+from .pipeline import stream_backup
+from .restore import find_restore_point, list_restore_points, plan_restore
+from .scancache import ScanCache
+from .scanner import scan_files, validate_paths
+from .snapshot import find_previous_snapshot, list_snapshots
+from .stats import save_run_stats
+from .watch import watch_backup
+
+
+def build_parser():
+    """建立命令列參數解析器"""
+    parser = argparse.ArgumentParser(prog="backup_core", description="專案檔案選擇性複製工具 (命令列版)")
+    parser.add_argument('--config', default=CONFIG_FILE, help="設定檔路徑 (未指定的參數從設定檔讀取)")
+    parser.add_argument('--source', help="來源專案資料夾")
+    parser.add_argument('--dest', help="複製到目標資料夾")
+    parser.add_argument('--full', action='store_true', help="完整模式：忽略排除規則")
+    parser.add_argument('--timestamp', action='store_true', default=None, help="目標資料夾附加時間戳記")
+    parser.add_argument('--jobs', type=int, help="同時複製的執行緒數")
+    parser.add_argument('--copy-method', choices=COPY_METHODS, help="複製方式 (預設 auto：reflink → copy_file_range → sendfile → 一般讀寫)")
+    parser.add_argument('--incremental', action='store_true', default=None, help="增量備份：只複製新增或變更的檔案")
+    parser.add_argument('--hash', action='store_true', default=None, help="增量清單記錄內容雜湊")
+    parser.add_argument('--link-dest', nargs='?', const='auto', default=None,
+                        help="未變更的檔案以硬連結共用指定快照 (不指定路徑時自動使用最新的時間戳記快照)")
+    parser.add_argument('--dry-run', action='store_true', help="只計算檔案數量，不實際複製")
+    parser.add_argument('--stream', action='store_true', help="串流模式：邊掃描邊複製 (不能與 --dry-run 併用)")
+    parser.add_argument('--no-resume', dest='resume', action='store_false', default=None,
+                        help="不記錄複製日誌 (預設會記錄，中斷後重新執行時從停下的地方繼續)")
+    parser.add_argument('--retries', type=int, help="檔案被鎖住等暫時性錯誤的重試次數")
+    parser.add_argument('--mirror', action='store_true', default=None,
+                        help="鏡像模式：同時刪除目標中來源已不存在的檔案 (不能與 --stream 併用)")
+    parser.add_argument('--prune-excluded', action='store_true', default=None,
+                        help="鏡像模式下連目標中被排除的檔案也一併刪除")
+    parser.add_argument('--output', choices=OUTPUT_MODES,
+                        help="輸出方式：folder 複製成資料夾，pack 寫入去重的封包庫，其餘寫成單一壓縮封存檔 "
+                             "(增量與硬連結不適用；zip 只以單執行緒壓縮，tar 格式可用滿多核心)")
+    parser.add_argument('--verify', action='store_true', default=None,
+                        help="複製時同時計算校驗碼並寫入目標資料夾 (只讀一次來源)")
+    parser.add_argument('--verify-backup', nargs='?', const='', default=None, metavar='PATH',
+                        help="不備份，依校驗碼平行檢查既有的備份 (不指定路徑時檢查設定的目標資料夾)")
+    parser.add_argument('--delta', action='store_true', default=None,
+                        help="差異傳輸：目標已有舊版本的大檔案只改寫內容不同的區塊 (門檻見設定檔 delta_file_mb)")
+    parser.add_argument('--watch', action='store_true',
+                        help="持續同步：完整同步一次後監看來源，只複製有變更的檔案 (一律寫到目標資料夾本身，不加時間戳記)")
+    parser.add_argument('--also', nargs='+', metavar='DIR',
+                        help="多目標備份：每個檔案只讀一次，同時也寫入這些資料夾 (只用於一般的資料夾備份)")
+    parser.add_argument('--pack-store', metavar='PATH',
+                        help="封包庫的位置 (預設為目標資料夾加上 .pack)")
+    parser.add_argument('--pack-list', action='store_true',
+                        help="不備份，列出封包庫的快照 (指定 --snapshot 或 --only 時列出快照中的檔案)")
+    parser.add_argument('--pack-extract', metavar='DIR', help="不備份，把封包庫快照中的檔案取出到指定資料夾")
+    parser.add_argument('--list-snapshots', action='store_true', help="不備份，列出目標資料夾旁可還原的時間戳記快照")
+    parser.add_argument('--restore', metavar='DIR',
+                        help="不備份，把快照中的檔案平行還原到指定資料夾 (大小與修改時間相同的檔案略過)")
+    parser.add_argument('--snapshot',
+                        help="封包庫或時間戳記快照的名稱 (預設為最新的快照；還原時也可以是備份資料夾的路徑)")
+    parser.add_argument('--only', nargs='+', metavar='PATH',
+                        help="只列出、取出或還原這些檔案或資料夾 (相對路徑；還原時也可以是 gitignore 格式的萬用字元)")
+    parser.add_argument('--debounce', type=float, help="持續同步時變動停止多少秒後才複製")
+    parser.add_argument('--poll', action='store_true', help="持續同步時不使用 inotify，改為定期掃描")
+    return parser
+
+
+def resolve_dest_dir(config):
+    """實際的目標資料夾：續傳開啟時沿用留有未完成日誌的最新時間戳記快照"""
+    if config['append_timestamp'] and config['resume_journal'] and config['output_mode'] == OUTPUT_FOLDER:
+        unfinished = find_unfinished_snapshot(config['dest_dir'])
+        if unfinished:
+            return unfinished
+    return get_actual_dest_dir(config['dest_dir'], config['append_timestamp'])
+
+
+def resolve_link_dest(config, dest_dir, link_dest=None):
+    """決定快照硬連結的來源：明確指定的路徑，或 'auto'/設定檔開啟時使用最新的快照
+
+    加上時間戳記的增量備份每次都寫入新的資料夾，一律以硬連結共用未變更的檔案，
+    讓每個快照都是完整的 (多目標備份不支援硬連結，改為每次完整複製)。
+    """
+    if link_dest and link_dest != 'auto':
+        return link_dest
+    implied = config['incremental'] and not config['extra_dest_dirs']
+    if link_dest == 'auto' or (config['append_timestamp'] and (config['snapshot_links'] or implied)):
+        return find_previous_snapshot(config['dest_dir'], dest_dir)
+    return None
+
+
+def resolve_extra_dest_dirs(config, source_dir, dest_dir):
+    """多目標備份的其他目標資料夾 (加上與主要目標相同的時間戳記)，並檢查路徑"""
+    extra_dirs = get_extra_dest_dirs(config['extra_dest_dirs'], config['dest_dir'], dest_dir)
+    for extra_dir in extra_dirs:
+        validate_paths(source_dir, extra_dir)
+    if len({os.path.normcase(os.path.abspath(d)) for d in [dest_dir] + extra_dirs}) != len(extra_dirs) + 1:
+        raise ValueError("多目標備份的目標資料夾不能重複")
+    return extra_dirs
+
+
+def check_single_dest(config, mode):
+    """多目標備份只支援一般的資料夾備份"""
+    if config['extra_dest_dirs']:
+        raise ValueError(f"多目標備份只支援一般的資料夾備份，不能用於{mode}")
+
+
+def check_fanout_options(config, link_dest):
+    """多目標備份無法套用的選項開啟時直接拒絕，而不是默默忽略"""
+    options = unsupported_options(config['copy_method'], link_dest, config['delta_transfer'])
+    if options:
+        raise ValueError(f"多目標備份不能與{'、'.join(options)}同時使用")
+
+
+def fanout_stats(result):
+    """多目標備份各目標的結果"""
+    return [{
+        'dest': dest_dir,
+        'copied': copy_result.copied_count,
+        'failed': [{'path': path, 'error': str(error)} for path, error in copy_result.failed_files],
+        'stats': copy_result.stats.snapshot(),
+    } for dest_dir, copy_result in zip(result.dest_dirs, result.results)]
+
+
+def delta_threshold(config):
+    """差異傳輸的大小門檻 (位元組)，未開啟時為 None"""
+    return config['delta_file_mb'] * 1024 * 1024 if config['delta_transfer'] else None
+
+
+def archive_stats(result):
+    """封存輸出的額外統計資料"""
+    return {
+        'archive': result.archive_path,
+        'bytes_read': result.bytes_read,
+        'bytes_written': result.bytes_written,
+    }
+
+
+def pack_stats(result):
+    """封包庫輸出的額外統計資料"""
+    return {
+        'pack_store': result.store_dir,
+        'snapshot': result.snapshot,
+        'bytes_read': result.bytes_read,
+        'bytes_written': result.bytes_written,
+        'deduplicated': result.deduplicated_count,
+        'reused': result.reused_count,
+    }
+
+
+def output_path(config, dest_dir):
+    """實際寫入的位置：資料夾、封存檔或封包庫 (封包庫不加時間戳記，所有快照共用)"""
+    output_mode = config['output_mode']
+    if output_mode == OUTPUT_PACK:
+        return pack_store_path(config['dest_dir'])
+    return dest_dir if output_mode == OUTPUT_FOLDER else archive_path_for(dest_dir, output_mode)
+
+
+def open_scan_cache(config):
+    """設定了掃描快取檔案時讀取快取，否則回傳 None (命令列每次都是新的程序，只有磁碟快取有意義)"""
+    if not config['scan_cache_file']:
+        return None
+    return ScanCache.load(config['scan_cache_file'], config['source_dir'])
+
+
+def close_scan_cache(config, cache):
+    """掃描結束後把快取寫回磁碟"""
+    if cache is not None:
+        try:
+            cache.save(config['scan_cache_file'])
+        except OSError as e:
+            print(f"儲存掃描快取 {config['scan_cache_file']} 時發生錯誤: {e}", file=sys.stderr)
+
+
+def write_run_stats(config, stats, info):
+    """將執行統計寫入 stats_dir (未設定時不寫入)，回傳檔案路徑或 None"""
+    if not config['stats_dir']:
+        return None
+    try:
+        return save_run_stats(config['stats_dir'], stats, info)
+    except OSError as e:
+        print(f"儲存執行統計到 {config['stats_dir']} 時發生錯誤: {e}", file=sys.stderr)
+        return None
+
+
+def add_run_stats(config, stats, run_stats):
+    """把執行統計加進輸出並寫入統計檔"""
+    stats['stats'] = run_stats.snapshot()
+    info = {key: stats[key] for key in ('source', 'dest', 'mode', 'incremental', 'mirror', 'stream') if key in stats}
+    info['copy_methods'] = stats.get('copy_methods', {})
+    info['failed_count'] = len(stats['failed'])
+    stats['stats_file'] = write_run_stats(config, run_stats, info)
+
+
+def run_stream_archive(config, full=False):
+    """以串流模式直接寫出封存檔並回傳統計資料"""
+    check_single_dest(config, "串流備份")
+    source_dir = config['source_dir']
+    fmt = config['output_mode']
+    archive_path = output_path(config, get_actual_dest_dir(config['dest_dir'], config['append_timestamp']))
+    validate_paths(source_dir, archive_path)
+
+    rules = None if full else make_exclusion_rules(config)
+    started = time.perf_counter()
+    if fmt == OUTPUT_PACK:
+        result = pack_tree(source_dir, archive_path, rules, workers=config['copy_workers'],
+                           scan_workers=config['scan_workers'])
+    else:
+        result = archive_tree(source_dir, archive_path, fmt, rules, workers=config['copy_workers'],
+                              scan_workers=config['scan_workers'], level=config['archive_level'])
+    stats = {
+        'source': source_dir,
+        'dest': archive_path,
+        'mode': 'full' if full else 'selective',
+        'output': fmt,
+        'stream': True,
+        'files_to_copy': result.copied_count + len(result.failed_files),
+        'copied': result.copied_count,
+        'failed': [{'path': path, 'error': str(error)} for path, error in result.failed_files],
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+    stats.update(pack_stats(result) if fmt == OUTPUT_PACK else archive_stats(result))
+    return stats
+
+
+def run_stream_backup(config, full=False, link_dest=None):
+    """以串流模式執行一次備份並回傳統計資料"""
+    check_single_dest(config, "串流備份")
+    if config['output_mode'] != OUTPUT_FOLDER:
+        return run_stream_archive(config, full)
+    source_dir = config['source_dir']
+    dest_dir = resolve_dest_dir(config)
+    validate_paths(source_dir, dest_dir)
+
+    rules = None if full else make_exclusion_rules(config)
+    incremental = config['incremental']
+
+    link_dest = resolve_link_dest(config, dest_dir, link_dest)
+
+    cache = open_scan_cache(config)
+    started = time.perf_counter()
+    result = stream_backup(source_dir, dest_dir, rules, workers=config['copy_workers'],
+                           scan_workers=config['scan_workers'], incremental=incremental,
+                           use_hash=incremental and config['manifest_hash'], link_dest=link_dest,
+                           method=config['copy_method'], buffer_size=config['copy_buffer_size'],
+                           cache=cache, resume=config['resume_journal'], retries=config['copy_retries'],
+                           retry_delay=config['retry_delay'], verify=config['verify'],
+                           large_file_threshold=config['large_file_mb'] * 1024 * 1024,
+                           delta_threshold=delta_threshold(config))
+    close_scan_cache(config, cache)
+    stats = {
+        'source': source_dir,
+        'dest': dest_dir,
+        'mode': 'full' if full else 'selective',
+        'incremental': incremental,
+        'stream': True,
+        'files_to_copy': result.total_files,
+        'bytes_to_copy': result.total_bytes,
+        'unchanged': result.unchanged_count,
+        'copied': result.copied_count,
+        'linked': result.linked_count,
+        'resumed': result.resumed_count,
+        'retried': result.retried_count,
+        'link_dest': link_dest,
+        'verify': config['verify'],
+        'copy_methods': result.methods,
+        'failed': [{'path': path, 'error': str(error)} for path, error in result.failed_files],
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+    add_run_stats(config, stats, result.stats)
+    return stats
+
+
+def run_mirror_backup(config, full=False, dry_run=False):
+    """以鏡像模式執行一次同步並回傳統計資料"""
+    check_single_dest(config, "鏡像模式")
+    source_dir = config['source_dir']
+    dest_dir = resolve_dest_dir(config)
+    validate_paths(source_dir, dest_dir)
+
+    rules = None if full else make_exclusion_rules(config)
+    cache = open_scan_cache(config)
+    started = time.perf_counter()
+    plan = plan_mirror(source_dir, dest_dir, rules, workers=config['scan_workers'],
+                       prune_excluded=config['mirror_prune_excluded'], cache=cache,
+                       memory_budget=config['plan_memory_mb'] * 1024 * 1024)
+    scanned = time.perf_counter()
+    close_scan_cache(config, cache)
+
+    stats = {
+        'source': source_dir,
+        'dest': dest_dir,
+        'mode': 'full' if full else 'selective',
+        'mirror': True,
+        'files_to_copy': plan.total_files,
+        'files_to_update': plan.update_count,
+        'bytes_to_copy': plan.total_bytes,
+        'files_to_delete': plan.delete_count,
+        'bytes_to_delete': plan.delete_bytes,
+        'dirs_to_delete': len(plan.stale_dirs),
+        'unchanged': plan.unchanged_count,
+        'copied': 0,
+        'deleted': 0,
+        'removed_dirs': 0,
+        'resumed': 0,
+        'retried': 0,
+        'copy_methods': {},
+        'failed': [],
+        'scan_seconds': round(scanned - started, 3),
+        'copy_seconds': 0.0,
+    }
+    if dry_run or not (plan.files or plan.has_deletes):
+        return stats
+
+    result = run_mirror(plan, workers=config['copy_workers'], method=config['copy_method'],
+                        buffer_size=config['copy_buffer_size'], resume=config['resume_journal'],
+                        retries=config['copy_retries'], retry_delay=config['retry_delay'],
+                        verify=config['verify'], large_file_threshold=config['large_file_mb'] * 1024 * 1024,
+                        delta_threshold=delta_threshold(config))
+    stats['copied'] = result.copied_count
+    stats['deleted'] = result.deleted_count
+    stats['removed_dirs'] = result.removed_dirs
+    stats['resumed'] = result.resumed_count
+    stats['retried'] = result.retried_count
+    stats['copy_methods'] = result.methods
+    stats['failed'] = [{'path': path, 'error': str(error)} for path, error in result.failed_files]
+    stats['copy_seconds'] = round(time.perf_counter() - scanned, 3)
+    add_run_stats(config, stats, result.stats)
+    return stats
+
+
+def run_backup(config, full=False, dry_run=False, link_dest=None):
+    """依設定執行一次備份並回傳統計資料 (dict，可直接輸出為 JSON)"""
+    source_dir = config['source_dir']
+    dest_dir = resolve_dest_dir(config)
+    output_mode = config['output_mode']
+    archive_mode = output_mode != OUTPUT_FOLDER
+    validate_paths(source_dir, output_path(config, dest_dir))
+    if archive_mode:
+        check_single_dest(config, "封存檔或封包庫輸出")
+    extra_dirs = resolve_extra_dest_dirs(config, source_dir, dest_dir) if not archive_mode else []
+    link_dest = resolve_link_dest(config, dest_dir, link_dest) if not archive_mode else None
+    if extra_dirs:
+        check_fanout_options(config, link_dest)
+
+    rules = None if full else make_exclusion_rules(config)
+    incremental = config['incremental'] and not archive_mode  # 封存檔每次都包含完整內容
+    use_hash = incremental and config['manifest_hash']
+
+    cache = open_scan_cache(config)
+    started = time.perf_counter()
+    scan = scan_files(source_dir, dest_dir, rules, incremental=incremental, use_hash=use_hash,
+                      workers=config['scan_workers'], cache=cache, memory_budget=config['plan_memory_mb'] * 1024 * 1024)
+    scanned = time.perf_counter()
+    close_scan_cache(config, cache)
+
+    stats = {
+        'source': source_dir,
+        'dest': dest_dir,
+        'extra_dests': extra_dirs,
+        'mode': 'full' if full else 'selective',
+        'incremental': incremental,
+        'output': output_mode,
+        'files_to_copy': scan.total_files,
+        'bytes_to_copy': scan.total_bytes,
+        'unchanged': scan.unchanged_count,
+        'copied': 0,
+        'linked': 0,
+        'resumed': 0,
+        'retried': 0,
+        'link_dest': None,
+        'verify': config['verify'] and not archive_mode,
+        'copy_methods': {},
+        'failed': [],
+        'scan_seconds': round(scanned - started, 3),
+        'scan_cache_hits': cache.hits if cache is not None else None,
+        'copy_seconds': 0.0,
+    }
+    if dry_run or not scan.files:
+        return stats
+
+    if output_mode == OUTPUT_PACK:
+        result = pack_scan(scan, output_path(config, dest_dir), workers=config['copy_workers'])
+        stats['dest'] = result.store_dir
+        stats['copied'] = result.copied_count
+        stats['failed'] = [{'path': path, 'error': str(error)} for path, error in result.failed_files]
+        stats['copy_seconds'] = round(time.perf_counter() - scanned, 3)
+        stats.update(pack_stats(result))
+        return stats
+    if archive_mode:
+        result = archive_scan(scan, output_mode, workers=config['copy_workers'], level=config['archive_level'])
+        stats['dest'] = result.archive_path
+        stats['copied'] = result.copied_count
+        stats['failed'] = [{'path': path, 'error': str(error)} for path, error in result.failed_files]
+        stats['copy_seconds'] = round(time.perf_counter() - scanned, 3)
+        stats.update(archive_stats(result))
+        return stats
+
+    if extra_dirs:
+        result = fanout_copy(scan, extra_dirs, workers=config['copy_workers'], use_hash=use_hash,
+                             buffer_size=config['copy_buffer_size'], retries=config['copy_retries'],
+                             retry_delay=config['retry_delay'], max_lag=config['fanout_lag_mb'] * 1024 * 1024,
+                             resume=config['resume_journal'], verify=config['verify'])
+        stats['copied'] = result.copied_count
+        stats['resumed'] = result.resumed_count
+        stats['retried'] = result.retried_count
+        stats['copy_methods'] = result.results[0].methods
+        stats['failed'] = [{'path': path, 'error': str(error)} for path, error in result.failed_files]
+        stats['copy_seconds'] = round(time.perf_counter() - scanned, 3)
+        stats['bytes_read'] = result.bytes_read
+        stats['destinations'] = fanout_stats(result)
+        add_run_stats(config, stats, result.results[0].stats)
+        return stats
+
+    result = copy_files(scan, workers=config['copy_workers'], use_hash=use_hash, link_dest=link_dest,
+                        method=config['copy_method'], buffer_size=config['copy_buffer_size'],
+                        resume=config['resume_journal'], retries=config['copy_retries'],
+                        retry_delay=config['retry_delay'], verify=config['verify'],
+                        large_file_threshold=config['large_file_mb'] * 1024 * 1024,
+                        delta_threshold=delta_threshold(config))
+    stats['copied'] = result.copied_count
+    stats['linked'] = result.linked_count
+    stats['resumed'] = result.resumed_count
+    stats['retried'] = result.retried_count
+    stats['link_dest'] = link_dest
+    stats['copy_methods'] = result.methods
+    stats['failed'] = [{'path': path, 'error': str(error)} for path, error in result.failed_files]
+    stats['copy_seconds'] = round(time.perf_counter() - scanned, 3)
+    add_run_stats(config, stats, result.stats)
+    return stats
+
+
+def run_verify(config, path=''):
+    """依校驗碼檢查既有的備份並回傳統計資料 (未指定路徑時檢查目標資料夾，時間戳記模式為最新的快照)"""
+    if not path:
+        snapshots = list_snapshots(config['dest_dir']) if config['append_timestamp'] else []
+        path = snapshots[-1][1] if snapshots else config['dest_dir']
+    started = time.perf_counter()
+    result = verify_backup(path, workers=config['copy_workers'])
+    return {
+        'dest': path,
+        'algorithm': result.algorithm,
+        'checked': result.checked_count,
+        'ok': result.ok_count,
+        'bytes_checked': result.bytes_checked,
+        'mismatched': [{'path': key, 'reason': reason} for key, reason in result.mismatched],
+        'missing': result.missing,
+        'failed': [{'path': key, 'error': str(error)} for key, error in result.errors],
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def run_pack_list(config, store_dir=None, snapshot=None, only=None):
+    """列出封包庫的快照，或 (指定快照或路徑時) 快照中的檔案"""
+    store_dir = store_dir or pack_store_path(config['dest_dir'])
+    with PackStore(store_dir) as store:
+        if snapshot is None and only is None:
+            return {
+                'pack_store': store_dir,
+                'snapshots': [{'name': s.name, 'created': s.created, 'source': s.source,
+                               'files': s.file_count, 'bytes': s.total_bytes} for s in store.snapshots()],
+            }
+        entries = store.files(snapshot, only)
+        return {
+            'pack_store': store_dir,
+            'snapshot': snapshot or store.snapshots()[-1].name,
+            'files': [{'path': entry.path, 'size': entry.size, 'mtime_ns': entry.mtime_ns,
+                       'mode': oct(entry.mode), 'hash': entry.hash.hex()} for entry in entries],
+        }
+
+
+def run_pack_extract(config, dest_dir, store_dir=None, snapshot=None, only=None):
+    """從封包庫的快照平行取出檔案並回傳統計資料"""
+    store_dir = store_dir or pack_store_path(config['dest_dir'])
+    started = time.perf_counter()
+    with PackStore(store_dir) as store:
+        result = store.extract(dest_dir, snapshot, only, workers=config['copy_workers'])
+        snapshot = snapshot or store.snapshots()[-1].name
+    return {
+        'pack_store': store_dir,
+        'snapshot': snapshot,
+        'dest': dest_dir,
+        'extracted': result.copied_count,
+        'failed': [{'path': path, 'error': str(error)} for path, error in result.failed_files],
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def run_list_snapshots(config):
+    """列出目標資料夾旁可還原的備份"""
+    return {
+        'dest': config['dest_dir'],
+        'snapshots': [{'name': name or os.path.basename(path), 'path': path, 'timestamped': bool(name)}
+                      for name, path in list_restore_points(config['dest_dir'])],
+    }
+
+
+def run_restore(config, target_dir, snapshot=None, only=None, dry_run=False):
+    """從快照平行還原選取的檔案並回傳統計資料 (目標中大小與修改時間相同的檔案略過)"""
+    backup_dir = find_restore_point(config['dest_dir'], snapshot)
+    started = time.perf_counter()
+    plan = plan_restore(backup_dir, target_dir, only, workers=config['scan_workers'],
+                        memory_budget=config['plan_memory_mb'] * 1024 * 1024)
+    scanned = time.perf_counter()
+    stats = {
+        'source': backup_dir,
+        'dest': target_dir,
+        'mode': 'restore',
+        'only': only or [],
+        'files_to_restore': plan.total_files,
+        'bytes_to_restore': plan.total_bytes,
+        'unchanged': plan.unchanged_count,
+        'restored': 0,
+        'retried': 0,
+        'copy_methods': {},
+        'failed': [],
+        'scan_seconds': round(scanned - started, 3),
+        'copy_seconds': 0.0,
+    }
+    if dry_run or not plan.files:
+        return stats
+
+    result = copy_files(plan, workers=config['copy_workers'], method=config['copy_method'],
+                        buffer_size=config['copy_buffer_size'], retries=config['copy_retries'],
+                        retry_delay=config['retry_delay'], large_file_threshold=config['large_file_mb'] * 1024 * 1024,
+                        delta_threshold=delta_threshold(config))
+    stats['restored'] = result.copied_count
+    stats['retried'] = result.retried_count
+    stats['copy_methods'] = result.methods
+    stats['failed'] = [{'path': path, 'error': str(error)} for path, error in result.failed_files]
+    stats['copy_seconds'] = round(time.perf_counter() - scanned, 3)
+    add_run_stats(config, stats, result.stats)
+    return stats
+
+
+def format_sync(sync):
+    """持續同步一輪的輸出內容"""
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'full': sync.full,
+        'changed': sync.changed,
+        'copied': sync.copied_count,
+        'deleted': sync.deleted_count,
+        'copy_methods': sync.methods,
+        'failed': [{'path': path, 'error': str(error)} for path, error in sync.failed_files],
+        'elapsed_seconds': round(sync.seconds, 3),
+    }
+
+
+def run_watch(config, full=False, use_inotify=True, stop_event=None):
+    """持續同步到目標資料夾，每一輪輸出一行 JSON；按 Ctrl+C 或 stop_event 被設定時結束"""
+    source_dir = config['source_dir']
+    dest_dir = config['dest_dir']
+    validate_paths(source_dir, dest_dir)
+    if config['output_mode'] != OUTPUT_FOLDER:
+        raise ValueError("持續同步只能輸出到資料夾")
+    check_single_dest(config, "持續同步")
+
+    def on_sync(sync):
+        print(json.dumps(format_sync(sync), ensure_ascii=False), flush=True)
+
+    try:
+        watch_backup(source_dir, dest_dir, None if full else make_exclusion_rules(config),
+                     workers=config['copy_workers'], scan_workers=config['scan_workers'], mirror=config['mirror'],
+                     prune_excluded=config['mirror_prune_excluded'], method=config['copy_method'],
+                     buffer_size=config['copy_buffer_size'], retries=config['copy_retries'],
+                     retry_delay=config['retry_delay'], verify=config['verify'],
+                     large_file_threshold=config['large_file_mb'] * 1024 * 1024,
+                     delta_threshold=delta_threshold(config), debounce=config['watch_debounce'],
+                     use_inotify=use_inotify, poll_interval=config['watch_poll_interval'],
+                     stop_event=stop_event or threading.Event(), on_sync=on_sync)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    """命令列主程式，回傳結束代碼"""
+    args = build_parser().parse_args(argv)
+    config = load_config(args.config)
+    # 命令列參數優先於設定檔
+    if args.source is not None:
+        config['source_dir'] = args.source
+    if args.dest is not None:
+        config['dest_dir'] = args.dest
+    if args.timestamp is not None:
+        config['append_timestamp'] = args.timestamp
+    if args.jobs is not None:
+        config['copy_workers'] = clamp_workers(args.jobs)
+    if args.copy_method is not None:
+        config['copy_method'] = args.copy_method
+    if args.incremental is not None:
+        config['incremental'] = args.incremental
+    if args.hash is not None:
+        config['manifest_hash'] = args.hash
+    if args.resume is not None:
+        config['resume_journal'] = args.resume
+    if args.retries is not None:
+        config['copy_retries'] = max(0, args.retries)
+    if args.output is not None:
+        config['output_mode'] = args.output
+    if args.mirror is not None:
+        config['mirror'] = args.mirror
+    if args.prune_excluded is not None:
+        config['mirror_prune_excluded'] = args.prune_excluded
+    if args.verify is not None:
+        config['verify'] = args.verify
+    if args.delta is not None:
+        config['delta_transfer'] = args.delta
+    if args.also is not None:
+        config['extra_dest_dirs'] = args.also
+    if args.debounce is not None:
+        config['watch_debounce'] = max(0.0, args.debounce)
+
+    try:
+        if args.verify_backup is not None:
+            stats = run_verify(config, args.verify_backup)
+            print(json.dumps(stats, ensure_ascii=False, indent=2))
+            return 1 if stats['failed'] or stats['mismatched'] or stats['missing'] else 0
+        if args.pack_list:
+            print(json.dumps(run_pack_list(config, args.pack_store, args.snapshot, args.only),
+                             ensure_ascii=False, indent=2))
+            return 0
+        if args.pack_extract:
+            stats = run_pack_extract(config, args.pack_extract, args.pack_store, args.snapshot, args.only)
+            print(json.dumps(stats, ensure_ascii=False, indent=2))
+            return 1 if stats['failed'] else 0
+        if args.list_snapshots:
+            print(json.dumps(run_list_snapshots(config), ensure_ascii=False, indent=2))
+            return 0
+        if args.restore:
+            stats = run_restore(config, args.restore, args.snapshot, args.only, dry_run=args.dry_run)
+            print(json.dumps(stats, ensure_ascii=False, indent=2))
+            return 1 if stats['failed'] else 0
+        if args.watch:
+            run_watch(config, full=args.full, use_inotify=not args.poll)
+            return 0
+        mirror = config['mirror'] and config['output_mode'] == OUTPUT_FOLDER
+        if args.stream and (args.dry_run or mirror):
+            raise ValueError(f"串流模式不能與{'預覽 (--dry-run)' if args.dry_run else '鏡像模式'}同時使用")
+        if mirror:
+            stats = run_mirror_backup(config, full=args.full, dry_run=args.dry_run)
+        elif args.stream:
+            stats = run_stream_backup(config, full=args.full, link_dest=args.link_dest)
+        else:
+            stats = run_backup(config, full=args.full, dry_run=args.dry_run, link_dest=args.link_dest)
+    except ValueError as e:
+        print(json.dumps({'error': str(e)}, ensure_ascii=False), file=sys.stderr)
+        return 2
+
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 1 if stats['failed'] else 0
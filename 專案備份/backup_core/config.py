@@ -0,0 +1,173 @@
+"""設定檔讀寫與目標路徑計算 (不依賴 tkinter)"""
+import datetime
+import json
+import os
+
+from .fastcopy import COPY_METHODS, DEFAULT_BUFFER_SIZE, DEFAULT_COPY_METHOD
+
+# 設定檔名稱
+CONFIG_FILE = "config.json"
+
+# 預設排除規則 - 如果設定檔沒有會用這些
+DEFAULT_EXCLUDED_FOLDERS_EXACT = {".git", "node_modules"}
+DEFAULT_EXCLUDED_FOLDERS_PREFIX = {"firebase-export-"}
+# 預設複製執行緒數 (小檔案多時平行複製才能用滿 SSD / 網路磁碟的頻寬)
+DEFAULT_COPY_WORKERS = 8
+MAX_COPY_WORKERS = 64
+# 預設掃描執行緒數 (同時讀取多個資料夾，網路磁碟或冷快取時效果最明顯)
+DEFAULT_SCAN_WORKERS = 4
+
+
+def clamp_workers(value, default=DEFAULT_COPY_WORKERS):
+    """將執行緒數限制在 1 ~ MAX_COPY_WORKERS 之間 (無效值使用預設值)"""
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        workers = default
+    return max(1, min(MAX_COPY_WORKERS, workers))
+
+
+def default_config():
+    """回傳所有設定項目的預設值"""
+    return {
+        'source_dir': '',
+        'dest_dir': '',
+        'excluded_exact': sorted(DEFAULT_EXCLUDED_FOLDERS_EXACT),
+        'excluded_prefix': sorted(DEFAULT_EXCLUDED_FOLDERS_PREFIX),
+        'exclude_patterns': [],   # gitignore 格式的規則 (萬用字元、! 反向)
+        'use_gitignore': False,   # 是否套用專案內各層的 .gitignore
+        'copy_workers': DEFAULT_COPY_WORKERS,
+        'scan_workers': DEFAULT_SCAN_WORKERS,
+        'copy_method': DEFAULT_COPY_METHOD,     # auto / reflink / copy_file_range / sendfile / buffered / shutil
+        'copy_buffer_size': DEFAULT_BUFFER_SIZE,  # 一般讀寫時的緩衝區大小 (位元組)
+        'append_timestamp': False,
+        'incremental': False,
+        'manifest_hash': False,
+        'snapshot_links': False,
+        'output_mode': 'folder',  # folder / tar.gz / tar.xz / tar.zst / zip / pack
+        'archive_level': None,    # 壓縮等級 (None 使用各格式的預設值)
+        'scan_cache_file': '',    # 掃描快取的檔案路徑 (空白時只保存在記憶體中)
+        'mirror': False,          # 鏡像模式：刪除目標中來源已不存在的檔案
+        'mirror_prune_excluded': False,  # 鏡像模式下是否也刪除目標中被排除的檔案
+        'resume_journal': True,   # 在目標資料夾記錄複製日誌，中斷後可從停下的地方繼續
+        'copy_retries': 3,        # 檔案被鎖住等暫時性錯誤的重試次數
+        'retry_delay': 1.0,       # 第一次重試前等待的秒數 (之後每次遞增)
+        'verify': False,          # 複製時同時計算校驗碼，之後可驗證備份是否完整
+        'stats_dir': '',          # 每次執行的統計 (速度、各階段耗時) 寫入的資料夾 (空白時不寫入)
+        'plan_memory_mb': 512,    # 檔案清單在記憶體中的上限 (MB)，超過時改寫到暫存檔
+        'large_file_mb': 256,     # 超過這個大小 (MB) 的檔案分段平行複製 (0 為停用)
+        'delta_transfer': False,  # 差異傳輸：目標已有舊版本的大檔案只改寫內容不同的區塊
+        'delta_file_mb': 64,      # 差異傳輸只用在這個大小 (MB) 以上的檔案
+        'extra_dest_dirs': [],    # 多目標備份：每個檔案只讀一次，同時也寫入這些資料夾 (時間戳記與 dest_dir 相同)
+        'fanout_lag_mb': 256,     # 多目標備份：快的目標最多比慢的目標超前多少 MB
+        'watch_debounce': 2.0,    # 持續同步：變動停止多少秒後才複製
+        'watch_poll_interval': 5.0,  # 持續同步：無法使用 inotify 時重新掃描的間隔 (秒)
+    }
+
+
+def load_config(path=CONFIG_FILE):
+    """載入設定檔，缺少的項目以預設值補齊 (讀取失敗時回傳預設設定)"""
+    config = default_config()
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                config.update(loaded)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"讀取設定檔 {path} 時發生錯誤: {e}")
+        # 即使讀取失敗也繼續，使用預設值啟動
+    except Exception as e:
+        print(f"載入設定時發生未預期錯誤: {e}")
+    config['copy_workers'] = clamp_workers(config.get('copy_workers'))
+    config['scan_workers'] = clamp_workers(config.get('scan_workers'), DEFAULT_SCAN_WORKERS)
+    if config.get('copy_method') not in COPY_METHODS:
+        config['copy_method'] = DEFAULT_COPY_METHOD
+    try:
+        config['copy_buffer_size'] = max(4096, int(config.get('copy_buffer_size')))
+    except (TypeError, ValueError):
+        config['copy_buffer_size'] = DEFAULT_BUFFER_SIZE
+    try:
+        config['copy_retries'] = max(0, int(config.get('copy_retries')))
+    except (TypeError, ValueError):
+        config['copy_retries'] = 3
+    try:
+        config['retry_delay'] = max(0.0, float(config.get('retry_delay')))
+    except (TypeError, ValueError):
+        config['retry_delay'] = 1.0
+    try:
+        config['plan_memory_mb'] = max(1, int(config.get('plan_memory_mb')))
+    except (TypeError, ValueError):
+        config['plan_memory_mb'] = 512
+    try:
+        config['large_file_mb'] = max(0, int(config.get('large_file_mb')))
+    except (TypeError, ValueError):
+        config['large_file_mb'] = 256
+    try:
+        config['delta_file_mb'] = max(0, int(config.get('delta_file_mb')))
+    except (TypeError, ValueError):
+        config['delta_file_mb'] = 64
+    extra_dest_dirs = config.get('extra_dest_dirs')
+    if isinstance(extra_dest_dirs, str):
+        extra_dest_dirs = [extra_dest_dirs]
+    config['extra_dest_dirs'] = [d for d in extra_dest_dirs if isinstance(d, str) and d.strip()] \
+        if isinstance(extra_dest_dirs, list) else []
+    try:
+        config['fanout_lag_mb'] = max(1, int(config.get('fanout_lag_mb')))
+    except (TypeError, ValueError):
+        config['fanout_lag_mb'] = 256
+    try:
+        config['watch_debounce'] = max(0.0, float(config.get('watch_debounce')))
+    except (TypeError, ValueError):
+        config['watch_debounce'] = 2.0
+    try:
+        config['watch_poll_interval'] = max(0.5, float(config.get('watch_poll_interval')))
+    except (TypeError, ValueError):
+        config['watch_poll_interval'] = 5.0
+    from .archive import OUTPUT_MODES  # archive 會用到本模組的常數，延後匯入避免循環
+    if config.get('output_mode') not in OUTPUT_MODES:
+        config['output_mode'] = 'folder'
+    return config
+
+
+def save_config(config, path=CONFIG_FILE):
+    """儲存設定檔"""
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)
+    except IOError as e:
+        print(f"儲存設定檔 {path} 時發生錯誤: {e}")
+    except Exception as e:
+        print(f"儲存設定時發生未預期錯誤: {e}")
+
+
+def get_actual_dest_dir(base_dest_dir, append_timestamp=False, now=None):
+    """根據時間戳記開關獲取實際的目標資料夾路徑"""
+    if not base_dest_dir:
+        return None  # 如果基礎路徑未設定，返回 None
+
+    if not append_timestamp:
+        return base_dest_dir
+
+    timestamp = (now or datetime.datetime.now()).strftime("%Y%m%d_%H%M%S")
+    # 嘗試從基礎路徑分離檔名和副檔名（如果有的話），將時間戳加在名稱後面
+    base_name, ext = os.path.splitext(os.path.basename(base_dest_dir))
+    dir_name = os.path.dirname(base_dest_dir)
+    # 組合新的帶時間戳記的名稱
+    new_name = f"{base_name}_{timestamp}{ext}" if ext else f"{base_name}_{timestamp}"
+    return os.path.join(dir_name, new_name)
+
+
+def get_extra_dest_dirs(extra_dest_dirs, base_dest_dir, actual_dest_dir):
+    """多目標備份：其他目標資料夾加上與主要目標相同的時間戳記 (主要目標沒有時間戳記時原樣回傳)"""
+    if not actual_dest_dir or actual_dest_dir == base_dest_dir:
+        return list(extra_dest_dirs)
+    # 由基礎路徑與實際路徑的差異取出時間戳記部分 (例如 '_20240101_120000')
+    base_name, ext = os.path.splitext(os.path.basename(base_dest_dir))
+    actual_name = os.path.basename(actual_dest_dir)
+    stamp = actual_name[len(base_name):len(actual_name) - len(ext)]
+    extra_dirs = []
+    for extra_dir in extra_dest_dirs:
+        extra_name, extra_ext = os.path.splitext(os.path.basename(extra_dir))
+        extra_dirs.append(os.path.join(os.path.dirname(extra_dir), f"{extra_name}{stamp}{extra_ext}"))
+    return extra_dirs
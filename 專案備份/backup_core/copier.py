@@ -0,0 +1,513 @@
+"""以執行緒池平行複製檔案"""
+import errno
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
+
+from .checksum import DEFAULT_CHECKSUM_ALGORITHM, ChecksumRecorder
+from .config import DEFAULT_COPY_WORKERS, clamp_workers
+from .delta import delta_copy_file, delta_copy_part, open_delta
+from .dirtree import apply_directory_times, create_directories, plan_directories
+from .fastcopy import (CHUNKED_COPY_METHODS, DEFAULT_BUFFER_SIZE, DEFAULT_COPY_METHOD, close_chunked_copy,
+                       copy_file_fast, copy_file_part, open_chunked_copy)
+from .journal import CopyJournal
+from .manifest import hash_file, manifest_key, save_manifest
+from .stats import RunStats
+
+# 複製中的暫存檔副檔名：完成後才改名成目標檔名，中斷時不會留下看似完整的半個檔案
+PARTIAL_SUFFIX = ".backup-partial"
+# 暫時性錯誤 (檔案被其他程式鎖住等) 的重試次數與間隔 (秒，每次重試遞增)
+DEFAULT_RETRY_COUNT = 3
+DEFAULT_RETRY_DELAY = 1.0
+# 重試佇列上限：超過時直接記為失敗，避免大量失敗時無止盡地等待
+MAX_RETRY_QUEUE = 1000
+# 每個複製執行緒最多預先排入的工作數
+IN_FLIGHT_PER_WORKER = 64
+# 超過這個大小的檔案分成多段，由多個複製執行緒同時複製 (0 為停用)
+DEFAULT_LARGE_FILE_THRESHOLD = 256 * 1024 * 1024
+# 大檔案每一段的大小
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+# 暫時性的錯誤：Windows 的共用/鎖定違規 (32、33)，以及其他系統的忙碌狀態
+_TRANSIENT_WINERRORS = {32, 33}
+_TRANSIENT_ERRNOS = {errno.EBUSY, errno.EAGAIN, getattr(errno, 'ETXTBSY', errno.EBUSY)}
+
+
+@dataclass
+class CopyResult:
+    """一次複製的結果"""
+    copied_count: int = 0
+    linked_count: int = 0                              # 快照模式下以硬連結共用的檔案數 (也計入 copied_count)
+    failed_files: list = field(default_factory=list)   # [(來源路徑, 例外)]
+    methods: dict = field(default_factory=dict)        # {複製方式: 檔案數}，例如 {'reflink': 10, 'hardlink': 3}
+    resumed_count: int = 0                             # 續傳時依日誌略過的已完成檔案數
+    retried_count: int = 0                             # 暫時性錯誤重試後成功的檔案數
+    stats: RunStats = None                             # 位元組數、速度與各階段耗時
+
+    def record_method(self, method):
+        """記錄一個成功的檔案使用了哪種方式"""
+        self.copied_count += 1
+        self.methods[method] = self.methods.get(method, 0) + 1
+        if method == 'hardlink':
+            self.linked_count += 1
+
+    @property
+    def first_error(self):
+        return self.failed_files[0] if self.failed_files else None
+
+
+def is_transient_error(error):
+    """是否為稍後重試可能成功的錯誤 (例如檔案正被其他程式使用)"""
+    if not isinstance(error, OSError):
+        return False
+    return getattr(error, 'winerror', None) in _TRANSIENT_WINERRORS or error.errno in _TRANSIENT_ERRNOS
+
+
+def copy_file(src_path, dest_path, method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE, hasher=None,
+              stats=None, create_dirs=True):
+    """複製單一檔案 (含權限與時間)，必要時建立目標資料夾；回傳實際使用的複製方式
+
+    內容先寫到同一資料夾的暫存檔，完成後才改名成目標檔名。
+    指定 hasher 時複製的內容同時計算校驗碼 (見 fastcopy.copy_file_fast)。
+    create_dirs 為 False 表示呼叫端已建好目標資料夾 (見 dirtree.create_directories)。
+    """
+    if create_dirs:
+        # 確保目標路徑的目錄存在
+        started = time.perf_counter()
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        if stats is not None:
+            stats.add_time('mkdir', time.perf_counter() - started)
+    temp_path = dest_path + PARTIAL_SUFFIX
+    try:
+        used = copy_file_fast(src_path, temp_path, method, buffer_size, hasher, stats)
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return used
+
+
+def delta_or_copy(src_path, dest_path, method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE, hasher=None,
+                  stats=None, create_dirs=True):
+    """目標已有舊版本時只改寫內容不同的區塊 (回傳 'delta')，否則以暫存檔完整複製並回傳複製方式
+
+    改寫途中失敗時改為完整複製，目標不會停留在新舊內容混合的狀態。
+    """
+    try:
+        written = delta_copy_file(src_path, dest_path, hasher, stats)
+    except OSError:
+        written = None
+        if stats is not None:
+            stats.file_failed()  # 扣除改寫途中回報的進度，重新複製
+        if hasher is not None:
+            hasher.reset()
+    if written is None:
+        return copy_file(src_path, dest_path, method, buffer_size, hasher, stats, create_dirs)
+    return 'delta'
+
+
+def link_or_copy(src_path, dest_path, previous_path, method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE,
+                 hasher=None, stats=None, create_dirs=True):
+    """上一個快照中的檔案與來源相同時建立硬連結 (回傳 'hardlink')，否則複製並回傳複製方式"""
+    if _link_previous(src_path, dest_path, previous_path, create_dirs):
+        return 'hardlink'
+    return copy_file(src_path, dest_path, method, buffer_size, hasher, stats, create_dirs)
+
+
+def _link_previous(src_path, dest_path, previous_path, create_dirs=True):
+    """上一個快照中的檔案與來源相同時建立硬連結，回傳是否已連結 (否則呼叫端需要複製)"""
+    # 先移除目標上既有的檔案：若它是與舊快照共用的硬連結，直接覆寫會連帶改掉舊快照
+    try:
+        os.unlink(dest_path)
+    except FileNotFoundError:
+        pass
+
+    try:
+        src_stat = os.stat(src_path)
+        prev_stat = os.stat(previous_path)
+        if src_stat.st_size == prev_stat.st_size and src_stat.st_mtime_ns == prev_stat.st_mtime_ns:
+            if create_dirs:
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            os.link(previous_path, dest_path)
+            return True
+    except OSError:
+        pass  # 舊快照沒有這個檔案、跨磁碟或檔案系統不支援硬連結時改為複製
+    return False
+
+
+# ChunkedCopy.run 的回傳值：這個檔案還有其他段尚未完成
+CHUNK_PENDING = object()
+
+
+class ChunkedCopy:
+    """分段平行複製的一個大檔案
+
+    每一段是執行緒池中的一個獨立工作，與小檔案一起排程，所有執行緒到最後都有事做；
+    各段以指定位置讀寫同一對檔案描述子，空洞不寫入。第一個開始的段負責開檔
+    (可以 reflink 或與上一個快照共用硬連結時其餘段直接結束)，最後完成的段負責設定權限、
+    時間並改名成目標檔名。任何一段失敗時，由最後完成的段丟出第一個錯誤。
+    delta 為 True 時目標已有的舊版本直接改寫，各段只寫入不同的區塊 (見 delta.py)，
+    失敗時改以暫存檔完整複製。
+    """
+
+    def __init__(self, src_path, dest_path, size, method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE,
+                 chunk_size=DEFAULT_CHUNK_SIZE, previous_path=None, stats=None, create_dirs=True, delta=False):
+        self.src_path = src_path
+        self.dest_path = dest_path
+        self.size = size
+        self.method = method
+        self.buffer_size = max(4096, int(buffer_size))
+        self.chunk_size = chunk_size
+        self.chunk_count = max(1, -(-size // chunk_size))
+        self.previous_path = previous_path
+        self.stats = stats
+        self.create_dirs = create_dirs
+        self.delta = delta
+        self.used = 'chunked'
+        self.error = None
+        self.bytes_reported = 0
+        self.bytes_written = 0  # 差異傳輸時實際寫入的位元組數
+        self._temp_path = dest_path + PARTIAL_SUFFIX
+        self._fds = None     # (來源 fd, 目標 fd, 來源 stat)
+        self._started = None
+        self._done = False   # 已以 reflink 或硬連結完成，其餘段不需要複製
+        self._remaining = self.chunk_count
+        self._lock = threading.Lock()
+
+    def _open(self):
+        self._started = time.perf_counter()
+        if self.create_dirs:
+            os.makedirs(os.path.dirname(self.dest_path), exist_ok=True)
+        if self.previous_path and _link_previous(self.src_path, self.dest_path, self.previous_path, False):
+            self.used = 'hardlink'
+            self._done = True
+            return
+        if self.delta:
+            opened = open_delta(self.src_path, self.dest_path)
+            if opened is not None:
+                self._fds = opened
+                self.used = 'delta'
+                return
+        src_fd, dst_fd, st, reflinked = open_chunked_copy(self.src_path, self._temp_path, self.method)
+        self._fds = (src_fd, dst_fd, st)
+        if reflinked:
+            self.used = 'reflink'
+            self._done = True
+
+    def _report(self, count):
+        with self._lock:
+            self.bytes_reported += count
+        self.stats.add_chunk_bytes(count)
+
+    def run(self, index):
+        """複製第 index 段；最後完成的段收尾並回傳使用的方式，其餘回傳 CHUNK_PENDING"""
+        try:
+            with self._lock:
+                if self._started is None:
+                    self._open()
+            if self.error is None and not self._done:
+                src_fd, dst_fd, _ = self._fds
+                start = index * self.chunk_size
+                end = min(self.size, start + self.chunk_size)
+                report = self._report if self.stats is not None else None
+                started = time.perf_counter()
+                if self.used == 'delta':
+                    written = delta_copy_part(src_fd, dst_fd, start, end, report=report)
+                    with self._lock:
+                        self.bytes_written += written
+                else:
+                    copy_file_part(src_fd, dst_fd, start, end, self.method, self.buffer_size, report)
+                if self.stats is not None:
+                    self.stats.add_time('copy', time.perf_counter() - started)
+        except BaseException as e:
+            with self._lock:
+                if self.error is None:
+                    self.error = e
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining:
+                return CHUNK_PENDING
+        return self._finish()
+
+    def _finish(self):
+        started = time.perf_counter()
+        try:
+            if self._fds is not None:
+                src_fd, dst_fd, st = self._fds
+                self._fds = None
+                if self.error is not None:
+                    os.close(dst_fd)
+                    os.close(src_fd)
+                    if self.used != 'delta':
+                        raise self.error
+                    self._fallback()
+                elif self.used == 'delta':
+                    close_chunked_copy(src_fd, dst_fd, self.dest_path, st)
+                    if self.stats is not None:
+                        self.stats.delta_done(self.size, self.bytes_written)
+                else:
+                    close_chunked_copy(src_fd, dst_fd, self._temp_path, st)
+                    os.replace(self._temp_path, self.dest_path)
+            elif self.error is not None:
+                raise self.error
+        except BaseException:
+            try:
+                os.remove(self._temp_path)
+            except OSError:
+                pass
+            if self.stats is not None:
+                self.stats.file_failed(self.bytes_reported)
+            raise
+        if self.stats is not None and self.used == 'hardlink':
+            self.stats.skip(self.size)  # 沒有複製任何內容，不計入速度
+        elif self.stats is not None:
+            self.stats.add_time('metadata', time.perf_counter() - started)
+            self.stats.file_done(self.size, time.perf_counter() - (self._started or started), self.bytes_reported)
+        return self.used
+
+    def _fallback(self):
+        """差異傳輸途中失敗：扣除已回報的進度，改以暫存檔完整複製"""
+        if self.stats is not None:
+            self.stats.file_failed(self.bytes_reported)
+        self.bytes_reported = 0
+        self.used = copy_file(self.src_path, self.dest_path, self.method, self.buffer_size, create_dirs=False)
+
+
+def make_file_copier(method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE, link_dest=None, stats=None,
+                     create_dirs=True, delta_threshold=None):
+    """建立複製單一檔案的函式 copy(來源路徑, 目標路徑, 相對路徑, hasher=None, size=None)，回傳使用的方式
+
+    delta_threshold 不為 None 時，大小 (size) 達到門檻的檔案先嘗試差異傳輸 (快照硬連結模式不使用)。
+    """
+    if link_dest:
+        def copy(src_path, dest_path, relative_path, hasher=None, size=None):
+            return link_or_copy(src_path, dest_path, os.path.join(link_dest, relative_path), method, buffer_size,
+                                hasher, stats, create_dirs)
+    elif delta_threshold is not None:
+        def copy(src_path, dest_path, relative_path, hasher=None, size=None):
+            if size is not None and size >= delta_threshold:
+                return delta_or_copy(src_path, dest_path, method, buffer_size, hasher, stats, create_dirs)
+            return copy_file(src_path, dest_path, method, buffer_size, hasher, stats, create_dirs)
+    else:
+        def copy(src_path, dest_path, relative_path, hasher=None, size=None):
+            return copy_file(src_path, dest_path, method, buffer_size, hasher, stats, create_dirs)
+    return copy
+
+
+def retry_transient(items, attempt, retries=DEFAULT_RETRY_COUNT, retry_delay=DEFAULT_RETRY_DELAY):
+    """逐一重試因暫時性錯誤失敗的項目，每一輪前等待的時間遞增
+
+    attempt(項目) 成功時回傳結果、失敗時丟出例外；回傳 (成功 [(項目, 結果)], 失敗 [(項目, 例外)])。
+    """
+    succeeded = []
+    failed = []
+    pending = list(items)
+    for round_number in range(1, retries + 1):
+        if not pending:
+            break
+        time.sleep(retry_delay * round_number)
+        still_locked = []
+        for item in pending:
+            try:
+                succeeded.append((item, attempt(item)))
+            except Exception as e:
+                if is_transient_error(e) and round_number < retries:
+                    still_locked.append(item)
+                else:
+                    failed.append((item, e))
+        pending = still_locked
+    return succeeded, failed
+
+
+def copy_files(scan, workers=DEFAULT_COPY_WORKERS, use_hash=False, progress_callback=None, link_dest=None,
+               method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE, resume=False,
+               retries=DEFAULT_RETRY_COUNT, retry_delay=DEFAULT_RETRY_DELAY, verify=False,
+               checksum_algorithm=DEFAULT_CHECKSUM_ALGORITHM, stats=None,
+               large_file_threshold=DEFAULT_LARGE_FILE_THRESHOLD, chunk_size=DEFAULT_CHUNK_SIZE,
+               delta_threshold=None):
+    """依掃描結果平行複製檔案，單一檔案失敗不中斷整個工作
+
+    progress_callback(已完成數, 總數) 只會在協調執行緒中被呼叫，大約呼叫 100 次。
+    增量模式下，複製結束後會把成功的檔案寫回目標資料夾內的清單。
+    指定 link_dest (上一個快照) 時，未變更的檔案以硬連結共用而不複製。
+    method 為複製方式 (見 fastcopy.COPY_METHODS)，實際使用的方式統計在 CopyResult.methods。
+    resume 為 True 時在目標資料夾內記錄複製日誌，並略過先前中斷的工作中已完成的檔案。
+    檔案被鎖住等暫時性錯誤會在其他檔案完成後重試 retries 次。
+    verify 為 True 時複製的同時計算校驗碼，寫入目標資料夾供之後的 verify_backup 檢查。
+    stats (RunStats) 可由呼叫端傳入以便在複製途中讀取位元組進度與速度，未指定時自動建立；
+    結束後放在 CopyResult.stats。
+    目標資料夾在複製前一次建好，所有檔案寫完後再套用來源資料夾的修改時間。
+    大於 large_file_threshold 的檔案每 chunk_size 分成一段，與其他檔案一起平行複製
+    (計算校驗碼時需要依序讀取，不分段)。
+    delta_threshold 不為 None 時，目標已有舊版本且不小於這個大小的檔案只改寫內容不同的區塊
+    (見 delta.py；指定 link_dest 時不使用)，實際寫入的位元組數記在 stats。
+    """
+    files = scan.files  # 複製期間固定使用這份清單 (FilePlan)，依順序讀取，不需要隨機存取
+    file_count = len(files)
+    source_prefix, dest_prefix = files.source_prefix, files.dest_prefix
+    # 增量模式：複製完成後要寫回清單
+    incremental_entries = {k: list(v) for k, v in scan.manifest_entries.items()} if scan.incremental else None
+    result = CopyResult(stats=stats if stats is not None else RunStats.for_scan(scan))
+    stats = result.stats
+    copy = make_file_copier(method, buffer_size, link_dest, stats, create_dirs=False, delta_threshold=delta_threshold)
+    journal = CopyJournal(scan.dest_dir, scan.source_dir) if resume else None
+    resumable = journal is not None and len(journal) > 0
+    checksums = ChecksumRecorder(scan.dest_dir, checksum_algorithm, link_dest) if verify else None
+    worker_count = clamp_workers(workers)
+    # 分段複製：執行緒不只一個、複製方式支援指定位置讀寫且不需要依序計算校驗碼
+    chunk_threshold = (max(large_file_threshold, chunk_size) if large_file_threshold and worker_count > 1
+                       and checksums is None and method in CHUNKED_COPY_METHODS else None)
+
+    def copy_one(item):
+        """複製單一檔案 (在執行緒池中執行)，item 為 (相對路徑, 大小, mtime_ns)"""
+        relative_path, size, _ = item
+        src_path = source_prefix + relative_path
+        dest_path = dest_prefix + relative_path
+        started = time.perf_counter()
+        try:
+            if checksums is None:
+                used = copy(src_path, dest_path, relative_path, size=size)
+                digest = None
+            else:
+                hasher = checksums.hasher()
+                used = copy(src_path, dest_path, relative_path, hasher, size)
+                digest = checksums.record(relative_path, dest_path, hasher, used)
+        except BaseException:
+            stats.file_failed()
+            raise
+        if used == 'hardlink':
+            stats.skip(size)  # 沒有複製任何內容，不計入速度
+        else:
+            stats.file_done(size, time.perf_counter() - started)
+        record_hash(relative_path, src_path, digest)
+        return used
+
+    def copy_chunk(item, job, index):
+        """複製大檔案的一段 (在執行緒池中執行)，最後完成的段回傳使用的方式"""
+        used = job.run(index)
+        if used is not CHUNK_PENDING:
+            record_hash(item[0], job.src_path, None)
+        return used
+
+    def record_hash(relative_path, src_path, digest):
+        if incremental_entries is not None and use_hash:
+            # 校驗碼與清單同樣使用 blake2b 時直接沿用，不必再讀一次來源
+            reuse = digest is not None and checksum_algorithm == 'blake2b'
+            incremental_entries[manifest_key(relative_path)][2] = digest if reuse else hash_file(src_path)
+
+    def finish(item, used):
+        result.record_method(used)
+        if journal is not None:
+            journal.record(*item)
+
+    def fail(item, error):
+        result.failed_files.append((source_prefix + item[0], error))
+        if incremental_entries is not None:
+            # 失敗的檔案不寫入清單，下次會重新複製
+            incremental_entries.pop(manifest_key(item[0]), None)
+
+    # 更新進度不需要太頻繁，避免拖慢，大約更新100次或每個都更新（如果檔案少）
+    update_interval = max(1, file_count // 100)
+    done_count = 0
+    retry_queue = []
+
+    def report():
+        if progress_callback and (done_count % update_interval == 0 or done_count == file_count):
+            progress_callback(done_count, file_count)
+
+    def collect(future, item):
+        """處理一個完成的工作，回傳是否已有結果 (排入重試或大檔案還有其他段未完成時為 False)"""
+        error = future.exception()
+        if error is None:
+            used = future.result()
+            if used is CHUNK_PENDING:  # 大檔案還有其他段未完成
+                return False
+            finish(item, used)
+        elif retries > 0 and is_transient_error(error) and len(retry_queue) < MAX_RETRY_QUEUE:
+            retry_queue.append(item)  # 檔案被鎖住：其他檔案完成後再試
+            return False
+        else:
+            fail(item, error)
+        return True
+
+    # 先依深度建立所有目標資料夾，複製時不必每個檔案都檢查一次
+    started = time.perf_counter()
+    dir_levels = plan_directories(files.dirs)
+    create_directories(scan.dest_dir, dir_levels, worker_count)
+    stats.add_time('mkdir', time.perf_counter() - started)
+
+    if journal is not None:
+        journal.start()
+    try:
+        with ThreadPoolExecutor(max_workers=worker_count) as executor:
+            # 同時排入執行緒池的工作有上限，幾百萬個檔案時也不會一次建立幾百萬個 Future
+            max_in_flight = worker_count * IN_FLIGHT_PER_WORKER
+            in_flight = {}
+
+            def throttle():
+                """同時排入的工作達到上限時，等到有工作完成"""
+                nonlocal done_count
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if collect(future, in_flight.pop(future)):
+                            done_count += 1
+                            report()
+
+            for item in files.iter_entries():
+                # 續傳：日誌中已完成且來源未變更的檔案直接略過
+                if resumable and journal.is_done(source_prefix + item[0], item[0]):
+                    result.resumed_count += 1
+                    stats.skip(item[1])
+                    done_count += 1
+                    report()
+                    continue
+                if chunk_threshold is not None and item[1] > chunk_threshold:
+                    # 大檔案：每一段各自排入執行緒池
+                    relative_path = item[0]
+                    job = ChunkedCopy(source_prefix + relative_path, dest_prefix + relative_path, item[1], method,
+                                      buffer_size, chunk_size,
+                                      os.path.join(link_dest, relative_path) if link_dest else None, stats, False,
+                                      delta=not link_dest and delta_threshold is not None
+                                      and item[1] >= delta_threshold)
+                    for index in range(job.chunk_count):
+                        in_flight[executor.submit(copy_chunk, item, job, index)] = item
+                        throttle()
+                    continue
+                in_flight[executor.submit(copy_one, item)] = item
+                throttle()
+            for future in as_completed(in_flight):
+                if collect(future, in_flight[future]):
+                    done_count += 1
+                    report()
+
+        if retry_queue:
+            succeeded, failed = retry_transient(retry_queue, copy_one, retries, retry_delay)
+            for item, used in succeeded:
+                finish(item, used)
+            for item, error in failed:
+                fail(item, error)
+            result.retried_count = len(succeeded)
+            if progress_callback:
+                progress_callback(file_count, file_count)
+    finally:
+        # 中斷時也把已完成的部分寫入日誌，下次從這裡繼續
+        if journal is not None:
+            journal.close(finished=not result.failed_files and result.copied_count + result.resumed_count == file_count)
+        stats.finish()
+
+    # 清單只記錄已成功備份的檔案
+    if incremental_entries is not None:
+        save_manifest(scan.dest_dir, incremental_entries)
+    if checksums is not None:
+        checksums.save()
+    # 資料夾的時間最後才設定 (之後在資料夾內新增檔案會再改變它)
+    started = time.perf_counter()
+    apply_directory_times(scan.source_dir, scan.dest_dir, dir_levels, worker_count)
+    stats.add_time('metadata', time.perf_counter() - started)
+
+    return result
@@ -0,0 +1,118 @@
+"""差異傳輸：目標已有舊版本的大檔案只改寫內容不同的區塊
+
+附加寫入的記錄檔、只改了一部分的資料庫匯出檔，整個重新複製時要寫入完整的大小；
+這裡逐段讀取來源與目標的舊版本比較，相同的部分不寫入，不同的區塊直接寫回目標檔案的
+同一位置，最後調整長度並設定權限與時間。目標在本機 (或掛載的磁碟) 上，直接比較兩邊的
+內容比各自計算區塊校驗碼再比對更省事，讀取量相同。
+與其他路徑共用的目標 (硬連結) 不能直接改寫，此時回傳 None 由呼叫端改用一般複製。
+改寫中途失敗時目標的修改時間仍是舊的，下次比對時會被視為有變更而重新複製。
+"""
+import os
+import stat
+import time
+
+from .fastcopy import close_chunked_copy
+
+# 預設只對這個大小以上的檔案使用差異傳輸
+DEFAULT_DELTA_THRESHOLD = 64 * 1024 * 1024
+# 比較與寫入的最小單位
+DELTA_BLOCK_SIZE = 64 * 1024
+# 每次從兩個檔案讀取比較的大小 (整段相同時不必逐塊比較)
+DELTA_WINDOW_SIZE = 4 * 1024 * 1024
+
+
+def open_delta(src_path, dest_path):
+    """開啟來源與目標的舊版本，並把目標調整成來源的長度，回傳 (來源 fd, 目標 fd, 來源 stat)
+
+    目標不存在、是空檔案、不是一般檔案、與其他路徑共用 (硬連結) 或唯讀時回傳 None。
+    """
+    try:
+        dst_fd = os.open(dest_path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    except (FileNotFoundError, PermissionError, IsADirectoryError):
+        return None
+    try:
+        dest_stat = os.fstat(dst_fd)
+        if not stat.S_ISREG(dest_stat.st_mode) or dest_stat.st_nlink != 1 or not dest_stat.st_size:
+            os.close(dst_fd)
+            return None
+        src_fd = os.open(src_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            st = os.fstat(src_fd)
+            if dest_stat.st_size != st.st_size:
+                os.ftruncate(dst_fd, st.st_size)
+        except BaseException:
+            os.close(src_fd)
+            raise
+    except BaseException:
+        os.close(dst_fd)
+        raise
+    return src_fd, dst_fd, st
+
+
+def _write_changed(dst_fd, data, old, offset):
+    """把 data 中與 old 不同的區塊寫到目標的 offset，相鄰的區塊合併成一次寫入；回傳寫入的位元組數"""
+    view = memoryview(data)
+    written = 0
+    run_start = None
+    for block in range(0, len(data) + DELTA_BLOCK_SIZE, DELTA_BLOCK_SIZE):
+        changed = block < len(data) and data[block:block + DELTA_BLOCK_SIZE] != old[block:block + DELTA_BLOCK_SIZE]
+        if changed and run_start is None:
+            run_start = block
+        elif not changed and run_start is not None:
+            run_end = min(block, len(data))
+            position = run_start
+            while position < run_end:
+                position += os.pwrite(dst_fd, view[position:run_end], offset + position)
+            written += run_end - run_start
+            run_start = None
+    return written
+
+
+def delta_copy_part(src_fd, dst_fd, start, end, hasher=None, report=None):
+    """比較 [start, end) 的來源與目標，只把不同的區塊寫入目標，回傳實際寫入的位元組數
+
+    以指定位置讀寫，多個執行緒可同時處理同一對檔案描述子的不同段落。
+    hasher 不為 None 時讀到的來源內容同時送進 hasher.update (需依序處理整個檔案)。
+    report(位元組數) 在每比較完一段時呼叫 (以檔案大小計算進度)。
+    """
+    written = 0
+    offset = start
+    while offset < end:
+        data = os.pread(src_fd, min(end - offset, DELTA_WINDOW_SIZE), offset)
+        if not data:  # 檔案在複製途中變短
+            break
+        old = os.pread(dst_fd, len(data), offset)
+        if hasher is not None:
+            hasher.update(data)
+        if data != old:
+            written += _write_changed(dst_fd, data, old, offset)
+        offset += len(data)
+        if report is not None:
+            report(len(data))
+    return written
+
+
+def delta_copy_file(src_path, dest_path, hasher=None, stats=None):
+    """以差異傳輸更新目標檔案 (含權限與時間)，回傳實際寫入的位元組數；不能改寫目標時回傳 None
+
+    傳入 stats (stats.RunStats) 時以檔案大小回報進度，並記錄實際寫入的位元組數 (RunStats.delta_done)。
+    """
+    opened = open_delta(src_path, dest_path)
+    if opened is None:
+        return None
+    src_fd, dst_fd, st = opened
+    try:
+        started = time.perf_counter()
+        written = delta_copy_part(src_fd, dst_fd, 0, st.st_size, hasher,
+                                  stats.add_bytes if stats is not None else None)
+        copied = time.perf_counter()
+    except BaseException:
+        os.close(dst_fd)
+        os.close(src_fd)
+        raise
+    close_chunked_copy(src_fd, dst_fd, dest_path, st)
+    if stats is not None:
+        stats.add_time('copy', copied - started)
+        stats.add_time('metadata', time.perf_counter() - copied)
+        stats.delta_done(st.st_size, written)
+    return written
@@ -0,0 +1,107 @@
+"""目標資料夾結構：複製前一次建好所有資料夾，全部檔案完成後再套用資料夾的修改時間
+
+原本每個檔案複製前都呼叫一次 os.makedirs，同一個資料夾有幾千個檔案時就多了幾千次
+stat/mkdir。這裡由檔案清單推出不重複的資料夾，依深度逐層建立 (很寬的一層平行建立)，
+每個資料夾只建立一次。在資料夾中新增檔案會改變資料夾的修改時間，
+所以資料夾的時間要等所有檔案 (包含清單、校驗碼等工具自己的檔案) 都寫完後才設定。
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import DEFAULT_COPY_WORKERS, clamp_workers
+
+# 同一層的資料夾數達到這個數量時才平行處理 (太少時建立執行緒反而較慢)
+PARALLEL_DIR_THRESHOLD = 256
+# 平行處理時每個工作處理的資料夾數
+DIR_BATCH_SIZE = 64
+
+
+def plan_directories(relative_dirs):
+    """由檔案所在的資料夾推出所有需要的資料夾 (含中間層)，依深度分層回傳 [[第一層...], [第二層...], ...]
+
+    relative_dirs 為相對於來源資料夾的路徑，'' (來源資料夾本身) 不列入。
+    """
+    needed = set()
+    for directory in relative_dirs:
+        while directory and directory not in needed:
+            needed.add(directory)
+            directory = os.path.dirname(directory)
+    levels = {}
+    for directory in needed:
+        levels.setdefault(directory.count(os.sep), []).append(directory)
+    return [sorted(levels[depth]) for depth in sorted(levels)]
+
+
+def _run_batches(action, paths, executor):
+    """對每個路徑執行 action，回傳 [(路徑, 例外)]；路徑夠多時分批平行執行"""
+    def run(batch):
+        failed = []
+        for path in batch:
+            try:
+                action(path)
+            except OSError as e:
+                failed.append((path, e))
+        return failed
+
+    if executor is None or len(paths) < PARALLEL_DIR_THRESHOLD:
+        return run(paths)
+    batches = [paths[k:k + DIR_BATCH_SIZE] for k in range(0, len(paths), DIR_BATCH_SIZE)]
+    return [item for failed in executor.map(run, batches) for item in failed]
+
+
+def _mkdir(path):
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        pass
+
+
+def create_directories(dest_dir, levels, workers=DEFAULT_COPY_WORKERS):
+    """在 dest_dir 下依序建立每一層資料夾，回傳建立失敗的 [(路徑, 例外)]
+
+    上層已確定存在，每個資料夾只需要一次 mkdir；上層建立失敗時下層的檔案會在複製時失敗。
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    dest_prefix = os.path.join(dest_dir, '')
+    failed = []
+    with ThreadPoolExecutor(max_workers=clamp_workers(workers)) as executor:
+        for level in levels:
+            failed += _run_batches(_mkdir, [dest_prefix + directory for directory in level], executor)
+    return failed
+
+
+def apply_directory_times(source_dir, dest_dir, levels, workers=DEFAULT_COPY_WORKERS):
+    """將來源資料夾的存取與修改時間套用到目標的對應資料夾 (含目標資料夾本身)，回傳失敗的 [(路徑, 例外)]
+
+    必須在目標資料夾內的所有寫入 (包含刪除) 都完成後呼叫。
+    """
+    source_prefix = os.path.join(source_dir, '')
+    dest_prefix = os.path.join(dest_dir, '')
+
+    def copy_times(dest_path):
+        source_stat = os.stat(source_prefix + dest_path[len(dest_prefix):])
+        os.utime(dest_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=clamp_workers(workers)) as executor:
+        for level in reversed(levels):
+            failed += _run_batches(copy_times, [dest_prefix + directory for directory in level], executor)
+    return failed + _run_batches(copy_times, [dest_prefix], None)
+
+
+class DirectoryMaker:
+    """串流模式使用：掃描途中才知道有哪些資料夾，每個資料夾只在第一次遇到時建立 (可在多個執行緒中使用)"""
+
+    def __init__(self, dest_dir):
+        self.dest_prefix = os.path.join(dest_dir, '')
+        self.created = set()
+        self._lock = threading.Lock()
+
+    def ensure(self, relative_dir):
+        """確保目標中的資料夾存在 (相對路徑，'' 為目標資料夾本身)"""
+        if relative_dir in self.created:
+            return
+        os.makedirs(self.dest_prefix + relative_dir, exist_ok=True)
+        with self._lock:
+            self.created.add(relative_dir)
@@ -0,0 +1,178 @@
+"""gitignore 格式的排除規則
+
+支援萬用字元 (*.log、dist/、**/coverage)、以 ! 開頭的反向規則，以及專案內各層的 .gitignore。
+所有規則在建立時編譯成少數幾個合併的正規表示式，每個路徑只需比對一兩次，
+與規則數量幾乎無關。舊設定的「精確名稱」與「名稱前綴」會轉成不分大小寫的資料夾規則。
+"""
+import os
+import re
+
+GITIGNORE_FILE = ".gitignore"
+
+
+def _translate_glob(glob):
+    """將 gitignore 的萬用字元轉成正規表示式 (不含錨點)"""
+    out = []
+    i, n = 0, len(glob)
+    while i < n:
+        c = glob[i]
+        if c == '*':
+            if glob.startswith('**', i):
+                if i + 2 < n and glob[i + 2] == '/':
+                    out.append('(?:.*/)?')  # '**/' 代表零或多層資料夾
+                    i += 3
+                else:
+                    out.append('.*')  # 結尾的 '/**' 代表底下所有內容
+                    i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = glob.find(']', i + 2 if glob[i + 1:i + 2] in ('!', '^') else i + 1)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                content = glob[i + 1:j].replace('\\', '\\\\')
+                if content[:1] in ('!', '^'):
+                    content = '^' + content[1:]
+                out.append(f'[{content}]')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            out.append(re.escape(glob[i + 1]))
+            i += 1
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+def parse_pattern(line):
+    """解析一行 gitignore 規則，回傳 (正規表示式, 是否反向, 只比對資料夾, 是否比對完整路徑)；空行或註解回傳 None"""
+    line = line.rstrip('\r\n')
+    if not line.strip() or line.startswith('#'):
+        return None
+    # 去掉結尾空白 (以反斜線跳脫的空白除外)
+    while line.endswith(' ') and not line.endswith('\\ '):
+        line = line[:-1]
+    negate = line.startswith('!')
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # 開頭或中間有 '/' 的規則相對於 .gitignore 所在位置，否則比對任何一層的名稱
+    anchored = '/' in line
+    return _translate_glob(line.lstrip('/')), negate, dir_only, anchored
+
+
+class _CombinedMatcher:
+    """多條規則合併成一個正規表示式：順序反轉後，第一個成功的分支就是優先權最高 (最後定義) 的規則"""
+
+    def __init__(self, rules):
+        # rules: [(優先序, 正規表示式, 是否反向)]，優先序愈大愈後面定義
+        self.meta = [(index, negate) for index, _, negate in reversed(rules)]
+        combined = '|'.join(f'({regex})' for _, regex, _ in reversed(rules))
+        self.regex = re.compile(f'(?:{combined})\\Z', re.DOTALL) if rules else None
+
+    def match(self, text):
+        """回傳符合的最高優先規則 (優先序, 是否反向)，沒有符合時回傳 None"""
+        if self.regex is None:
+            return None
+        m = self.regex.match(text)
+        return self.meta[m.lastindex - 1] if m else None
+
+
+class ExclusionRules:
+    """編譯後的排除規則，可安全地在多個執行緒間共用"""
+
+    def __init__(self, excluded_exact=(), excluded_prefix=(), patterns=(), use_gitignore=False,
+                 ignore_case=None, _rules=None):
+        if ignore_case is None:
+            ignore_case = os.path.normcase('A') == 'a'  # Windows 的路徑不分大小寫
+        self.ignore_case = ignore_case
+        self.use_gitignore = use_gitignore
+        if _rules is None:
+            _rules = []
+            # 舊設定：精確名稱與前綴都只比對資料夾名稱，且不分大小寫
+            for name in excluded_exact:
+                _rules.append((f'(?i:{re.escape(name)})', False, True, False))
+            for prefix in excluded_prefix:
+                _rules.append((f'(?i:{re.escape(prefix)}[^/]*)', False, True, False))
+            _rules.extend(self._compile_lines(patterns, ''))
+        self._rules = _rules
+        self._build()
+
+    def _compile_lines(self, lines, base):
+        """將 gitignore 規則行轉成內部規則，base 為 .gitignore 所在資料夾的相對路徑 (以 '/' 結尾)"""
+        rules = []
+        for line in lines:
+            parsed = parse_pattern(line)
+            if parsed is None:
+                continue
+            regex, negate, dir_only, anchored = parsed
+            if self.ignore_case:
+                regex = f'(?i:{regex})'
+            if anchored:
+                regex = re.escape(base) + regex
+            rules.append((regex, negate, dir_only, anchored))
+        return rules
+
+    def _build(self):
+        """依規則種類合併成檔案用與資料夾用的比對器"""
+        def combined(for_dir, anchored):
+            return _CombinedMatcher([(i, regex, negate)
+                                     for i, (regex, negate, dir_only, is_anchored) in enumerate(self._rules)
+                                     if is_anchored == anchored and (for_dir or not dir_only)])
+        self._dir_name = combined(True, False)
+        self._dir_path = combined(True, True)
+        self._file_name = combined(False, False)
+        self._file_path = combined(False, True)
+        self._has_file_rules = self._file_name.regex is not None or self._file_path.regex is not None
+
+    @property
+    def pattern_count(self):
+        return len(self._rules)
+
+    def is_excluded(self, rel_path, is_dir, name=None):
+        """判斷相對路徑是否被排除 (rel_path 可使用系統分隔符號)"""
+        if not is_dir and not self._has_file_rules:
+            return False
+        if os.sep != '/':
+            rel_path = rel_path.replace(os.sep, '/')
+        if name is None:
+            name = rel_path.rpartition('/')[2]
+        if is_dir:
+            by_name, by_path = self._dir_name.match(name), self._dir_path.match(rel_path)
+        else:
+            by_name, by_path = self._file_name.match(name), self._file_path.match(rel_path)
+        best = max(filter(None, (by_name, by_path)), default=None)
+        return best is not None and not best[1]
+
+    def with_lines(self, lines, rel_prefix):
+        """加上某個資料夾的規則 (例如它的 .gitignore)，回傳新的規則物件"""
+        base = rel_prefix.replace(os.sep, '/') if os.sep != '/' else rel_prefix
+        extra = self._compile_lines(lines, base)
+        if not extra:
+            return self
+        return ExclusionRules(use_gitignore=self.use_gitignore, ignore_case=self.ignore_case,
+                              _rules=self._rules + extra)
+
+    def with_gitignore(self, gitignore_path, rel_prefix):
+        """讀取 .gitignore 並加上其規則，讀取失敗時沿用原本的規則"""
+        try:
+            with open(gitignore_path, 'r', encoding='utf-8', errors='replace') as f:
+                return self.with_lines(f.readlines(), rel_prefix)
+        except OSError:
+            return self
+
+
+def make_exclusion_rules(config):
+    """依設定檔內容建立排除規則"""
+    return ExclusionRules(
+        excluded_exact=config.get('excluded_exact', ()),
+        excluded_prefix=config.get('excluded_prefix', ()),
+        patterns=config.get('exclude_patterns', ()),
+        use_gitignore=config.get('use_gitignore', False),
+    )
@@ -0,0 +1,371 @@
+"""多目標備份：每個來源檔案只讀取一次，同時寫入多個目標資料夾
+
+本機磁碟與網路磁碟 (NAS) 各保存一份時，原本要執行兩次備份、讀兩次來源。這裡讀取執行緒把來源檔案
+逐段讀入緩衝區，同一段資料交給每個目標各自的寫入執行緒，各目標以自己的速度寫入、互不等待。
+每個目標已讀入但尚未寫入的資料有上限 (max_lag)：慢的目標累積到上限時讀取才暫停，
+快的目標最多只比慢的目標超前這麼多，記憶體用量也因此有上限。
+續傳日誌與校驗碼在每個目標各自記錄 (校驗碼只在讀取時計算一次)。資料一律經過讀取緩衝區，
+因此不使用 reflink 等複製方式、快照硬連結與差異傳輸 (見 unsupported_options)；
+大檔案本來就是逐段串流寫入各目標，不另外分段平行複製。
+"""
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from .checksum import DEFAULT_CHECKSUM_ALGORITHM, ChecksumRecorder
+from .config import DEFAULT_COPY_WORKERS, clamp_workers
+from .copier import (DEFAULT_RETRY_COUNT, DEFAULT_RETRY_DELAY, IN_FLIGHT_PER_WORKER, MAX_RETRY_QUEUE, PARTIAL_SUFFIX,
+                     CopyResult, is_transient_error, retry_transient)
+from .dirtree import apply_directory_times, create_directories, plan_directories
+from .fastcopy import DEFAULT_BUFFER_SIZE, DEFAULT_COPY_METHOD, _apply_metadata
+from .journal import CopyJournal
+from .manifest import manifest_key, save_manifest
+from .stats import RunStats
+
+# 每個目標已讀入但尚未寫入的資料上限 (快的目標最多超前慢的目標這麼多)
+DEFAULT_MAX_LAG = 256 * 1024 * 1024
+# 多目標備份在 CopyResult.methods 中的名稱
+FANOUT_METHOD = 'fanout'
+# 續傳時這個目標已完成、不需要寫入 (各目標結果中的標記)
+_RESUMED = 'resumed'
+
+
+def unsupported_options(method=DEFAULT_COPY_METHOD, link_dest=None, delta=False):
+    """多目標備份無法套用的選項名稱 (空的清單表示可以使用)"""
+    options = []
+    if method != DEFAULT_COPY_METHOD:
+        options.append(f"複製方式 {method}")
+    if link_dest:
+        options.append("快照硬連結")
+    if delta:
+        options.append("差異傳輸")
+    return options
+
+
+@dataclass
+class FanoutResult:
+    """一次多目標備份的結果"""
+    dest_dirs: list = field(default_factory=list)  # 所有目標資料夾 (第一個為掃描時的目標)
+    results: list = field(default_factory=list)    # 每個目標各自的 CopyResult (含 stats)
+    copied_count: int = 0                          # 所有目標都寫入成功的檔案數
+    failed_files: list = field(default_factory=list)  # 至少一個目標失敗的檔案 [(來源路徑, 第一個例外)]
+    retried_count: int = 0                         # 暫時性錯誤重試後成功的檔案數
+    resumed_count: int = 0                         # 續傳時所有目標都已完成而略過的檔案數
+    bytes_read: int = 0                            # 從來源讀取的位元組數 (每個檔案只讀一次)
+
+
+class _Destination:
+    """一個目標資料夾：自己的寫入執行緒池、結果與尚未寫入的資料量"""
+
+    def __init__(self, dest_dir, worker_count, max_lag, stats, journal=None, checksums=None):
+        self.dest_dir = dest_dir
+        self.dest_prefix = os.path.join(dest_dir, '')
+        self.executor = ThreadPoolExecutor(max_workers=worker_count)
+        self.max_lag = max_lag
+        self.result = CopyResult(stats=stats)
+        self.journal = journal     # 續傳日誌 (CopyJournal，未開啟續傳時為 None)
+        self.resumable = journal is not None and len(journal) > 0
+        self.checksums = checksums  # 校驗碼 (ChecksumRecorder，未開啟驗證時為 None)
+        self.pending = 0
+        self._cond = threading.Condition()
+
+    def reserve(self, size):
+        """讀取端排入一段資料前呼叫：尚未寫入的資料達到上限時等待 (沒有積欠時一定放行，單段超過上限也不會卡住)"""
+        with self._cond:
+            while self.pending and self.pending + size > self.max_lag:
+                self._cond.wait()
+            self.pending += size
+
+    def _release(self, size):
+        with self._cond:
+            self.pending -= size
+            self._cond.notify_all()
+
+    def write(self, relative_path, size, chunks):
+        """寫入一個檔案 (在這個目標的寫入執行緒中執行)
+
+        依序取出讀取端送來的資料 (bytes)，最後一項為來源的 stat (完成) 或例外 (讀取失敗)。
+        內容先寫到暫存檔，完成後設定權限與時間再改名；寫入失敗時仍把剩下的資料取完以釋放額度。
+        """
+        stats = self.result.stats
+        dest_path = self.dest_prefix + relative_path
+        temp_path = dest_path + PARTIAL_SUFFIX
+        started = time.perf_counter()
+        error = None
+        fd = None
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        except OSError as e:
+            error = e
+        while True:
+            data = chunks.get()
+            if not isinstance(data, bytes):
+                break
+            if error is None:
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(fd, view):]
+                    stats.add_bytes(len(data))
+                except OSError as e:
+                    error = e
+            self._release(len(data))
+        if error is None and isinstance(data, BaseException):
+            error = data
+        if fd is not None:
+            copied = time.perf_counter()
+            try:
+                pending = _apply_metadata(fd, data) if error is None else ()
+            except OSError as e:
+                error = e
+            finally:
+                os.close(fd)
+        if error is None:
+            try:
+                # 不支援以檔案描述子設定的系統 (例如 Windows)，關閉後再以路徑設定
+                if 'mode' in pending:
+                    os.chmod(temp_path, data.st_mode & 0o7777)
+                if 'times' in pending:
+                    os.utime(temp_path, ns=(data.st_atime_ns, data.st_mtime_ns))
+                os.replace(temp_path, dest_path)
+            except OSError as e:
+                error = e
+        if error is not None:
+            stats.file_failed()
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise error
+        stats.add_time('copy', copied - started)
+        stats.add_time('metadata', time.perf_counter() - copied)
+        stats.file_done(size, time.perf_counter() - started)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def fanout_copy(scan, dest_dirs, workers=DEFAULT_COPY_WORKERS, use_hash=False, progress_callback=None,
+                buffer_size=DEFAULT_BUFFER_SIZE, retries=DEFAULT_RETRY_COUNT, retry_delay=DEFAULT_RETRY_DELAY,
+                stats=None, max_lag=DEFAULT_MAX_LAG, resume=False, verify=False,
+                checksum_algorithm=DEFAULT_CHECKSUM_ALGORITHM):
+    """依掃描結果把每個檔案讀取一次，同時寫入 scan.dest_dir 與 dest_dirs 中的每個目標資料夾
+
+    progress_callback(已完成數, 總數) 只會在協調執行緒中被呼叫，已完成數為所有目標都寫完的檔案數。
+    stats 為每個目標各一個 RunStats 的清單 (依 FanoutResult.dest_dirs 的順序)，可由呼叫端傳入
+    以便在複製途中讀取各目標的位元組進度與速度，未指定時自動建立。
+    增量模式下，每個目標寫回各自成功的檔案的清單 (比對時使用掃描時目標的清單)。
+    max_lag 為每個目標已讀入但尚未寫入的資料上限 (位元組)。
+    resume 與 verify 與 copier.copy_files 相同，日誌與校驗碼寫在每個目標資料夾內；
+    續傳時只寫入尚未完成的目標，所有目標都已完成的檔案不讀取。
+    """
+    files = scan.files
+    file_count = len(files)
+    source_prefix = files.source_prefix
+    all_dirs = [scan.dest_dir] + [d for d in dest_dirs if d != scan.dest_dir]
+    worker_count = clamp_workers(workers)
+    buffer_size = max(4096, int(buffer_size))
+    if stats is None:
+        stats = [RunStats.for_scan(scan) for _ in all_dirs]
+    # 寫入執行緒數與讀取執行緒數相同：每個讀取中的檔案在每個目標都一定有執行緒在寫入，不會互相等待
+    destinations = [_Destination(dest_dir, worker_count, max(buffer_size, int(max_lag)), run_stats,
+                                 CopyJournal(dest_dir, scan.source_dir) if resume else None,
+                                 ChecksumRecorder(dest_dir, checksum_algorithm) if verify else None)
+                    for dest_dir, run_stats in zip(all_dirs, stats)]
+    result = FanoutResult(all_dirs, [d.result for d in destinations])
+    incremental_entries = {k: list(v) for k, v in scan.manifest_entries.items()} if scan.incremental else None
+    # 校驗碼與清單同樣使用 blake2b 時共用同一個雜湊，不必計算兩次
+    share_hash = verify and checksum_algorithm == 'blake2b'
+    read_lock = threading.Lock()
+
+    def pending_outcomes(item):
+        """各目標的初始結果：續傳時已完成的目標為 _RESUMED，其餘為 None (需要寫入)"""
+        source_path = source_prefix + item[0]
+        return [_RESUMED if d.resumable and d.journal.is_done(source_path, item[0]) else None
+                for d in destinations]
+
+    def read_one(item, outcomes):
+        """讀取一個檔案並把每一段送到需要寫入的目標 (在讀取執行緒中執行)
+
+        回傳 ({目標索引: Future}, 讀取錯誤, 校驗碼的雜湊)。
+        """
+        relative_path, size, _ = item
+        targets = [i for i, outcome in enumerate(outcomes) if outcome is None]
+        chunks = {i: queue.SimpleQueue() for i in targets}
+        futures = {i: destinations[i].executor.submit(destinations[i].write, relative_path, size, chunks[i])
+                   for i in targets}
+        checksum = destinations[0].checksums.hasher() if verify else None
+        hasher = None
+        if incremental_entries is not None and use_hash and not share_hash:
+            hasher = hashlib.blake2b()
+        read = 0
+        try:
+            with open(source_prefix + relative_path, 'rb', buffering=0) as f:
+                end = os.fstat(f.fileno())
+                while True:
+                    data = f.read(buffer_size)
+                    if not data:
+                        break
+                    read += len(data)
+                    if hasher is not None:
+                        hasher.update(data)
+                    if checksum is not None:
+                        checksum.update(data)
+                    for i in targets:
+                        destinations[i].reserve(len(data))
+                        chunks[i].put(data)
+            error = None
+        except Exception as e:
+            end = error = e
+        for q in chunks.values():
+            q.put(end)
+        with read_lock:
+            result.bytes_read += read
+        if error is None and incremental_entries is not None and use_hash:
+            digest = checksum.hexdigest() if share_hash else hasher.hexdigest()
+            incremental_entries[manifest_key(relative_path)][2] = digest
+        return futures, error, checksum
+
+    def attempt(entry):
+        """重試一個檔案：讀取失敗時丟出例外，否則回傳 (各目標的結果, 校驗碼的雜湊)"""
+        item, outcomes = entry
+        outcomes = list(outcomes)
+        futures, error, checksum = read_one(item, outcomes)
+        for i, future in futures.items():
+            outcomes[i] = future.exception()
+        if error is not None:
+            raise error
+        return outcomes, checksum
+
+    def settle(item, outcomes, checksum):
+        """記錄一個檔案在各目標的結果"""
+        first_error = None
+        for destination, error in zip(destinations, outcomes):
+            if error is _RESUMED:
+                continue
+            if error is None:
+                destination.result.record_method(FANOUT_METHOD)
+                if destination.journal is not None:
+                    destination.journal.record(*item)
+                if checksum is not None:
+                    destination.checksums.record(item[0], None, checksum, FANOUT_METHOD)
+            else:
+                destination.result.failed_files.append((source_prefix + item[0], error))
+                first_error = first_error or error
+        if first_error is not None:
+            result.failed_files.append((source_prefix + item[0], first_error))
+        elif all(outcome is _RESUMED for outcome in outcomes):
+            result.resumed_count += 1
+        else:
+            result.copied_count += 1
+
+    update_interval = max(1, file_count // 100)
+    done_count = 0
+    retry_queue = []
+    failed_entries = [set() for _ in destinations]  # 各目標失敗的檔案 (不寫入該目標的清單)
+
+    def finish(item, outcomes, checksum=None):
+        nonlocal done_count
+        settle(item, outcomes, checksum)
+        for failed, error in zip(failed_entries, outcomes):
+            if error is not None and error is not _RESUMED:
+                failed.add(manifest_key(item[0]))
+        done_count += 1
+        if progress_callback and (done_count % update_interval == 0 or done_count == file_count):
+            progress_callback(done_count, file_count)
+
+    started = time.perf_counter()
+    dir_levels = plan_directories(files.dirs)
+    for destination in destinations:
+        create_directories(destination.dest_dir, dir_levels, worker_count)
+    for run_stats in stats:
+        run_stats.add_time('mkdir', time.perf_counter() - started)
+
+    for destination in destinations:
+        if destination.journal is not None:
+            destination.journal.start()
+    try:
+        with ThreadPoolExecutor(max_workers=worker_count) as readers:
+            max_in_flight = worker_count * IN_FLIGHT_PER_WORKER
+            in_flight = {}  # 讀取的 Future -> (項目, 各目標的初始結果)
+            writing = {}    # 寫入的 Future -> [項目, 讀取錯誤, 各目標結果, 尚未完成數, 初始結果, 校驗碼的雜湊]
+
+            def collect(done):
+                for future in done:
+                    if future in in_flight:
+                        item, initial = in_flight.pop(future)
+                        futures, error, checksum = future.result()
+                        entry = [item, error, list(initial), len(futures), initial, checksum]
+                        for index, write_future in futures.items():
+                            writing[write_future] = (entry, index)
+                        continue
+                    entry, index = writing.pop(future)
+                    entry[2][index] = future.exception()
+                    entry[3] -= 1
+                    if entry[3]:
+                        continue
+                    item, error, outcomes, initial, checksum = entry[0], entry[1], entry[2], entry[4], entry[5]
+                    if (error is not None and retries > 0 and is_transient_error(error)
+                            and len(retry_queue) < MAX_RETRY_QUEUE):
+                        retry_queue.append((item, initial))  # 來源被鎖住：其他檔案完成後再試
+                    else:
+                        finish(item, outcomes, checksum)
+
+            for item in files.iter_entries():
+                initial = pending_outcomes(item)
+                if None not in initial:
+                    # 續傳：所有目標都已完成且來源未變更，不讀取
+                    for destination in destinations:
+                        destination.result.resumed_count += 1
+                        destination.result.stats.skip(item[1])
+                    finish(item, initial)
+                    continue
+                for destination, outcome in zip(destinations, initial):
+                    if outcome is _RESUMED:
+                        destination.result.resumed_count += 1
+                        destination.result.stats.skip(item[1])
+                in_flight[readers.submit(read_one, item, initial)] = (item, initial)
+                while len(in_flight) + len(writing) >= max_in_flight:
+                    done, _ = wait(list(in_flight) + list(writing), return_when=FIRST_COMPLETED)
+                    collect(done)
+            while in_flight or writing:
+                done, _ = wait(list(in_flight) + list(writing), return_when=FIRST_COMPLETED)
+                collect(done)
+
+        if retry_queue:
+            succeeded, failed = retry_transient(retry_queue, attempt, retries, retry_delay)
+            for (item, _), (outcomes, checksum) in succeeded:
+                finish(item, outcomes, checksum)
+                if all(outcome is None or outcome is _RESUMED for outcome in outcomes):
+                    result.retried_count += 1
+            for (item, initial), error in failed:
+                finish(item, [outcome or error for outcome in initial])
+    finally:
+        # 中斷時也把已完成的部分寫入日誌，下次從這裡繼續；任何一個目標未完成時所有目標都保留日誌，
+        # 下次只寫入未完成的目標，已完成的目標不必重寫
+        finished = not result.failed_files and result.copied_count + result.resumed_count == file_count
+        for destination in destinations:
+            destination.close()
+            if destination.journal is not None:
+                destination.journal.close(finished=finished)
+        for run_stats in stats:
+            run_stats.finish()
+
+    # 清單只記錄已成功寫入該目標的檔案
+    if incremental_entries is not None:
+        for destination, failed in zip(destinations, failed_entries):
+            save_manifest(destination.dest_dir,
+                          {k: v for k, v in incremental_entries.items() if k not in failed})
+    for destination in destinations:
+        if destination.checksums is not None:
+            destination.checksums.save()
+    # 資料夾的時間最後才設定
+    for destination, run_stats in zip(destinations, stats):
+        started = time.perf_counter()
+        apply_directory_times(scan.source_dir, destination.dest_dir, dir_levels, worker_count)
+        run_stats.add_time('metadata', time.perf_counter() - started)
+    return result
@@ -0,0 +1,284 @@
+"""檔案內容的快速複製路徑
+
+依序嘗試：reflink (FICLONE，btrfs/XFS 上瞬間完成) → os.copy_file_range → os.sendfile →
+可調整緩衝區大小的一般讀寫。權限與時間在目標檔案關閉前直接對檔案描述子設定，
+不再像 shutil.copy2 那樣對路徑另外呼叫 chmod/utime (不支援的系統則在關閉後以路徑設定)。
+回傳實際使用的方式，供執行統計使用。需要邊複製邊計算校驗碼時 (hasher)，資料必須經過
+程式本身，因此固定使用一般讀寫，在同一次讀取中更新雜湊。
+傳入 stats (stats.RunStats) 時分段回報已複製的位元組數，並記錄複製內容與設定權限/時間的耗時。
+copy_file_part 以指定位置讀寫複製檔案的一段，供大檔案分段平行複製 (見 copier.ChunkedCopy)。
+"""
+import errno
+import os
+import shutil
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl
+    fcntl = None
+
+# 可在設定檔選擇的複製方式
+COPY_METHODS = ('auto', 'reflink', 'copy_file_range', 'sendfile', 'buffered', 'shutil')
+DEFAULT_COPY_METHOD = 'auto'
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# 需要回報進度時，核心內的複製每次最多處理的大小 (大檔案複製途中也能更新進度)
+PROGRESS_CHUNK_SIZE = 64 * 1024 * 1024
+# linux/fs.h: FICLONE = _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# 這些錯誤代表「這條路徑在此檔案系統不可用」，應改用下一種方式
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.EPERM,
+                    getattr(errno, 'EOPNOTSUPP', errno.EINVAL), getattr(errno, 'ENOTSUP', errno.EINVAL),
+                    getattr(errno, 'ENOTTY', errno.EINVAL)}
+
+_IS_LINUX = sys.platform.startswith('linux')
+_HAS_COPY_FILE_RANGE = hasattr(os, 'copy_file_range')
+_HAS_SENDFILE = hasattr(os, 'sendfile') and _IS_LINUX  # 其他系統的 sendfile 只能寫入 socket
+_HAS_SEEK_DATA = hasattr(os, 'SEEK_DATA')
+# 分段複製需要不移動檔案位置的讀寫 (Windows 沒有 os.pread)；sendfile 與 shutil 無法指定寫入位置
+CHUNKED_COPY_METHODS = ('auto', 'reflink', 'copy_file_range', 'buffered') if hasattr(os, 'pread') else ()
+
+
+def _try_reflink(src_fd, dst_fd):
+    """嘗試以 FICLONE 共用資料區塊，成功回傳 True"""
+    if fcntl is None or not _IS_LINUX:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError as e:
+        if e.errno in _FALLBACK_ERRNOS:
+            return False
+        raise
+
+
+def _copy_range(src_fd, dst_fd, size, offset, stats=None):
+    """以 copy_file_range 從 offset 複製到結尾，回傳複製到的位置 (不支援時停在原處)"""
+    chunk = PROGRESS_CHUNK_SIZE if stats is not None else size
+    while offset < size:
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, min(size - offset, chunk), offset, offset)
+        except OSError as e:
+            if e.errno in _FALLBACK_ERRNOS:
+                return offset
+            raise
+        if copied == 0:  # 檔案在複製途中變短
+            break
+        offset += copied
+        if stats is not None:
+            stats.add_bytes(copied)
+    return offset
+
+
+def _sendfile(src_fd, dst_fd, size, offset, stats=None):
+    """以 sendfile 從 offset 複製到結尾，回傳複製到的位置 (不支援時停在原處)"""
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    chunk = PROGRESS_CHUNK_SIZE if stats is not None else 1 << 30
+    while offset < size:
+        try:
+            sent = os.sendfile(dst_fd, src_fd, offset, min(size - offset, chunk))
+        except OSError as e:
+            if e.errno in _FALLBACK_ERRNOS:
+                return offset
+            raise
+        if sent == 0:
+            break
+        offset += sent
+        if stats is not None:
+            stats.add_bytes(sent)
+    return offset
+
+
+def _buffered(src_fd, dst_fd, offset, buffer_size, hasher=None, stats=None):
+    """一般讀寫，從 offset 複製到來源結尾 (有 hasher 時同時更新雜湊)"""
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(src_fd, 'rb', buffering=0, closefd=False) as fsrc:
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            if hasher is not None:
+                hasher.update(view[:n])
+            written = 0
+            while written < n:
+                written += os.write(dst_fd, view[written:n])
+            if stats is not None:
+                stats.add_bytes(n)
+
+
+def _copy_data(src_fd, dst_fd, size, method, buffer_size, hasher=None, stats=None):
+    """依指定方式複製內容，回傳實際使用的方式"""
+    if hasher is not None:  # 核心內的複製不經過程式，無法計算雜湊
+        _buffered(src_fd, dst_fd, 0, buffer_size, hasher, stats)
+        return 'buffered'
+    if method in ('auto', 'reflink') and size and _try_reflink(src_fd, dst_fd):
+        return 'reflink'
+    offset = 0
+    used = 'buffered'
+    if method in ('auto', 'copy_file_range') and _HAS_COPY_FILE_RANGE:
+        offset = _copy_range(src_fd, dst_fd, size, offset, stats)
+        if offset:
+            used = 'copy_file_range'
+    if offset < size and method in ('auto', 'sendfile') and _HAS_SENDFILE:
+        start = offset
+        offset = _sendfile(src_fd, dst_fd, size, offset, stats)
+        if offset > start and used == 'buffered':
+            used = 'sendfile'
+    # 前面的方式都不可用，或檔案在掃描後變大時，以一般讀寫補完剩下的部分
+    _buffered(src_fd, dst_fd, offset, buffer_size, stats=stats)
+    return used
+
+
+def data_regions(fd, start, end):
+    """[start, end) 中實際有資料的區段 [(開始, 結束)]，跳過稀疏檔案的空洞 (不支援時回傳整段)
+
+    只使用 lseek 的回傳值，多個執行緒同時對同一個檔案描述子呼叫也不會互相影響。
+    """
+    if not _HAS_SEEK_DATA:
+        return [(start, end)]
+    regions = []
+    offset = start
+    while offset < end:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:  # 之後全是空洞
+                break
+            if e.errno in _FALLBACK_ERRNOS:
+                regions.append((offset, end))
+                break
+            raise
+        if data >= end:
+            break
+        hole = os.lseek(fd, data, os.SEEK_HOLE)
+        regions.append((data, min(hole, end)))
+        offset = hole
+    return regions
+
+
+def copy_file_part(src_fd, dst_fd, start, end, method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE,
+                   report=None):
+    """以指定位置讀寫複製 [start, end)，回傳複製的位元組數
+
+    不移動檔案位置，多個執行緒可同時複製同一對檔案描述子的不同段落。
+    空洞不寫入 (目標需先以 ftruncate 設定大小)，稀疏檔案複製後仍是稀疏的。
+    report(位元組數) 在每寫完一部分時呼叫。
+    """
+    copied = 0
+    for offset, stop in data_regions(src_fd, start, end):
+        if method in ('auto', 'copy_file_range') and _HAS_COPY_FILE_RANGE:
+            while offset < stop:
+                try:
+                    n = os.copy_file_range(src_fd, dst_fd, min(stop - offset, PROGRESS_CHUNK_SIZE), offset, offset)
+                except OSError as e:
+                    if e.errno in _FALLBACK_ERRNOS:
+                        break
+                    raise
+                if n == 0:  # 檔案在複製途中變短
+                    return copied
+                offset += n
+                copied += n
+                if report is not None:
+                    report(n)
+        while offset < stop:
+            data = os.pread(src_fd, min(stop - offset, buffer_size), offset)
+            if not data:
+                return copied
+            view = memoryview(data)
+            written = 0
+            while written < len(data):
+                written += os.pwrite(dst_fd, view[written:], offset + written)
+            offset += len(data)
+            copied += len(data)
+            if report is not None:
+                report(len(data))
+    return copied
+
+
+def _apply_metadata(dst_fd, st):
+    """權限與時間優先對檔案描述子設定，回傳尚未套用 (需要關閉後以路徑設定) 的項目"""
+    pending = []
+    if os.chmod in os.supports_fd:
+        os.chmod(dst_fd, st.st_mode & 0o7777)
+    else:
+        pending.append('mode')
+    if os.utime in os.supports_fd:
+        os.utime(dst_fd, ns=(st.st_atime_ns, st.st_mtime_ns))
+    else:
+        pending.append('times')
+    return pending
+
+
+def copy_file_fast(src_path, dest_path, method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE, hasher=None,
+                   stats=None):
+    """複製檔案內容與權限/時間，回傳實際使用的方式 (例如 'reflink'、'copy_file_range')
+
+    hasher (例如 checksum.StreamHasher) 不為 None 時，複製的資料同時送進 hasher.update。
+    """
+    if method == 'shutil' and hasher is None:
+        started = time.perf_counter()
+        shutil.copy2(src_path, dest_path)
+        if stats is not None:
+            stats.add_time('copy', time.perf_counter() - started)
+        return 'shutil'
+
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+    src_fd = os.open(src_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        st = os.fstat(src_fd)
+        dst_fd = os.open(dest_path, flags, 0o666)
+        try:
+            started = time.perf_counter()
+            used = _copy_data(src_fd, dst_fd, st.st_size, method, max(4096, int(buffer_size)), hasher, stats)
+            copied = time.perf_counter()
+            pending = _apply_metadata(dst_fd, st)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    # 不支援以檔案描述子設定的系統 (例如 Windows)，關閉後再以路徑設定
+    if 'mode' in pending:
+        os.chmod(dest_path, st.st_mode & 0o7777)
+    if 'times' in pending:
+        os.utime(dest_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    if stats is not None:
+        stats.add_time('copy', copied - started)
+        stats.add_time('metadata', time.perf_counter() - copied)
+    return used
+
+
+def open_chunked_copy(src_path, dest_path, method=DEFAULT_COPY_METHOD):
+    """分段複製前開啟來源並建立與來源同大小的目標，回傳 (來源 fd, 目標 fd, 來源 stat, 是否已以 reflink 完成)"""
+    src_fd = os.open(src_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        st = os.fstat(src_fd)
+        dst_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            if method in ('auto', 'reflink') and st.st_size and _try_reflink(src_fd, dst_fd):
+                return src_fd, dst_fd, st, True
+            os.ftruncate(dst_fd, st.st_size)  # 沒有寫入的部分保持為空洞
+        except BaseException:
+            os.close(dst_fd)
+            raise
+    except BaseException:
+        os.close(src_fd)
+        raise
+    return src_fd, dst_fd, st, False
+
+
+def close_chunked_copy(src_fd, dst_fd, dest_path, st):
+    """分段複製完成：設定權限與時間並關閉兩個檔案"""
+    try:
+        pending = _apply_metadata(dst_fd, st)
+    finally:
+        os.close(dst_fd)
+        os.close(src_fd)
+    if 'mode' in pending:
+        os.chmod(dest_path, st.st_mode & 0o7777)
+    if 'times' in pending:
+        os.utime(dest_path, ns=(st.st_atime_ns, st.st_mtime_ns))
@@ -0,0 +1,224 @@
+"""精簡的檔案清單：只保存相對路徑，資料夾共用一張表，大小與時間放在緊密的陣列中
+
+每個檔案原本是兩個完整路徑的 tuple (來源與目標各重複一次資料夾前綴)，幾百萬個檔案時
+佔用數百 MB。這裡每個檔案只保存資料夾編號、UTF-8 編碼的檔名與大小/時間，完整路徑在
+使用時才組合。超過記憶體預算時改寫到暫存的 sqlite 檔案，讀取方式不變，
+複製與預覽都不需要知道清單實際放在哪裡。
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+from array import array
+
+# 預設的記憶體預算 (位元組)，超過時改寫到磁碟
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+# 寫到磁碟後，累積多少個檔案才一次寫入 sqlite
+SPILL_BATCH_SIZE = 10000
+# 每個檔案除了檔名以外的固定大小：資料夾編號、檔名結尾位置、大小與時間
+_ENTRY_OVERHEAD = 4 + 8 + 8 + 8
+# 路徑可能含有無法以 UTF-8 表示的字元 (例如 surrogateescape)，編碼時原樣保留
+_ERRORS = 'surrogatepass'
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class FilePlan:
+    """要複製的檔案清單 (可安全地在多個複製執行緒間讀取)
+
+    plan[i] 與舊的列表相同，回傳 (來源路徑, 目標路徑)；entry(i) 回傳 (相對路徑, 大小, mtime_ns)。
+    """
+
+    def __init__(self, source_dir, dest_dir, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.source_dir = source_dir
+        self.dest_dir = dest_dir
+        self.memory_budget = memory_budget
+        self.source_prefix = os.path.join(source_dir, '')
+        self.dest_prefix = os.path.join(dest_dir, '')
+        self.dirs = []       # 資料夾相對路徑 ('' 為來源資料夾本身)
+        self._dir_ids = {}
+        self._count = 0
+        self._file_dirs = array('I')
+        self._names = bytearray()
+        self._name_ends = array('Q')
+        self._sizes = array('q')
+        self._mtimes = array('q')
+        self._db = None      # 寫到磁碟後的 sqlite 連線
+        self._pending = []   # 尚未寫入 sqlite 的檔案
+        self._lock = threading.Lock()
+        self._finalizer = None
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    @property
+    def spilled(self):
+        """清單是否已改寫到磁碟"""
+        return self._db is not None
+
+    @property
+    def memory_usage(self):
+        """記憶體中的清單大約佔用的位元組數 (不含資料夾表)"""
+        return len(self._names) + len(self._file_dirs) * _ENTRY_OVERHEAD
+
+    def _dir_id(self, directory):
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_ids[directory] = len(self.dirs)
+            self.dirs.append(directory)
+        return dir_id
+
+    def append(self, relative_path, size, mtime_ns):
+        """加入一個檔案 (只在建立清單的執行緒中呼叫，加入完成後呼叫 finish)"""
+        directory, _, name = relative_path.rpartition(os.sep)
+        dir_id = self._dir_id(directory)
+        encoded = name.encode('utf-8', _ERRORS)
+        self._count += 1
+        if self._db is not None:
+            with self._lock:
+                self._pending.append((self._count, dir_id, encoded, size, mtime_ns))
+                full = len(self._pending) >= SPILL_BATCH_SIZE
+            if full:
+                self._flush()
+            return
+        self._file_dirs.append(dir_id)
+        self._names += encoded
+        self._name_ends.append(len(self._names))
+        self._sizes.append(size)
+        self._mtimes.append(mtime_ns)
+        if self.memory_budget is not None and self.memory_usage > self.memory_budget:
+            self._spill()
+
+    def _spill(self):
+        """把記憶體中的清單搬到暫存的 sqlite 檔案"""
+        fd, path = tempfile.mkstemp(prefix="backup_plan_", suffix=".sqlite")
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, dir INTEGER, name BLOB, size INTEGER, mtime INTEGER)")
+        start = 0
+        for i in range(len(self._file_dirs)):
+            end = self._name_ends[i]
+            with self._lock:
+                self._pending.append((i + 1, self._file_dirs[i], bytes(self._names[start:end]),
+                                      self._sizes[i], self._mtimes[i]))
+            start = end
+            if len(self._pending) >= SPILL_BATCH_SIZE:
+                self._flush()
+        self._flush()
+        self._file_dirs = array('I')
+        self._names = bytearray()
+        self._name_ends = array('Q')
+        self._sizes = array('q')
+        self._mtimes = array('q')
+
+    def _flush(self):
+        # 取出與寫入都在鎖內：多個讀取執行緒同時呼叫時，每個檔案只會寫入一次
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if rows:
+                self._db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    def finish(self):
+        """清單建立完成：把尚未寫入的檔案寫入 sqlite，之後讀取時不再需要寫入"""
+        if self._db is not None:
+            self._flush()
+        return self
+
+    def close(self):
+        """刪除磁碟上的暫存檔 (清單不再使用時呼叫；沒有呼叫時在物件回收時刪除)"""
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def _relative(self, dir_id, encoded):
+        directory = self.dirs[dir_id]
+        name = encoded.decode('utf-8', _ERRORS)
+        return directory + os.sep + name if directory else name
+
+    def entry(self, index):
+        """第 index 個檔案的 (相對路徑, 大小, mtime_ns)"""
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        if self._db is None:
+            start = self._name_ends[index - 1] if index else 0
+            encoded = self._names[start:self._name_ends[index]]
+            return self._relative(self._file_dirs[index], encoded), self._sizes[index], self._mtimes[index]
+        self._flush()
+        with self._lock:
+            dir_id, encoded, size, mtime_ns = self._db.execute(
+                "SELECT dir, name, size, mtime FROM files WHERE id = ?", (index + 1,)).fetchone()
+        return self._relative(dir_id, encoded), size, mtime_ns
+
+    def iter_entries(self):
+        """依加入順序產生 (相對路徑, 大小, mtime_ns)"""
+        if self._db is None:
+            start = 0
+            names = self._names
+            for i, end in enumerate(self._name_ends):
+                yield self._relative(self._file_dirs[i], names[start:end]), self._sizes[i], self._mtimes[i]
+                start = end
+            return
+        self._flush()
+        last_id = 0
+        while True:  # 分段讀取，不長時間佔用連線
+            with self._lock:
+                rows = self._db.execute("SELECT id, dir, name, size, mtime FROM files WHERE id > ? ORDER BY id LIMIT ?",
+                                        (last_id, SPILL_BATCH_SIZE)).fetchall()
+            if not rows:
+                return
+            for last_id, dir_id, encoded, size, mtime_ns in rows:
+                yield self._relative(dir_id, encoded), size, mtime_ns
+
+    def __getitem__(self, index):
+        relative_path = self.entry(index)[0]
+        return self.source_prefix + relative_path, self.dest_prefix + relative_path
+
+    def __iter__(self):
+        for relative_path, _, _ in self.iter_entries():
+            yield self.source_prefix + relative_path, self.dest_prefix + relative_path
+
+    @property
+    def sizes(self):
+        """各檔案的大小 (可索引與走訪)"""
+        return self._sizes if self._db is None else _Column(self, 1)
+
+    @property
+    def mtimes(self):
+        """各檔案的修改時間 mtime_ns (可索引與走訪)"""
+        return self._mtimes if self._db is None else _Column(self, 2)
+
+
+class _Column:
+    """寫到磁碟後的 sizes / mtimes，透過 FilePlan.entry 讀取"""
+
+    def __init__(self, plan, field):
+        self._plan = plan
+        self._field = field
+
+    def __len__(self):
+        return len(self._plan)
+
+    def __getitem__(self, index):
+        return self._plan.entry(index)[self._field]
+
+    def __iter__(self):
+        for entry in self._plan.iter_entries():
+            yield entry[self._field]
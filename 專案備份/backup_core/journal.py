@@ -0,0 +1,126 @@
+"""可續傳的複製日誌：記錄已完成的檔案，中斷後重新執行時從停下的地方繼續
+
+每個檔案先複製到暫存檔再改名 (見 copier.copy_file)，改名完成後才在日誌追加一行，
+因此日誌裡的檔案一定是完整的；尚未記錄的檔案下次會重新複製。
+工作全部成功時刪除日誌，有失敗的檔案時保留，下次只需處理失敗與未完成的部分。
+"""
+import json
+import os
+import threading
+import time
+
+from .manifest import manifest_key
+from .snapshot import list_snapshots
+
+# 日誌檔名 (寫在目標資料夾內)
+JOURNAL_FILE = ".backup_journal"
+JOURNAL_VERSION = 1
+# 日誌寫入磁碟的間隔：太頻繁會拖慢小檔案，太久則中斷時要重做比較多
+FLUSH_INTERVAL = 1.0
+
+
+class CopyJournal:
+    """目標資料夾內的複製日誌，可在多個複製執行緒間共用"""
+
+    def __init__(self, dest_dir, source_dir):
+        self.dest_dir = dest_dir
+        self.source_dir = source_dir
+        self.path = os.path.join(dest_dir, JOURNAL_FILE)
+        self.completed = self._load()  # {清單鍵值: (大小, mtime_ns)}
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_flush = time.monotonic()
+
+    def _load(self):
+        """讀取既有的日誌 (來源不同或格式錯誤時視為沒有日誌)"""
+        completed = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline() or 'null')
+                if (not isinstance(header, dict) or header.get('version') != JOURNAL_VERSION
+                        or header.get('source_dir') != self.source_dir):
+                    return {}
+                for line in f:
+                    try:
+                        key, size, mtime_ns = json.loads(line)
+                    except (ValueError, TypeError):
+                        continue  # 中斷時寫了一半的最後一行
+                    completed[key] = (size, mtime_ns)
+        except FileNotFoundError:
+            pass
+        except (ValueError, IOError) as e:
+            print(f"讀取複製日誌 {self.path} 時發生錯誤: {e}")
+            return {}
+        return completed
+
+    def __len__(self):
+        return len(self.completed)
+
+    def is_done(self, source_path, relative_path):
+        """檔案是否已在先前的執行中完成 (來源目前的大小與時間與記錄相同，且目標仍存在)"""
+        record = self.completed.get(manifest_key(relative_path))
+        if record is None:
+            return False
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns) != tuple(record):
+            return False
+        return os.path.lexists(os.path.join(self.dest_dir, relative_path))
+
+    def start(self):
+        """開始記錄 (在複製第一個檔案前呼叫，讓中斷的工作一定留下日誌)"""
+        with self._lock:
+            if self._file is not None:
+                return
+            os.makedirs(self.dest_dir, exist_ok=True)
+            if self.completed:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            else:
+                self._file = open(self.path, 'w', encoding='utf-8')
+                header = {'version': JOURNAL_VERSION, 'source_dir': self.source_dir}
+                self._file.write(json.dumps(header, ensure_ascii=False) + '\n')
+            self._sync()
+
+    def record(self, relative_path, size, mtime_ns):
+        """記錄一個已完成的檔案 (大約每 FLUSH_INTERVAL 秒寫入磁碟一次)"""
+        key = manifest_key(relative_path)
+        line = json.dumps([key, size, mtime_ns], ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self.completed[key] = (size, mtime_ns)
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                self._sync()
+                self._last_flush = now
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, finished):
+        """結束工作：全部成功時刪除日誌，否則寫入磁碟保留到下次"""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+            if finished:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+
+def has_journal(dest_dir):
+    """目標資料夾內是否有未完成的複製日誌"""
+    return os.path.isfile(os.path.join(dest_dir, JOURNAL_FILE))
+
+
+def find_unfinished_snapshot(base_dest_dir):
+    """最新的時間戳記快照若留有未完成的日誌則回傳其路徑 (續傳時沿用它而不是建立新的快照)"""
+    snapshots = list_snapshots(base_dest_dir)
+    if snapshots and has_journal(snapshots[-1][1]):
+        return snapshots[-1][1]
+    return None
@@ -0,0 +1,64 @@
+"""增量備份清單：記錄目標資料夾內每個檔案備份時的大小、修改時間與雜湊"""
+import hashlib
+import json
+import os
+
+# 增量備份清單檔名 (寫在目標資料夾內)
+MANIFEST_FILE = ".backup_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def manifest_key(relative_path):
+    """清單鍵值統一使用 '/' 分隔，讓 Windows 與其他系統產生的清單可以共用"""
+    return relative_path.replace(os.sep, '/')
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """計算檔案內容的 blake2b 雜湊值"""
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(dest_dir):
+    """讀取目標資料夾內的增量清單，不存在或格式錯誤時回傳空字典"""
+    manifest_path = os.path.join(dest_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"讀取增量清單 {manifest_path} 時發生錯誤: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get('version') != MANIFEST_VERSION:
+        return {}
+    return data.get('files', {})
+
+
+def save_manifest(dest_dir, entries):
+    """將清單寫入目標資料夾 (先寫暫存檔再取代，避免中斷時留下半個檔案)"""
+    os.makedirs(dest_dir, exist_ok=True)
+    manifest_path = os.path.join(dest_dir, MANIFEST_FILE)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': entries}, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_path, manifest_path)
+
+
+def is_unchanged(source_path, size, mtime_ns, previous, use_hash):
+    """比對清單記錄判斷檔案是否未變更，回傳 (是否未變更, 雜湊值)"""
+    if not previous:
+        return False, None
+    prev_size, prev_mtime_ns, prev_hash = previous
+    if prev_size != size:
+        return False, None
+    if prev_mtime_ns == mtime_ns:
+        return True, prev_hash
+    # 大小相同但時間不同：有記錄雜湊時再比對內容 (例如 git checkout 只改了時間)
+    if use_hash and prev_hash:
+        current_hash = hash_file(source_path)
+        return current_hash == prev_hash, current_hash
+    return False, None
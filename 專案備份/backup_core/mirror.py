@@ -0,0 +1,265 @@
+"""鏡像模式：讓目標資料夾與來源一致，包含刪除來源已不存在的檔案
+
+來源與目標各走訪一次，依相對路徑排序後以合併 (sorted merge) 的方式一次比對出
+新增 / 更新 / 刪除，不需要對每個檔案個別檢查目標是否存在。來源已不存在的資料夾
+在刪除檔案後一併移除 (仍有被排除而保留的內容時留下)。
+目標也套用同一套排除規則，被排除的資料夾預設保留不動 (可設定為一併刪除)。
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .checksum import CHECKSUM_FILE, load_checksums, update_checksums
+from .config import DEFAULT_COPY_WORKERS, DEFAULT_SCAN_WORKERS, clamp_workers
+from .copier import CopyResult, copy_files
+from .fastcopy import DEFAULT_BUFFER_SIZE, DEFAULT_COPY_METHOD
+from .fileplan import DEFAULT_MEMORY_BUDGET, FilePlan
+from .journal import JOURNAL_FILE
+from .manifest import MANIFEST_FILE, load_manifest, manifest_key, save_manifest
+from .scanner import ScanResult, walk_tree
+from .stats import RunStats
+
+# 目標資料夾根目錄中由備份工具自己維護的檔案，鏡像時不刪除
+PROTECTED_FILES = {MANIFEST_FILE, JOURNAL_FILE, CHECKSUM_FILE}
+# 每個刪除工作處理的檔案數
+DELETE_BATCH_SIZE = 256
+
+OP_COPY = 'copy'      # 目標沒有的檔案
+OP_UPDATE = 'update'  # 目標有但大小或修改時間不同
+OP_DELETE = 'delete'  # 來源已不存在
+
+
+@dataclass
+class MirrorPlan(ScanResult):
+    """鏡像的執行計畫 (files 為要複製的檔案，與一般掃描結果相同，可直接交給 copy_files)"""
+    operations: list = field(default_factory=list)  # 與 files 對應：OP_COPY 或 OP_UPDATE
+    deletes: list = field(default_factory=list)     # [(目標路徑, 大小)]，要刪除的檔案
+    delete_bytes: int = 0
+    stale_dirs: list = field(default_factory=list)  # [目標路徑]，來源已不存在的空資料夾 (由深到淺)
+
+    @property
+    def update_count(self):
+        return self.operations.count(OP_UPDATE)
+
+    @property
+    def delete_count(self):
+        return len(self.deletes)
+
+    @property
+    def has_deletes(self):
+        """是否有要刪除的檔案或資料夾"""
+        return bool(self.deletes or self.stale_dirs)
+
+
+@dataclass
+class MirrorResult(CopyResult):
+    """鏡像的結果 (刪除失敗的檔案也記錄在 failed_files)"""
+    deleted_count: int = 0
+    removed_dirs: int = 0
+
+
+def _sorted_entries(root, rules, workers, cache=None, dirs=None):
+    """走訪資料夾，回傳依比對鍵值排序的 [(鍵值, 完整路徑, 相對路徑, 大小, mtime_ns)]
+
+    dirs 為 list 時一併收集走訪到的子資料夾 (相對路徑)。
+    """
+    entries = []
+    for batch in walk_tree(root, rules, workers, cache, restat=cache is not None, dirs=dirs):
+        for path, relative_path, size, mtime_ns in batch:
+            # Windows 的路徑不分大小寫，比對時統一大小寫
+            entries.append((os.path.normcase(relative_path), path, relative_path, size, mtime_ns))
+    entries.sort()
+    return entries
+
+
+def plan_mirror(source_dir, dest_dir, rules=None, workers=DEFAULT_SCAN_WORKERS, prune_excluded=False, cache=None,
+                memory_budget=DEFAULT_MEMORY_BUDGET):
+    """比對來源與目標，回傳 MirrorPlan
+
+    prune_excluded 為 True 時，目標中被排除規則排除的檔案也會被刪除 (目標走訪時不套用規則)。
+    memory_budget 與 scan_files 相同，要複製的檔案清單超過時改寫到暫存檔。
+    """
+    plan = MirrorPlan(source_dir=source_dir, dest_dir=dest_dir,
+                      files=FilePlan(source_dir, dest_dir, memory_budget))
+    started = time.perf_counter()
+    source_dirs = []
+    dest_dirs = []
+    source = _sorted_entries(source_dir, rules, workers, cache, source_dirs)
+    dest = (_sorted_entries(dest_dir, None if prune_excluded else rules, workers, dirs=dest_dirs)
+            if os.path.isdir(dest_dir) else [])
+    scanned = time.perf_counter()
+
+    def add_copy(entry, operation):
+        _, _, relative_path, size, mtime_ns = entry
+        plan.files.append(relative_path, size, mtime_ns)
+        plan.operations.append(operation)
+        plan.total_bytes += size
+
+    def add_delete(entry):
+        _, dest_path, relative_path, size, _ = entry
+        if relative_path in PROTECTED_FILES:
+            return
+        plan.deletes.append((dest_path, size))
+        plan.delete_bytes += size
+
+    # 兩邊都已排序，同時往前推進即可一次比對完
+    i = j = 0
+    while i < len(source) and j < len(dest):
+        source_key, dest_key = source[i][0], dest[j][0]
+        if source_key < dest_key:
+            add_copy(source[i], OP_COPY)
+            i += 1
+        elif source_key > dest_key:
+            add_delete(dest[j])
+            j += 1
+        else:
+            # 複製時會保留修改時間，大小與時間都相同就視為未變更
+            if source[i][3:] == dest[j][3:]:
+                plan.unchanged_count += 1
+            else:
+                add_copy(source[i], OP_UPDATE)
+            i += 1
+            j += 1
+    for entry in source[i:]:
+        add_copy(entry, OP_COPY)
+    for entry in dest[j:]:
+        add_delete(entry)
+    plan.stale_dirs = _stale_dirs(dest_dir, source_dirs, dest_dirs, plan.deletes)
+    plan.files.finish()
+    plan.timings = {'scan': scanned - started, 'filter': time.perf_counter() - scanned}
+    return plan
+
+
+def _stale_dirs(dest_dir, source_dirs, dest_dirs, deletes):
+    """目標中來源沒有、且刪除檔案後會變成空的資料夾，由深到淺排序
+
+    仍有被排除而保留的內容的資料夾不列入，之後的比對不會一直有要刪除的項目。
+    """
+    source_keys = {os.path.normcase(directory) for directory in source_dirs}
+    dest_prefix = os.path.join(dest_dir, '')
+    removable = {path for path, _ in deletes}
+    stale = []
+    for directory in sorted(dest_dirs, key=len, reverse=True):
+        if os.path.normcase(directory) in source_keys:
+            continue
+        path = dest_prefix + directory
+        try:
+            with os.scandir(path) as it:
+                empty = all(entry.path in removable for entry in it)
+        except OSError:
+            continue
+        if empty:
+            removable.add(path)
+            stale.append(path)
+    return stale
+
+
+def _delete_batch(paths):
+    """刪除一批檔案，回傳 (成功數, [(路徑, 例外)])"""
+    deleted = 0
+    failed = []
+    for path in paths:
+        try:
+            os.unlink(path)
+            deleted += 1
+        except FileNotFoundError:
+            deleted += 1  # 已經不在了，結果相同
+        except OSError as e:
+            failed.append((path, e))
+    return deleted, failed
+
+
+def _remove_empty_dirs(dest_dir, deleted_paths):
+    """由深到淺移除刪除檔案後變成空的資料夾 (不會移除目標資料夾本身)，回傳移除數"""
+    root = os.path.normpath(dest_dir)
+    candidates = set()
+    for path in deleted_paths:
+        parent = os.path.dirname(path)
+        while parent and os.path.normpath(parent) != root and parent not in candidates:
+            candidates.add(parent)
+            parent = os.path.dirname(parent)
+    removed = 0
+    for directory in sorted(candidates, key=len, reverse=True):
+        try:
+            os.rmdir(directory)
+            removed += 1
+        except OSError:
+            pass  # 仍有檔案 (例如被排除而保留的內容)
+    return removed
+
+
+def _remove_stale_dirs(paths):
+    """由深到淺移除來源已不存在的資料夾 (paths 已由深到淺排序)，回傳移除數"""
+    removed = 0
+    for path in paths:
+        try:
+            os.rmdir(path)
+            removed += 1
+        except OSError:
+            pass  # 刪除檔案後已經移除，或比對後又有新的內容
+    return removed
+
+
+def _forget_deleted(dest_dir, deleted_paths):
+    """從目標的增量清單與校驗碼移除已刪除的檔案，避免之後的增量備份或驗證誤認為它們仍存在"""
+    prefix_len = len(os.path.join(dest_dir, ''))
+    keys = [manifest_key(path[prefix_len:]) for path in deleted_paths]
+    entries = load_manifest(dest_dir)
+    if entries:
+        for key in keys:
+            entries.pop(key, None)
+        save_manifest(dest_dir, entries)
+    algorithm, checksums = load_checksums(dest_dir)
+    if checksums:
+        update_checksums(dest_dir, algorithm, {}, removed_keys=keys)
+
+
+def run_mirror(plan, workers=DEFAULT_COPY_WORKERS, progress_callback=None, method=DEFAULT_COPY_METHOD,
+               buffer_size=DEFAULT_BUFFER_SIZE, resume=False, stats=None, **copy_options):
+    """執行鏡像計畫：先平行刪除多餘的檔案，再複製新增與變更的檔案，回傳 MirrorResult
+
+    先刪除再複製，在不分大小寫的檔案系統上只改了大小寫的檔名不會被誤刪。
+    刪除檔案後也移除來源已不存在的空資料夾。
+    progress_callback(已完成數, 總數) 的總數為刪除數加上複製數。
+    stats (RunStats) 與 copy_files 相同，刪除的耗時記在 'delete' 階段。
+    """
+    result = MirrorResult(stats=stats if stats is not None else RunStats.for_scan(plan))
+    worker_count = clamp_workers(workers)
+    delete_paths = [path for path, _ in plan.deletes]
+    total = len(delete_paths) + len(plan.files)
+
+    deleted = []
+    started = time.perf_counter()
+    if delete_paths:
+        batches = [delete_paths[k:k + DELETE_BATCH_SIZE] for k in range(0, len(delete_paths), DELETE_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=worker_count) as executor:
+            for batch, (count, failed) in zip(batches, executor.map(_delete_batch, batches)):
+                result.deleted_count += count
+                result.failed_files.extend(failed)
+                failed_paths = {path for path, _ in failed}
+                deleted.extend(path for path in batch if path not in failed_paths)
+                if progress_callback:
+                    progress_callback(result.deleted_count + len(result.failed_files), total)
+        result.removed_dirs = _remove_empty_dirs(plan.dest_dir, deleted)
+        _forget_deleted(plan.dest_dir, deleted)
+    if plan.stale_dirs:
+        result.removed_dirs += _remove_stale_dirs(plan.stale_dirs)
+    result.stats.add_time('delete', time.perf_counter() - started)
+
+    if plan.files:
+        offset = len(delete_paths)
+        copied = copy_files(plan, workers=worker_count, method=method, buffer_size=buffer_size, resume=resume,
+                            stats=result.stats,
+                            progress_callback=(lambda done, count: progress_callback(offset + done, total))
+                            if progress_callback else None,
+                            **copy_options)
+        result.copied_count = copied.copied_count
+        result.linked_count = copied.linked_count
+        result.methods = copied.methods
+        result.resumed_count = copied.resumed_count
+        result.retried_count = copied.retried_count
+        result.failed_files.extend(copied.failed_files)
+    else:
+        result.stats.finish()
+    return result
@@ -0,0 +1,246 @@
+"""串流模式：掃描與複製同時進行
+
+掃描執行緒把檔案放進有上限的佇列，複製執行緒邊取邊複製，
+第一個檔案在掃描剛開始時就會被複製，記憶體用量也不隨來源大小增加
+(增量模式仍需保留整份清單以便寫回)。
+"""
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+from .checksum import DEFAULT_CHECKSUM_ALGORITHM, ChecksumRecorder
+from .config import DEFAULT_COPY_WORKERS, DEFAULT_SCAN_WORKERS, clamp_workers
+from .copier import (CHUNK_PENDING, DEFAULT_CHUNK_SIZE, DEFAULT_LARGE_FILE_THRESHOLD, DEFAULT_RETRY_COUNT,
+                     DEFAULT_RETRY_DELAY, MAX_RETRY_QUEUE, ChunkedCopy, CopyResult, is_transient_error,
+                     make_file_copier, retry_transient)
+from .dirtree import DirectoryMaker, apply_directory_times, plan_directories
+from .fastcopy import CHUNKED_COPY_METHODS, DEFAULT_BUFFER_SIZE, DEFAULT_COPY_METHOD
+from .journal import CopyJournal
+from .manifest import hash_file, is_unchanged, load_manifest, manifest_key, save_manifest
+from .scanner import walk_tree
+from .stats import RunStats
+
+# 佇列上限：掃描比複製快時最多先排這麼多個檔案
+DEFAULT_QUEUE_SIZE = 10000
+# 回報進度的間隔 (秒)
+PROGRESS_INTERVAL = 0.1
+
+
+@dataclass
+class StreamResult(CopyResult):
+    """串流備份的結果 (除了複製結果外，也包含掃描到的數量)"""
+    total_files: int = 0      # 需要複製的檔案數
+    total_bytes: int = 0      # 需要複製的位元組數
+    unchanged_count: int = 0  # 增量模式下未變更而略過的檔案數
+
+
+def stream_backup(source_dir, dest_dir, rules=None, workers=DEFAULT_COPY_WORKERS,
+                  scan_workers=DEFAULT_SCAN_WORKERS, incremental=False, use_hash=False,
+                  progress_callback=None, queue_size=DEFAULT_QUEUE_SIZE, link_dest=None,
+                  method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE, cache=None, resume=False,
+                  retries=DEFAULT_RETRY_COUNT, retry_delay=DEFAULT_RETRY_DELAY, verify=False,
+                  checksum_algorithm=DEFAULT_CHECKSUM_ALGORITHM, stats=None,
+                  large_file_threshold=DEFAULT_LARGE_FILE_THRESHOLD, chunk_size=DEFAULT_CHUNK_SIZE,
+                  delta_threshold=None):
+    """邊掃描邊複製，回傳 StreamResult
+
+    progress_callback(已完成數, 目前發現的檔案數, 掃描是否結束) 在呼叫端執行緒中定期被呼叫；
+    掃描結束前「目前發現的檔案數」仍會持續增加。
+    指定 link_dest (上一個快照) 時，未變更的檔案以硬連結共用而不複製。
+    cache (ScanCache) 與 scan_files 相同，修改時間未變的資料夾直接使用快取內容。
+    resume、retries 與 copy_files 相同：記錄複製日誌以便續傳，暫時性錯誤在最後重試。
+    verify 與 copy_files 相同：複製的同時計算校驗碼並寫入目標資料夾。
+    stats (RunStats) 與 copy_files 相同；掃描途中總數會持續增加。
+    資料夾在第一次有檔案要放進去時才建立 (每個只建立一次)，結束後套用來源資料夾的修改時間。
+    large_file_threshold、chunk_size 與 copy_files 相同：大檔案的每一段各自排入佇列。
+    delta_threshold 與 copy_files 相同：目標已有舊版本的大檔案只改寫不同的區塊。
+    """
+    worker_count = clamp_workers(workers)
+    work_queue = queue.Queue(maxsize=queue_size)
+    result = StreamResult(stats=stats if stats is not None else RunStats())
+    stats = result.stats
+    lock = threading.Lock()
+    scan_finished = threading.Event()
+    scan_errors = []
+    # 增量模式：讀取上次備份留下的清單，並記錄本次掃描到的所有檔案
+    previous_manifest = load_manifest(dest_dir) if incremental else {}
+    entries = {}
+    dest_prefix = os.path.join(dest_dir, '')
+    done_count = 0
+    copy = make_file_copier(method, buffer_size, link_dest, stats, create_dirs=False, delta_threshold=delta_threshold)
+    directories = DirectoryMaker(dest_dir)
+    journal = CopyJournal(dest_dir, source_dir) if resume else None
+    resumable = journal is not None and len(journal) > 0
+    checksums = ChecksumRecorder(dest_dir, checksum_algorithm, link_dest) if verify else None
+    retry_queue = []
+    chunk_threshold = (max(large_file_threshold, chunk_size) if large_file_threshold and worker_count > 1
+                       and checksums is None and method in CHUNKED_COPY_METHODS else None)
+
+    def scan_thread():
+        started = time.perf_counter()
+        filter_seconds = 0.0
+        waiting = 0.0  # 佇列滿時等待複製的時間
+        try:
+            for batch in walk_tree(source_dir, rules, scan_workers, cache, restat=incremental):
+                batch_started = time.perf_counter()
+                batch_waiting = waiting
+                for source_path, relative_path, size, mtime_ns in batch:
+                    key = None
+                    if incremental:
+                        key = manifest_key(relative_path)
+                        same, file_hash = is_unchanged(source_path, size, mtime_ns,
+                                                       previous_manifest.get(key), use_hash)
+                        entries[key] = [size, mtime_ns, file_hash]
+                        if same:
+                            result.unchanged_count += 1
+                            continue
+                    result.total_files += 1
+                    result.total_bytes += size
+                    stats.add_total(size)
+                    if resumable and journal.is_done(source_path, relative_path):
+                        result.resumed_count += 1  # 續傳：先前的執行已完成
+                        stats.skip(size)
+                        continue
+                    put_started = time.perf_counter()
+                    item = (source_path, relative_path, key, size, mtime_ns)
+                    if chunk_threshold is not None and size > chunk_threshold:
+                        # 大檔案：每一段各自排入佇列，由不同的複製執行緒同時處理
+                        job = ChunkedCopy(source_path, dest_prefix + relative_path, size, method, buffer_size,
+                                          chunk_size, os.path.join(link_dest, relative_path) if link_dest else None,
+                                          stats, False, delta=not link_dest and delta_threshold is not None
+                                          and size >= delta_threshold)
+                        for index in range(job.chunk_count):
+                            work_queue.put(item + (job, index))
+                    else:
+                        work_queue.put(item)
+                    waiting += time.perf_counter() - put_started
+                filter_seconds += time.perf_counter() - batch_started - (waiting - batch_waiting)
+        except Exception as e:
+            scan_errors.append(e)
+        finally:
+            # 掃描與複製同時進行，掃描時間為掃描執行緒經過的時間 (不含比對與等待佇列)
+            stats.add_time('filter', filter_seconds)
+            stats.add_time('scan', time.perf_counter() - started - filter_seconds - waiting)
+            scan_finished.set()
+            # 每個複製執行緒一個結束記號
+            for _ in range(worker_count):
+                work_queue.put(None)
+
+    def copy_thread():
+        nonlocal done_count
+        while True:
+            item = work_queue.get()
+            if item is None:
+                break
+            try:
+                used = copy_item(item)
+                error = None
+            except Exception as e:
+                error = e
+            if error is None and used is CHUNK_PENDING:  # 大檔案還有其他段未完成
+                continue
+            item = item[:5]
+            with lock:
+                if error is None:
+                    finish(item, used)
+                elif retries > 0 and is_transient_error(error) and len(retry_queue) < MAX_RETRY_QUEUE:
+                    retry_queue.append(item)  # 檔案被鎖住：全部完成後再試
+                    continue
+                else:
+                    fail(item, error)
+                done_count += 1
+
+    def copy_item(item):
+        src_path, relative_path, key, size, _ = item[:5]
+        dest_path = dest_prefix + relative_path
+        started = time.perf_counter()
+        directories.ensure(os.path.dirname(relative_path))
+        stats.add_time('mkdir', time.perf_counter() - started)
+        if len(item) > 5:  # 大檔案的一段
+            job, index = item[5:]
+            used = job.run(index)
+            if used is not CHUNK_PENDING:
+                record_hash(key, src_path, None)
+            return used
+        started = time.perf_counter()
+        try:
+            if checksums is None:
+                used = copy(src_path, dest_path, relative_path, size=size)
+                digest = None
+            else:
+                hasher = checksums.hasher()
+                used = copy(src_path, dest_path, relative_path, hasher, size)
+                digest = checksums.record(relative_path, dest_path, hasher, used)
+        except BaseException:
+            stats.file_failed()
+            raise
+        if used == 'hardlink':
+            stats.skip(size)  # 沒有複製任何內容，不計入速度
+        else:
+            stats.file_done(size, time.perf_counter() - started)
+        record_hash(key, src_path, digest)
+        return used
+
+    def record_hash(key, src_path, digest):
+        if key is not None and use_hash:
+            # 校驗碼與清單同樣使用 blake2b 時直接沿用，不必再讀一次來源
+            reuse = digest is not None and checksum_algorithm == 'blake2b'
+            entries[key][2] = digest if reuse else hash_file(src_path)
+
+    def finish(item, used):
+        result.record_method(used)
+        if journal is not None:
+            journal.record(item[1], item[3], item[4])
+
+    def fail(item, error):
+        result.failed_files.append((item[0], error))
+        if item[2] is not None:
+            # 失敗的檔案不寫入清單，下次會重新複製
+            entries.pop(item[2], None)
+
+    if journal is not None:
+        journal.start()
+    threads = [threading.Thread(target=scan_thread, daemon=True)]
+    threads += [threading.Thread(target=copy_thread, daemon=True) for _ in range(worker_count)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        # 呼叫端執行緒負責定期回報進度，直到所有執行緒結束
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(PROGRESS_INTERVAL)
+                if progress_callback:
+                    progress_callback(result.resumed_count + done_count, result.total_files, scan_finished.is_set())
+
+        if retry_queue:
+            succeeded, failed = retry_transient(retry_queue, copy_item, retries, retry_delay)
+            for item, used in succeeded:
+                finish(item, used)
+            for item, error in failed:
+                fail(item, error)
+            result.retried_count = len(succeeded)
+            done_count += len(retry_queue)
+        if progress_callback:
+            progress_callback(result.resumed_count + done_count, result.total_files, True)
+    finally:
+        if journal is not None:
+            journal.close(finished=not scan_errors and not result.failed_files
+                          and result.copied_count + result.resumed_count == result.total_files)
+        stats.finish()
+
+    if scan_errors:
+        raise scan_errors[0]
+
+    # 清單只記錄已成功備份的檔案
+    if incremental and entries:
+        save_manifest(dest_dir, entries)
+    if checksums is not None:
+        checksums.save()
+    started = time.perf_counter()
+    apply_directory_times(source_dir, dest_dir, plan_directories(directories.created), worker_count)
+    stats.add_time('metadata', time.perf_counter() - started)
+
+    return result
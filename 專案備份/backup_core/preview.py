@@ -0,0 +1,109 @@
+"""檔案預覽的索引：依資料夾分組、統計每個資料夾的檔案數與大小，並支援快速篩選
+
+索引在建立時一次算好相對路徑、排序與小寫搜尋字串；預覽視窗只取出目前看得到的幾十列，
+即使有幾十萬個檔案也不需要把每一列都放進 Listbox。
+鏡像計畫 (MirrorPlan) 的每個檔案另外標示新增 / 更新 / 刪除，可用這些字搜尋。
+"""
+import os
+from array import array
+
+from .mirror import OP_COPY, OP_DELETE, OP_UPDATE, MirrorPlan
+from .utils import format_size
+
+# 鏡像模式各種操作在預覽中的標示
+OPERATION_LABELS = {OP_COPY: '新增', OP_UPDATE: '更新', OP_DELETE: '刪除'}
+
+
+class PreviewIndex:
+    """預覽用的索引 (由 ScanResult 建立，建立後不再改變)"""
+
+    def __init__(self, scan):
+        # 檔案清單本身就以相對路徑保存，依順序讀出即可 (清單寫到磁碟時也一樣)
+        paths = []
+        self.sizes = array('q')
+        for relative_path, size, _ in scan.files.iter_entries():
+            paths.append(relative_path)
+            self.sizes.append(size)
+        self.labels = None  # 鏡像模式：每個檔案的操作標示
+        if isinstance(scan, MirrorPlan):
+            prefix_len = len(os.path.join(scan.dest_dir, ''))
+            paths += [dest[prefix_len:] for dest, _ in scan.deletes]
+            self.sizes.extend(size for _, size in scan.deletes)
+            self.labels = [OPERATION_LABELS[op] for op in scan.operations] + [OPERATION_LABELS[OP_DELETE]] * len(scan.deletes)
+        dir_ids = {}
+        self.dirs = []   # 資料夾相對路徑 ('' 為來源資料夾本身)
+        self.names = []  # 檔名
+        file_dirs = []
+        for path in paths:
+            directory, _, name = path.rpartition(os.sep)
+            dir_id = dir_ids.get(directory)
+            if dir_id is None:
+                dir_id = dir_ids[directory] = len(self.dirs)
+                self.dirs.append(directory)
+            file_dirs.append(dir_id)
+            self.names.append(name)
+        self.file_dirs = file_dirs
+        # 依資料夾、檔名排序，同一個資料夾的檔案排在一起
+        dir_rank = {dir_id: rank for rank, dir_id in enumerate(sorted(range(len(self.dirs)), key=self.dirs.__getitem__))}
+        self.order = sorted(range(len(paths)), key=lambda i: (dir_rank[file_dirs[i]], self.names[i]))
+        if self.labels is None:
+            self._search_text = [path.lower() for path in paths]
+        else:
+            self._search_text = [f"{label} {path}".lower() for label, path in zip(self.labels, paths)]
+        self._last_query = ''
+        self._last_matches = self.order
+
+    def __len__(self):
+        return len(self.names)
+
+    def relative_path(self, index):
+        directory = self.dirs[self.file_dirs[index]]
+        return directory + os.sep + self.names[index] if directory else self.names[index]
+
+    def search(self, query):
+        """回傳符合關鍵字 (不分大小寫，比對相對路徑) 的檔案，依顯示順序排列
+
+        新關鍵字是上一次的延伸 (繼續輸入) 時只在上一次的結果裡篩選，輸入時幾乎不需要等待。
+        """
+        query = query.strip().lower()
+        if not query:
+            matches = self.order
+        else:
+            base = self._last_matches if self._last_query and query.startswith(self._last_query) else self.order
+            text = self._search_text
+            matches = [i for i in base if query in text[i]]
+        self._last_query = query
+        self._last_matches = matches
+        return matches
+
+    def build_rows(self, matches):
+        """將檔案依資料夾分組成顯示列，回傳 (列, 各資料夾統計)
+
+        列為整數：檔案為其索引，資料夾標題列為 ~資料夾編號 (負數)。
+        統計為 {資料夾編號: [檔案數, 位元組數]}，只計算符合篩選條件的檔案。
+        """
+        rows = []
+        stats = {}
+        current = None
+        sizes = self.sizes
+        file_dirs = self.file_dirs
+        for i in matches:
+            dir_id = file_dirs[i]
+            if dir_id != current:
+                current = dir_id
+                rows.append(~dir_id)
+                stats[dir_id] = [0, 0]
+            rows.append(i)
+            entry = stats[dir_id]
+            entry[0] += 1
+            entry[1] += sizes[i]
+        return rows, stats
+
+    def format_row(self, row, stats):
+        """顯示列的文字"""
+        if row < 0:
+            dir_id = ~row
+            count, total = stats[dir_id]
+            return f"[{self.dirs[dir_id] or '.'}{os.sep}]  {count} 個檔案，{format_size(total)}"
+        label = f"[{self.labels[row]}] " if self.labels is not None else ""
+        return f"      {label}{self.names[row]}  ({format_size(self.sizes[row])})"
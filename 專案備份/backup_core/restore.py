@@ -0,0 +1,165 @@
+"""還原：從時間戳記快照 (或目標資料夾本身) 平行取回選取的檔案
+
+選取的項目可以是相對路徑 (檔案或資料夾，只走訪這些位置) 或 gitignore 格式的萬用字元
+(例如 src/**/*.js，需要走訪整個快照)。還原目標中大小與修改時間都與快照相同的檔案視為完整而略過，
+還原到只有部分損壞的專案時只需要寫入有差異的檔案。
+計畫與備份的掃描結果 (ScanResult) 相同，實際複製交給 copier.copy_files 平行處理。
+備份內的增量清單列出、但備份中找不到的檔案 (只保存變更檔案的不完整快照) 會讓還原直接失敗，
+不會默默還原出缺少檔案的專案。
+"""
+import os
+import stat
+import time
+
+from .checksum import CHECKSUM_FILE
+from .config import DEFAULT_SCAN_WORKERS
+from .copier import PARTIAL_SUFFIX
+from .exclusion import ExclusionRules
+from .fileplan import DEFAULT_MEMORY_BUDGET, FilePlan
+from .journal import JOURNAL_FILE
+from .manifest import MANIFEST_FILE, load_manifest, manifest_key
+from .scanner import ScanResult, validate_paths, walk_tree
+from .snapshot import list_snapshots
+
+# 備份工具自己寫在快照最上層的檔案，不還原 (中斷的複製留下的暫存檔 PARTIAL_SUFFIX 也不還原)
+TOOL_FILES = frozenset((MANIFEST_FILE, CHECKSUM_FILE, JOURNAL_FILE))
+_GLOB_CHARS = frozenset('*?[')
+_MISSING_EXAMPLES = 5  # 錯誤訊息中列出的缺少檔案數
+
+
+def list_restore_points(base_dest_dir):
+    """可還原的備份，回傳 [(名稱, 路徑)]：時間戳記快照由舊到新 (名稱為時間戳記)，最後是目標資料夾本身 (名稱為 '')"""
+    points = list_snapshots(base_dest_dir)
+    if base_dest_dir and os.path.isdir(base_dest_dir):
+        points.append(('', base_dest_dir))
+    return points
+
+
+def find_restore_point(base_dest_dir, name=None):
+    """依名稱 (時間戳記) 或路徑找出要還原的備份；未指定時使用最新的快照 (沒有快照時為目標資料夾本身)"""
+    if name and os.path.isdir(name):
+        return name
+    points = list_restore_points(base_dest_dir)
+    if not points:
+        raise ValueError(f"找不到可還原的備份：{base_dest_dir}")
+    if not name:
+        snapshots = [path for timestamp, path in points if timestamp]
+        return snapshots[-1] if snapshots else points[-1][1]
+    for timestamp, path in points:
+        if timestamp == name or os.path.basename(path) == name:
+            return path
+    raise ValueError(f"找不到快照：{name}")
+
+
+class RestoreSelection:
+    """要還原的項目：相對路徑或 gitignore 格式的萬用字元 (沒有任何項目時為全部)"""
+
+    def __init__(self, patterns=None):
+        self.paths = []
+        globs = []
+        for pattern in patterns or ():
+            pattern = pattern.strip()
+            if not pattern:
+                continue
+            if pattern.startswith('!') or _GLOB_CHARS.intersection(pattern):
+                globs.append(pattern)
+            else:
+                path = os.path.normpath(pattern.replace('/', os.sep)).strip(os.sep)
+                self.paths.append('' if path == '.' else path)
+        self.rules = ExclusionRules(patterns=globs) if globs else None
+        self._selected_dirs = {'': False}
+
+    @property
+    def select_all(self):
+        return not self.paths and self.rules is None
+
+    def roots(self):
+        """需要走訪的位置 (相對路徑，'' 為整個快照)；有萬用字元時必須走訪整個快照"""
+        if self.rules is not None or '' in self.paths or not self.paths:
+            return ['']
+        roots = []
+        for path in sorted(set(self.paths)):
+            if not roots or not path.startswith(roots[-1] + os.sep):
+                roots.append(path)
+        return roots
+
+    def _dir_selected(self, directory):
+        """資料夾本身或上層資料夾符合萬用字元 (結果快取，同一個資料夾只比對一次)"""
+        selected = self._selected_dirs.get(directory)
+        if selected is None:
+            selected = (self._dir_selected(os.path.dirname(directory))
+                        or self.rules.is_excluded(directory, True))
+            self._selected_dirs[directory] = selected
+        return selected
+
+    def matches(self, relative_path):
+        """檔案是否要還原"""
+        if self.select_all:
+            return True
+        for path in self.paths:
+            if not path or relative_path == path or relative_path.startswith(path + os.sep):
+                return True
+        if self.rules is None:
+            return False
+        return self.rules.is_excluded(relative_path, False) or self._dir_selected(os.path.dirname(relative_path))
+
+
+def _walk_root(base_dir, root, workers):
+    """走訪 base_dir 中的 root (相對路徑，'' 為整個資料夾)，產生 (相對路徑, 大小, mtime_ns)"""
+    if not root:
+        for batch in walk_tree(base_dir, workers=workers):
+            for _, relative_path, size, mtime_ns in batch:
+                yield relative_path, size, mtime_ns
+        return
+    path = os.path.join(base_dir, root)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return
+    if stat.S_ISREG(st.st_mode):
+        yield root, st.st_size, st.st_mtime_ns
+    elif stat.S_ISDIR(st.st_mode):
+        for batch in walk_tree(path, workers=workers, rel_prefix=root + os.sep):
+            for _, relative_path, size, mtime_ns in batch:
+                yield relative_path, size, mtime_ns
+
+
+def plan_restore(backup_dir, target_dir, patterns=None, workers=DEFAULT_SCAN_WORKERS,
+                 memory_budget=DEFAULT_MEMORY_BUDGET):
+    """比對備份與還原目標，回傳需要還原的檔案 (ScanResult，source_dir 為備份、dest_dir 為還原目標)
+
+    patterns 為要還原的相對路徑或萬用字元 (None 為全部)。目標中大小與修改時間都相同的檔案不列入，
+    數量記在 unchanged_count。備份以多個執行緒走訪，目標只逐一查詢選取的檔案，
+    不另外保存目標的檔案表，記憶體用量只有 memory_budget 限制的還原清單。
+    備份的增量清單中有選取的檔案不在備份內時引發 ValueError。
+    """
+    validate_paths(backup_dir, target_dir)
+    selection = RestoreSelection(patterns)
+    expected = {key for key in load_manifest(backup_dir) if selection.matches(key.replace('/', os.sep))}
+    started = time.perf_counter()
+    files = FilePlan(backup_dir, target_dir, memory_budget)
+    result = ScanResult(source_dir=backup_dir, dest_dir=target_dir, files=files)
+    target_prefix = files.dest_prefix
+    for root in selection.roots():
+        for relative_path, size, mtime_ns in _walk_root(backup_dir, root, workers):
+            expected.discard(manifest_key(relative_path))
+            if (relative_path in TOOL_FILES or relative_path.endswith(PARTIAL_SUFFIX)
+                    or not selection.matches(relative_path)):
+                continue
+            try:
+                st = os.stat(target_prefix + relative_path)
+            except OSError:
+                st = None
+            if st is not None and stat.S_ISREG(st.st_mode) and (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+                result.unchanged_count += 1
+                continue
+            files.append(relative_path, size, mtime_ns)
+            result.total_bytes += size
+    files.finish()
+    if expected:
+        files.close()
+        missing = '、'.join(sorted(expected)[:_MISSING_EXAMPLES])
+        raise ValueError(f"備份 {backup_dir} 不完整：清單中的 {len(expected)} 個檔案不在備份內 (例如 {missing})，"
+                         "請改從其他快照還原")
+    result.timings['scan'] = time.perf_counter() - started
+    return result
@@ -0,0 +1,107 @@
+"""掃描快取：記住每個來源資料夾讀取到的內容，以資料夾的修改時間判斷是否需要重新讀取
+
+新增、刪除或改名檔案都會改變所在資料夾的修改時間，因此修改時間未變的資料夾可以直接使用
+上次的內容，只需要一次 stat，不必再 scandir 與 stat 底下每個檔案。快取保存完整的資料夾內容
+(不含排除規則)，修改排除規則或切換完整/排除模式時只是對同一份內容重新篩選。
+可選擇寫到磁碟，讓下次啟動或命令列執行也能沿用。
+"""
+import json
+import os
+import threading
+
+from .scanner import read_directory
+
+SCAN_CACHE_VERSION = 1
+
+
+class ScanCache:
+    """來源資料夾內容的快取，可安全地在多個掃描執行緒間共用"""
+
+    def __init__(self, source_dir=None):
+        self.source_dir = source_dir
+        self._dirs = {}  # {相對路徑前綴: (資料夾 mtime_ns, (檔案, 子資料夾))}
+        self._lock = threading.Lock()
+        self.hits = 0    # 直接使用快取的資料夾數
+        self.misses = 0  # 重新讀取的資料夾數
+
+    def __len__(self):
+        return len(self._dirs)
+
+    def bind(self, source_dir):
+        """切換到另一個來源資料夾時清空快取"""
+        with self._lock:
+            if self.source_dir != source_dir:
+                self.source_dir = source_dir
+                self._dirs = {}
+            self.hits = self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._dirs = {}
+
+    def listing(self, path, rel_prefix):
+        """取得資料夾內容，回傳 (內容或 None, 是否來自快取)"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        cached = self._dirs.get(rel_prefix)
+        if cached is not None and mtime_ns is not None and cached[0] == mtime_ns:
+            with self._lock:
+                self.hits += 1
+            return cached[1], True
+
+        listing = read_directory(path)
+        with self._lock:
+            self.misses += 1
+            if listing is None or mtime_ns is None:
+                self._dirs.pop(rel_prefix, None)
+            else:
+                self._dirs[rel_prefix] = (mtime_ns, listing)
+            if cached is not None:
+                self._drop_removed(rel_prefix, cached[1], listing)
+        return listing, False
+
+    def _drop_removed(self, rel_prefix, old_listing, new_listing):
+        """移除已經不存在的子資料夾 (及其底下所有層) 的快取"""
+        remaining = {name for name, _ in new_listing[1]} if new_listing else set()
+        removed = [rel_prefix + name + os.sep for name, _ in old_listing[1] if name not in remaining]
+        if removed:
+            removed = tuple(removed)
+            for key in [key for key in self._dirs if key.startswith(removed)]:
+                del self._dirs[key]
+
+    @classmethod
+    def load(cls, path, source_dir):
+        """讀取磁碟上的快取，來源資料夾不同、不存在或格式錯誤時回傳空的快取"""
+        cache = cls(source_dir)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cache
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"讀取掃描快取 {path} 時發生錯誤: {e}")
+            return cache
+        if (not isinstance(data, dict) or data.get('version') != SCAN_CACHE_VERSION
+                or data.get('source_dir') != source_dir):
+            return cache
+        # JSON 以 '/' 分隔保存，讀回時轉成系統分隔符號
+        for key, (mtime_ns, files, dirs) in data.get('dirs', {}).items():
+            cache._dirs[key.replace('/', os.sep)] = (
+                mtime_ns,
+                ([tuple(f) for f in files], [(name, bool(is_symlink)) for name, is_symlink in dirs]),
+            )
+        return cache
+
+    def save(self, path):
+        """寫入磁碟 (先寫暫存檔再取代，避免中斷時留下半個檔案)"""
+        with self._lock:
+            dirs = {key.replace(os.sep, '/'): [mtime_ns, files, dirs]
+                    for key, (mtime_ns, (files, dirs)) in self._dirs.items()}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': SCAN_CACHE_VERSION, 'source_dir': self.source_dir, 'dirs': dirs},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, path)
@@ -0,0 +1,43 @@
+"""時間戳記快照的硬連結去重 (類似 rsync --link-dest)
+
+新快照中與上一個快照相同 (大小與修改時間一致) 的檔案直接建立硬連結，
+只有變更過的檔案才實際複製，頻繁快照幾乎不佔額外空間與時間。
+實際的連結/複製由 copier.link_or_copy 處理，這裡負責找出上一個快照。
+"""
+import os
+import re
+
+
+def snapshot_pattern(base_dest_dir):
+    """依基礎目標路徑建立比對快照資料夾名稱的正規表示式 (與 get_actual_dest_dir 的命名一致)"""
+    base_name, ext = os.path.splitext(os.path.basename(base_dest_dir))
+    return re.compile(re.escape(base_name) + r"_(\d{8}_\d{6})" + re.escape(ext) + r"$")
+
+
+def list_snapshots(base_dest_dir):
+    """列出基礎目標路徑旁的所有時間戳記快照，回傳 [(時間戳記, 路徑)]，由舊到新排序"""
+    if not base_dest_dir:
+        return []
+    parent = os.path.dirname(base_dest_dir) or '.'
+    pattern = snapshot_pattern(base_dest_dir)
+    snapshots = []
+    try:
+        with os.scandir(parent) as it:
+            for entry in it:
+                match = pattern.match(entry.name)
+                if match and entry.is_dir():
+                    snapshots.append((match.group(1), entry.path))
+    except OSError:
+        return []
+    snapshots.sort()
+    return snapshots
+
+
+def find_previous_snapshot(base_dest_dir, current_dest_dir=None):
+    """找出最新的一個既有快照 (排除本次要建立的快照)，沒有時回傳 None"""
+    current = os.path.normcase(os.path.abspath(current_dest_dir)) if current_dest_dir else None
+    for _, path in reversed(list_snapshots(base_dest_dir)):
+        if os.path.normcase(os.path.abspath(path)) != current:
+            return path
+    return None
+
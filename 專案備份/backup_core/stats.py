@@ -0,0 +1,178 @@
+"""執行統計：已複製的位元組數、傳輸速度、各階段耗時與單一檔案複製時間的分布
+
+進度以位元組計算，一個 4 GB 的影片與一個 1 KB 的設定檔不再佔進度條相同的比例；
+大檔案在複製途中也會逐段回報 (見 fastcopy.copy_file_fast 的 stats 參數)。
+每次執行的統計可寫成 JSON 檔，比較不同次備份的速度以找出效能退步。
+"""
+import bisect
+import datetime
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# 各階段：掃描 (走訪與套用排除規則)、增量比對、建立資料夾、複製內容、設定權限與時間、鏡像模式的刪除
+PHASES = ('scan', 'filter', 'mkdir', 'copy', 'metadata', 'delete')
+# 單一檔案複製時間分布的上限 (秒)，最後一格為超過最大值的檔案
+LATENCY_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0)
+LATENCY_LABELS = ('<1ms', '<10ms', '<100ms', '<1s', '<10s', '>=10s')
+# 瞬間速度的計算區間 (秒)
+THROUGHPUT_WINDOW = 2.0
+# 統計檔名的時間格式 (與時間戳記快照相同)
+STATS_FILE_FORMAT = "stats_%Y%m%d_%H%M%S"
+
+
+class RunStats:
+    """一次備份的執行統計，可安全地在多個複製執行緒間共用
+
+    mkdir、copy、metadata 三個階段是各複製執行緒耗時的總和 (平行時會大於實際經過的時間)。
+    """
+
+    def __init__(self, total_files=0, total_bytes=0, timings=None):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files_done = 0     # 已複製的檔案數
+        self.bytes_done = 0     # 已複製的位元組數 (含大檔案複製到一半的部分)
+        self.files_skipped = 0  # 續傳時略過或以硬連結共用而不必複製的檔案數
+        self.bytes_skipped = 0
+        self.delta_files = 0    # 以差異傳輸更新的檔案數
+        self.delta_bytes = 0    # 這些檔案的大小
+        self.delta_written = 0  # 其中實際寫入的位元組數
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.phases.update(timings or {})
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.started = time.monotonic()
+        self.finished = None
+        self._lock = threading.Lock()
+        self._partial = threading.local()  # 各執行緒目前檔案已回報的位元組數
+        self._samples = deque([(self.started, 0)])
+
+    @classmethod
+    def for_scan(cls, scan):
+        """依掃描結果 (ScanResult) 建立，沿用掃描階段的耗時"""
+        return cls(scan.total_files, scan.total_bytes, scan.timings)
+
+    def add_total(self, size):
+        """串流模式：掃描發現新檔案時增加總數"""
+        with self._lock:
+            self.total_files += 1
+            self.total_bytes += size
+
+    def add_time(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] += seconds
+
+    def add_bytes(self, count):
+        """回報複製中的檔案已寫入的位元組數 (在複製執行緒中呼叫)"""
+        self._partial.bytes = getattr(self._partial, 'bytes', 0) + count
+        with self._lock:
+            self.bytes_done += count
+
+    def add_chunk_bytes(self, count):
+        """分段平行複製的大檔案回報某一段已寫入的位元組數 (各段在不同執行緒，不計入執行緒目前的檔案)"""
+        with self._lock:
+            self.bytes_done += count
+
+    def file_done(self, size, seconds, reported=None):
+        """一個檔案複製完成 (在複製該檔案的執行緒中呼叫)，補上未逐段回報的位元組
+
+        reported 為已以 add_chunk_bytes 回報的位元組數 (分段複製的大檔案)。
+        """
+        if reported is None:
+            reported = getattr(self._partial, 'bytes', 0)
+            self._partial.bytes = 0
+        bucket = bisect.bisect_right(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size - reported
+            self.histogram[bucket] += 1
+
+    def file_failed(self, reported=None):
+        """複製失敗：扣除已回報的部分 (在複製該檔案的執行緒中呼叫；reported 與 file_done 相同)"""
+        if reported is None:
+            reported = getattr(self._partial, 'bytes', 0)
+            self._partial.bytes = 0
+        if reported:
+            with self._lock:
+                self.bytes_done -= reported
+
+    def delta_done(self, size, written):
+        """記錄一個以差異傳輸更新的檔案 (另外呼叫 file_done 計入進度)"""
+        with self._lock:
+            self.delta_files += 1
+            self.delta_bytes += size
+            self.delta_written += written
+
+    def skip(self, size):
+        """續傳時略過的已完成檔案或與上一個快照共用的硬連結 (計入進度，不計入速度)"""
+        with self._lock:
+            self.files_skipped += 1
+            self.bytes_skipped += size
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def current_rate(self):
+        """最近 THROUGHPUT_WINDOW 秒的傳輸速度 (位元組/秒)"""
+        now = time.monotonic()
+        with self._lock:
+            samples = self._samples
+            samples.append((now, self.bytes_done))
+            while len(samples) > 2 and now - samples[1][0] >= THROUGHPUT_WINDOW:
+                samples.popleft()
+            first_time, first_bytes = samples[0]
+            current_bytes = self.bytes_done
+        return (current_bytes - first_bytes) / (now - first_time) if now > first_time else 0.0
+
+    def snapshot(self):
+        """目前的統計數字 (dict，可直接輸出為 JSON)"""
+        elapsed = self.elapsed
+        average = self.bytes_done / elapsed if elapsed > 0 else 0.0
+        current = self.current_rate() if self.finished is None else average
+        progress_bytes = self.bytes_done + self.bytes_skipped
+        remaining = max(0, self.total_bytes - progress_bytes)
+        rate = current or average
+        return {
+            'total_files': self.total_files,
+            'total_bytes': self.total_bytes,
+            'files_done': self.files_done,
+            'bytes_done': self.bytes_done,
+            'files_skipped': self.files_skipped,
+            'bytes_skipped': self.bytes_skipped,
+            'delta_files': self.delta_files,
+            'delta_bytes': self.delta_bytes,
+            'delta_bytes_written': self.delta_written,
+            'elapsed_seconds': round(elapsed, 3),
+            'average_mb_per_second': round(average / 1e6, 2),
+            'current_mb_per_second': round(current / 1e6, 2),
+            'files_per_second': round(self.files_done / elapsed, 1) if elapsed > 0 else 0.0,
+            'eta_seconds': round(remaining / rate, 1) if rate > 0 and self.finished is None else None,
+            'phase_seconds': {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            'latency_histogram': dict(zip(LATENCY_LABELS, self.histogram)),
+        }
+
+
+def save_run_stats(stats_dir, stats, info=None):
+    """將一次執行的統計寫入 stats_dir (每次一個檔案)，回傳檔案路徑
+
+    info 為額外記錄的內容 (例如來源、目標與備份模式)，與統計數字合併寫入。
+    """
+    os.makedirs(stats_dir, exist_ok=True)
+    now = datetime.datetime.now()
+    base = os.path.join(stats_dir, now.strftime(STATS_FILE_FORMAT))
+    path = base + ".json"
+    suffix = 2
+    while os.path.exists(path):  # 同一秒內執行多次
+        path = f"{base}_{suffix}.json"
+        suffix += 1
+    data = {'timestamp': now.isoformat(timespec='seconds')}
+    data.update(info or {})
+    data.update(stats.snapshot())
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
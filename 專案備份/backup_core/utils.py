@@ -0,0 +1,10 @@
+"""共用的小工具函式"""
+
+
+def format_size(num_bytes):
+    """將位元組數轉為易讀的字串 (例如 1.5 GB)"""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
@@ -0,0 +1,453 @@
+"""持續同步 (監看模式)：先完整同步一次，之後只複製有變更的檔案，讓目標幾乎即時跟上來源
+
+Linux 上以 inotify 監看來源中每個未被排除的資料夾，被排除的資料夾 (例如 node_modules)
+根本不會加入監看，npm install 之類的大量變動不會產生任何工作；其他系統或 inotify 無法使用時
+改為定期掃描 (使用掃描快取，只重新讀取修改時間改變的資料夾)。
+變動會先累積，安靜 debounce 秒 (或最久 max_delay 秒) 後才合併成一輪同步，
+git checkout 等一次改動上千個檔案的操作只會觸發一輪，並分成小批複製。
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+
+from .checksum import DEFAULT_CHECKSUM_ALGORITHM
+from .config import DEFAULT_COPY_WORKERS, DEFAULT_SCAN_WORKERS
+from .copier import DEFAULT_LARGE_FILE_THRESHOLD, DEFAULT_RETRY_COUNT, DEFAULT_RETRY_DELAY, copy_files
+from .fastcopy import DEFAULT_BUFFER_SIZE, DEFAULT_COPY_METHOD
+from .fileplan import FilePlan
+from .manifest import load_manifest, manifest_key, save_manifest
+from .mirror import _delete_batch, _forget_deleted, _remove_empty_dirs, plan_mirror, run_mirror
+from .scancache import ScanCache
+from .scanner import ScanResult, directory_rules, read_directory, walk_tree
+
+# 變動停止多久 (秒) 後才同步
+DEFAULT_DEBOUNCE = 2.0
+# 持續有變動時最久等待多久 (秒) 就先同步一次
+DEFAULT_MAX_DELAY = 30.0
+# 無法使用 inotify 時重新掃描的間隔 (秒)
+DEFAULT_POLL_INTERVAL = 5.0
+# 每一批複製的檔案數
+WATCH_BATCH_SIZE = 500
+# 等待事件時最多等待多久 (秒) 就檢查一次是否要停止
+_TICK = 0.5
+
+# inotify 的事件旗標 (見 <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 256 * 1024
+
+# 事件種類：單一檔案、整個資料夾 (新增、移入、刪除或 .gitignore 改變)、全部重新比對 (事件遺失)
+CHANGE_FILE = 'file'
+CHANGE_DIR = 'dir'
+CHANGE_RESCAN = 'rescan'
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch  # 確認函式存在
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyWatcher:
+    """以 inotify 監看來源中未被排除的資料夾
+
+    read(timeout) 回傳 [(種類, 相對路徑, 上層適用的規則)]，種類為 CHANGE_FILE / CHANGE_DIR / CHANGE_RESCAN。
+    """
+
+    def __init__(self, source_dir, rules=None):
+        self.source_dir = source_dir
+        self.rules = rules
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "此系統不支援 inotify")
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._dirs = {}      # {wd: (相對路徑前綴, 上層適用的規則, 這個資料夾內容適用的規則)}
+        self._prefixes = {}  # {相對路徑前綴: wd}
+        self.failed_watches = 0
+        try:
+            self._watch_tree(source_dir, '', rules, strict=True)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path, rel_prefix, rules_in, rules, strict):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if strict or err == errno.ENOSPC:
+                # 監看數量超過 fs.inotify.max_user_watches：第一次時改用定期掃描，之後只能略過
+                if strict:
+                    raise OSError(err, f"無法監看資料夾 {path}: {os.strerror(err)}")
+                self.failed_watches += 1
+            return
+        self._dirs[wd] = (rel_prefix, rules_in, rules)
+        self._prefixes[rel_prefix] = wd
+
+    def _watch_tree(self, path, rel_prefix, rules_in, strict=False):
+        """監看資料夾與底下所有未被排除的子資料夾 (先加入監看再讀取內容，之間新增的資料夾不會遺漏)"""
+        stack = [(path, rel_prefix, rules_in)]
+        while stack:
+            path, rel_prefix, rules_in = stack.pop()
+            listing = read_directory(path)
+            if listing is None:
+                continue
+            file_entries, dir_entries = listing
+            rules = directory_rules(path, rel_prefix, rules_in, [name for name, _, _ in file_entries])
+            self._add_watch(path, rel_prefix, rules_in, rules, strict)
+            base = os.path.join(path, '')
+            for name, is_symlink in dir_entries:
+                relative_path = rel_prefix + name
+                if is_symlink or (rules is not None and rules.is_excluded(relative_path, True, name)):
+                    continue
+                stack.append((base + name, relative_path + os.sep, rules))
+
+    def _unwatch_prefix(self, rel_prefix):
+        """停止監看某個資料夾與底下的所有資料夾"""
+        for prefix in [p for p in self._prefixes if p.startswith(rel_prefix)]:
+            wd = self._prefixes.pop(prefix)
+            self._dirs.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def read(self, timeout):
+        """等待最多 timeout 秒，回傳這段期間的變動"""
+        try:
+            ready, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        except InterruptedError:
+            return []
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+        changes = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changes.append((CHANGE_RESCAN, '', None))
+                continue
+            watched = self._dirs.get(wd)
+            if watched is None:
+                continue
+            rel_prefix, rules_in, rules = watched
+            if mask & IN_IGNORED:
+                # 資料夾已刪除或移走，監看自動取消
+                self._dirs.pop(wd, None)
+                if self._prefixes.get(rel_prefix) == wd:
+                    del self._prefixes[rel_prefix]
+                continue
+            if not name:
+                continue  # 資料夾本身的事件 (刪除、移走) 會在上層以資料夾事件回報
+            changes.extend(self._classify(rel_prefix, rules_in, rules, name, mask))
+        return changes
+
+    def _classify(self, rel_prefix, rules_in, rules, name, mask):
+        """將一個 inotify 事件轉成變動 (被排除的路徑不產生變動)"""
+        relative_path = rel_prefix + name
+        is_dir = bool(mask & IN_ISDIR)
+        if rules is not None and rules.is_excluded(relative_path, is_dir, name):
+            return []
+        if is_dir:
+            if not mask & (IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM):
+                return []  # 資料夾本身的屬性或時間改變，內容的變動會由它自己的監看回報
+            directory_prefix = relative_path + os.sep
+            self._unwatch_prefix(directory_prefix)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(self.source_dir + os.sep + relative_path, directory_prefix, rules)
+            return [(CHANGE_DIR, relative_path, rules)]
+        if name == '.gitignore' and rules_in is not None and rules_in.use_gitignore:
+            # 規則改變：這個資料夾以下重新監看並重新比對
+            self._unwatch_prefix(rel_prefix)
+            path = self.source_dir + os.sep + rel_prefix[:-1] if rel_prefix else self.source_dir
+            self._watch_tree(path, rel_prefix, rules_in)
+            return [(CHANGE_DIR, rel_prefix[:-1], rules_in)] if rel_prefix else [(CHANGE_RESCAN, '', None)]
+        return [(CHANGE_FILE, relative_path, None)]
+
+    def close(self):
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+        self._fd = None
+
+
+class PollingWatcher:
+    """定期掃描來源，與上一次的結果比較 (無法使用 inotify 時使用)"""
+
+    def __init__(self, source_dir, rules=None, interval=DEFAULT_POLL_INTERVAL, workers=DEFAULT_SCAN_WORKERS):
+        self.source_dir = source_dir
+        self.rules = rules
+        self.interval = interval
+        self.workers = workers
+        self._cache = ScanCache(source_dir)
+        self._files = self._scan()
+        self._next_poll = time.monotonic() + interval
+
+    def _scan(self):
+        return {relative_path: (size, mtime_ns)
+                for batch in walk_tree(self.source_dir, self.rules, self.workers, self._cache, restat=True)
+                for _, relative_path, size, mtime_ns in batch}
+
+    def read(self, timeout):
+        remaining = self._next_poll - time.monotonic()
+        if remaining > timeout:
+            time.sleep(max(0.0, timeout))
+            return []
+        time.sleep(max(0.0, remaining))
+        self._next_poll = time.monotonic() + self.interval
+        previous, self._files = self._files, self._scan()
+        changes = [(CHANGE_FILE, path, None) for path, entry in self._files.items() if previous.get(path) != entry]
+        source_prefix = os.path.join(self.source_dir, '')
+        # 仍然存在但不在掃描結果中的檔案是規則改變後被排除，不當作刪除
+        changes += [(CHANGE_FILE, path, None) for path in previous
+                    if path not in self._files and not os.path.lexists(source_prefix + path)]
+        return changes
+
+    def close(self):
+        pass
+
+
+def make_watcher(source_dir, rules=None, use_inotify=True, poll_interval=DEFAULT_POLL_INTERVAL,
+                 workers=DEFAULT_SCAN_WORKERS):
+    """建立監看器：可以時使用 inotify，否則改為定期掃描"""
+    if use_inotify:
+        try:
+            return InotifyWatcher(source_dir, rules)
+        except OSError as e:
+            print(f"無法使用 inotify ({e})，改為每 {poll_interval:g} 秒掃描一次", file=sys.stderr)
+    return PollingWatcher(source_dir, rules, poll_interval, workers)
+
+
+class ChangeBatcher:
+    """累積變動並合併：安靜 debounce 秒或最久 max_delay 秒後才交出一輪"""
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE, max_delay=DEFAULT_MAX_DELAY):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.files = set()
+        self.dirs = {}  # {相對路徑: 上層適用的規則}
+        self.rescan = False
+        self._first = None
+        self._last = None
+
+    def __bool__(self):
+        return bool(self.files or self.dirs or self.rescan)
+
+    def add(self, kind, relative_path, rules=None):
+        now = time.monotonic()
+        if self._first is None:
+            self._first = now
+        self._last = now
+        if kind == CHANGE_RESCAN:
+            self.rescan = True
+        elif kind == CHANGE_DIR:
+            self.dirs[relative_path] = rules
+        else:
+            self.files.add(relative_path)
+
+    def wait_time(self):
+        """距離可以同步還要等多久 (秒)；沒有變動時為 None"""
+        if not self:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(self._last + self.debounce, self._first + self.max_delay) - now)
+
+    def take(self):
+        """取出累積的變動，回傳 (是否需要完整比對, 檔案集合, {資料夾: 規則})
+
+        已包含在變動資料夾中的檔案與子資料夾會被合併掉。
+        """
+        rescan, files, dirs = self.rescan, self.files, self.dirs
+        self.files, self.dirs, self.rescan = set(), {}, False
+        self._first = self._last = None
+        if rescan:
+            return True, set(), {}
+        top_dirs = {}
+        for directory in sorted(dirs, key=len):
+            if not any(directory.startswith(parent + os.sep) for parent in top_dirs):
+                top_dirs[directory] = dirs[directory]
+        if top_dirs:
+            files = {path for path in files
+                     if not any(path.startswith(directory + os.sep) for directory in top_dirs)}
+        return False, files, top_dirs
+
+
+@dataclass
+class SyncRound:
+    """一輪同步的結果"""
+    full: bool = False        # 是否為完整比對 (第一次或事件遺失後)
+    changed: int = 0          # 觸發這輪的路徑數 (完整比對時為 0)
+    copied_count: int = 0
+    deleted_count: int = 0
+    failed_files: list = field(default_factory=list)  # [(路徑, 例外)]
+    methods: dict = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+def _entry(path):
+    """(大小, mtime_ns)，不存在或不是一般檔案時回傳 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns) if stat.S_ISREG(st.st_mode) else None
+
+
+def watch_backup(source_dir, dest_dir, rules=None, workers=DEFAULT_COPY_WORKERS, scan_workers=DEFAULT_SCAN_WORKERS,
+                 mirror=False, prune_excluded=False, method=DEFAULT_COPY_METHOD, buffer_size=DEFAULT_BUFFER_SIZE,
+                 retries=DEFAULT_RETRY_COUNT, retry_delay=DEFAULT_RETRY_DELAY, verify=False,
+                 checksum_algorithm=DEFAULT_CHECKSUM_ALGORITHM, large_file_threshold=DEFAULT_LARGE_FILE_THRESHOLD,
+                 delta_threshold=None, debounce=DEFAULT_DEBOUNCE,
+                 max_delay=DEFAULT_MAX_DELAY, use_inotify=True, poll_interval=DEFAULT_POLL_INTERVAL,
+                 stop_event=None, on_sync=None):
+    """先完整同步一次，之後持續監看來源並只複製有變更的檔案，直到 stop_event (threading.Event) 被設定
+
+    每一輪結束後呼叫 on_sync(SyncRound) (在同一個執行緒中)。
+    比對的依據是目標中檔案的大小與修改時間，不需要增量清單；目標有清單時會一併更新。
+    mirror 為 True 時來源刪除的檔案也從目標刪除 (prune_excluded 與鏡像模式相同)。
+    """
+    stop_event = stop_event or threading.Event()
+    source_prefix = os.path.join(source_dir, '')
+    dest_prefix = os.path.join(dest_dir, '')
+    copy_options = dict(workers=workers, method=method, buffer_size=buffer_size, retries=retries,
+                        retry_delay=retry_delay, verify=verify, checksum_algorithm=checksum_algorithm,
+                        large_file_threshold=large_file_threshold, delta_threshold=delta_threshold)
+
+    def full_sync():
+        started = time.perf_counter()
+        plan = plan_mirror(source_dir, dest_dir, rules, workers=scan_workers, prune_excluded=prune_excluded)
+        if not mirror:
+            plan.deletes = []
+            plan.stale_dirs = []
+        sync = SyncRound(full=True)
+        if plan.files or plan.has_deletes:
+            result = run_mirror(plan, **copy_options)
+            sync.copied_count = result.copied_count
+            sync.deleted_count = result.deleted_count
+            sync.failed_files = result.failed_files
+            sync.methods = result.methods
+        plan.files.close()
+        sync.seconds = time.perf_counter() - started
+        return sync
+
+    def sync_changes(files, dirs):
+        started = time.perf_counter()
+        sync = SyncRound(changed=len(files) + len(dirs))
+        candidates = {path: None for path in files}  # {相對路徑: 來源的 (大小, mtime_ns) 或 None}
+        dest_only = []
+        for directory, parent_rules in dirs.items():
+            prefix = directory + os.sep
+            source_path = source_prefix + directory
+            if os.path.isdir(source_path):
+                for batch in walk_tree(source_path, parent_rules, scan_workers, rel_prefix=prefix):
+                    for _, relative_path, size, mtime_ns in batch:
+                        candidates[relative_path] = (size, mtime_ns)
+            if mirror and os.path.isdir(dest_prefix + directory):
+                for batch in walk_tree(dest_prefix + directory, None if prune_excluded else parent_rules,
+                                       scan_workers, rel_prefix=prefix):
+                    dest_only += [relative_path for _, relative_path, _, _ in batch
+                                  if relative_path not in candidates]
+
+        plan = FilePlan(source_dir, dest_dir, None)
+        deletes = []
+        for relative_path, source_entry in candidates.items():
+            source_entry = source_entry or _entry(source_prefix + relative_path)
+            dest_entry = _entry(dest_prefix + relative_path)
+            if source_entry is None:
+                if mirror and dest_entry is not None:
+                    deletes.append(dest_prefix + relative_path)
+            elif source_entry != dest_entry:
+                plan.append(relative_path, *source_entry)
+        deletes += [dest_prefix + relative_path for relative_path in dest_only]
+
+        if deletes:
+            deleted_count, failed = _delete_batch(deletes)
+            sync.deleted_count = deleted_count
+            sync.failed_files += failed
+            failed_paths = {path for path, _ in failed}
+            deleted = [path for path in deletes if path not in failed_paths]
+            _remove_empty_dirs(dest_dir, deleted)
+            _forget_deleted(dest_dir, deleted)
+
+        # 分成小批複製，大量變動時已完成的部分不必等全部結束
+        copied = []
+        entries = list(plan.iter_entries())
+        for start in range(0, len(entries), WATCH_BATCH_SIZE):
+            if stop_event.is_set():
+                break
+            batch = FilePlan(source_dir, dest_dir, None)
+            for entry in entries[start:start + WATCH_BATCH_SIZE]:
+                batch.append(*entry)
+            scan = ScanResult(source_dir=source_dir, dest_dir=dest_dir, files=batch,
+                              total_bytes=sum(batch.sizes))
+            result = copy_files(scan, **copy_options)
+            sync.copied_count += result.copied_count
+            sync.failed_files += result.failed_files
+            for name, count in result.methods.items():
+                sync.methods[name] = sync.methods.get(name, 0) + count
+            failed_sources = {path for path, _ in result.failed_files}
+            copied += [entry for entry in entries[start:start + WATCH_BATCH_SIZE]
+                       if source_prefix + entry[0] not in failed_sources]
+
+        # 目標有增量清單時一併更新，之後的一般增量備份不必重新複製這些檔案
+        if copied:
+            manifest = load_manifest(dest_dir)
+            if manifest:
+                for relative_path, size, mtime_ns in copied:
+                    manifest[manifest_key(relative_path)] = [size, mtime_ns, None]
+                save_manifest(dest_dir, manifest)
+        sync.seconds = time.perf_counter() - started
+        return sync
+
+    # 先開始監看再做完整同步，同步期間的變動不會遺漏
+    watcher = make_watcher(source_dir, rules, use_inotify, poll_interval, scan_workers)
+    batcher = ChangeBatcher(debounce, max_delay)
+    try:
+        sync = full_sync()
+        if on_sync:
+            on_sync(sync)
+        while not stop_event.is_set():
+            wait = batcher.wait_time()
+            for change in watcher.read(_TICK if wait is None else min(wait, _TICK)):
+                batcher.add(*change)
+            if batcher and batcher.wait_time() == 0:
+                rescan, files, dirs = batcher.take()
+                sync = full_sync() if rescan else sync_changes(files, dirs)
+                if on_sync:
+                    on_sync(sync)
+    finally:
+        watcher.close()
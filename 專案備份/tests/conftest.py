@@ -0,0 +1,5 @@
+"""測試共用設定：讓測試可以直接匯入 backup_core (從任何目錄執行 pytest 都可以)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,98 @@
+"""封存輸出：略過或讀取失敗的檔案不會讓封存檔損壞"""
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from backup_core.archive import write_archive
+
+
+class FailingRead(io.FileIO):
+    """讀到一半失敗的來源檔案 (模擬讀取途中的 I/O 錯誤)"""
+
+    def readinto(self, buffer):
+        raise OSError(5, "Input/output error")
+
+
+def make_source(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / 'a.txt').write_bytes(b'a' * 5000)
+    (source / 'bad.bin').write_bytes(b'b' * 70000)
+    (source / 'z.txt').write_bytes(b'z' * 3)
+    entries = [(str(source / name), name) for name in ('a.txt', 'missing.txt', 'bad.bin', 'z.txt')]
+    return entries
+
+
+def read_members(archive_path, fmt):
+    if fmt == 'zip':
+        with zipfile.ZipFile(archive_path) as archive:
+            assert archive.testzip() is None
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(archive_path) as archive:
+        return {m.name: archive.extractfile(m).read() for m in archive.getmembers()}
+
+
+@pytest.mark.parametrize('fmt', ['tar.gz', 'tar.xz', 'zip'])
+def test_read_error_after_header_keeps_archive_valid(tmp_path, monkeypatch, fmt):
+    entries = make_source(tmp_path)
+    real_open = open
+
+    def open_failing(path, mode='r', *args, **kwargs):
+        if str(path).endswith('bad.bin') and mode == 'rb':
+            return io.BufferedReader(FailingRead(path, 'rb'))
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', open_failing)
+    archive_path = str(tmp_path / f'out.{fmt}')
+    result = write_archive(entries, archive_path, fmt, workers=2)
+    monkeypatch.undo()
+
+    failed = sorted(os.path.basename(path) for path, _ in result.failed_files)
+    assert failed == ['bad.bin', 'missing.txt']
+    assert result.copied_count == 2
+    members = read_members(archive_path, fmt)
+    # 後面的檔案仍然完整；tar 中讀取失敗的檔案補零到標頭記載的大小，zip 則回頭修正成已讀到的部分
+    assert members['a.txt'] == b'a' * 5000
+    assert members['z.txt'] == b'zzz'
+    assert members['bad.bin'] == (b'' if fmt == 'zip' else bytes(70000))
+    assert 'missing.txt' not in members
+
+
+class FailingWrite(io.FileIO):
+    """寫入時磁碟已滿的封存檔"""
+
+    def write(self, data):
+        raise OSError(28, "No space left on device")
+
+
+@pytest.mark.parametrize('fmt', ['tar.gz', 'zip'])
+def test_write_error_aborts_without_leaving_archive(tmp_path, monkeypatch, fmt):
+    entries = make_source(tmp_path)
+    archive_path = str(tmp_path / f'out.{fmt}')
+    real_open = open
+
+    def open_full(path, mode='r', *args, **kwargs):
+        if str(path).endswith('.partial'):
+            return FailingWrite(path, 'wb')
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', open_full)
+    with pytest.raises(OSError):
+        write_archive(entries, archive_path, fmt, workers=2)
+    monkeypatch.undo()
+    assert not os.path.exists(archive_path)
+    assert not os.path.exists(archive_path + '.partial')
+
+
+def test_zip_uses_requested_compression_level(tmp_path):
+    entries = make_source(tmp_path)
+    sizes = {}
+    for level in (0, 9):
+        archive_path = str(tmp_path / f'level{level}.zip')
+        write_archive(entries, archive_path, 'zip', level=level)
+        sizes[level] = os.path.getsize(archive_path)
+        assert read_members(archive_path, 'zip')['bad.bin'] == b'b' * 70000
+    assert sizes[9] < sizes[0]
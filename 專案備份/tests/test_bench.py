@@ -0,0 +1,40 @@
+"""效能測試：合成資料夾可重現，測試結果涵蓋所有要備份的檔案"""
+import os
+
+from backup_core.bench import format_table, generate_tree, run_benchmarks
+
+
+def tree_contents(root):
+    contents = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                contents[os.path.relpath(path, root)] = f.read()
+    return contents
+
+
+def test_same_seed_generates_same_tree(tmp_path):
+    first = generate_tree(str(tmp_path / 'a'), 'tiny', seed=1)
+    second = generate_tree(str(tmp_path / 'b'), 'tiny', seed=1)
+    assert first == second
+    assert tree_contents(tmp_path / 'a') == tree_contents(tmp_path / 'b')
+    # 相同參數時沿用既有的資料夾
+    marker = os.stat(str(tmp_path / 'a') + '.bench.json').st_mtime_ns
+    assert generate_tree(str(tmp_path / 'a'), 'tiny', seed=1) == first
+    assert os.stat(str(tmp_path / 'a') + '.bench.json').st_mtime_ns == marker
+
+
+def test_benchmarks_copy_every_kept_file(tmp_path):
+    source = str(tmp_path / 'source')
+    files, total_bytes = generate_tree(source, 'tiny')
+    rows = run_benchmarks(source, str(tmp_path), methods=['buffered'], workers_list=[2], scan_workers=2)
+    by_name = {row['name']: row for row in rows}
+    assert by_name['scan (排除)']['files'] == files
+    assert by_name['scan (排除)']['bytes'] == total_bytes
+    assert by_name['scan (完整)']['files'] > files
+    copy_row = by_name['copy buffered x2']
+    assert copy_row['files'] == files and copy_row['failed'] == 0
+    assert by_name['stream (掃描+複製) x2']['files'] == files
+    assert not os.path.exists(tmp_path / 'dest')
+    assert 'copy buffered x2' in format_table(rows)
@@ -0,0 +1,61 @@
+"""分段複製：超過門檻的大檔案、稀疏檔案與中途失敗"""
+import errno
+import os
+
+import pytest
+
+from backup_core import copier, copy_files, scan_files
+from backup_core.copier import PARTIAL_SUFFIX
+
+CHUNK = 64 * 1024
+
+
+def copy_tree(tmp_path, **kwargs):
+    scan = scan_files(str(tmp_path / 'src'), str(tmp_path / 'dest'))
+    return copy_files(scan, workers=4, method='buffered', large_file_threshold=CHUNK, chunk_size=CHUNK, **kwargs)
+
+
+def test_file_over_threshold_is_copied_in_chunks(tmp_path):
+    (tmp_path / 'src').mkdir()
+    data = os.urandom(5 * CHUNK + 123)
+    (tmp_path / 'src' / 'big.bin').write_bytes(data)
+    (tmp_path / 'src' / 'small.txt').write_bytes(b'small')
+    result = copy_tree(tmp_path)
+    assert not result.failed_files
+    assert result.methods == {'chunked': 1, 'buffered': 1}
+    assert (tmp_path / 'dest' / 'big.bin').read_bytes() == data
+    src_stat = os.stat(tmp_path / 'src' / 'big.bin')
+    assert os.stat(tmp_path / 'dest' / 'big.bin').st_mtime_ns == src_stat.st_mtime_ns
+
+
+def test_sparse_file_keeps_holes(tmp_path):
+    (tmp_path / 'src').mkdir()
+    source = tmp_path / 'src' / 'sparse.img'
+    size = 64 * CHUNK
+    with open(source, 'wb') as f:
+        f.truncate(size)
+        f.seek(10 * CHUNK + 7)
+        f.write(b'data in the middle')
+    if os.stat(source).st_blocks * 512 >= size:
+        pytest.skip("檔案系統不支援稀疏檔案")
+    result = copy_tree(tmp_path)
+    assert not result.failed_files
+    dest = tmp_path / 'dest' / 'sparse.img'
+    assert dest.read_bytes() == source.read_bytes()
+    assert os.stat(dest).st_blocks * 512 < size // 2
+
+
+def test_failed_chunk_removes_partial_file(tmp_path, monkeypatch):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'big.bin').write_bytes(os.urandom(4 * CHUNK))
+    original = copier.copy_file_part
+
+    def failing_part(src_fd, dst_fd, start, end, *args, **kwargs):
+        if start == 2 * CHUNK:
+            raise OSError(errno.EIO, "讀取失敗")
+        return original(src_fd, dst_fd, start, end, *args, **kwargs)
+
+    monkeypatch.setattr(copier, 'copy_file_part', failing_part)
+    result = copy_tree(tmp_path, retries=0)
+    assert len(result.failed_files) == 1
+    assert not os.path.exists(tmp_path / 'dest' / ('big.bin' + PARTIAL_SUFFIX))
@@ -0,0 +1,37 @@
+"""命令列：不需要圖形介面即可執行備份並輸出 JSON 統計"""
+import json
+
+from backup_core.cli import main
+
+
+def run_cli(tmp_path, capsys, *extra):
+    args = ['--config', str(tmp_path / 'config.json'), '--source', str(tmp_path / 'src'),
+            '--dest', str(tmp_path / 'dest')]
+    code = main(args + list(extra))
+    return code, json.loads(capsys.readouterr().out)
+
+
+def test_cli_backup_and_dry_run(tmp_path, capsys):
+    (tmp_path / 'src' / 'lib').mkdir(parents=True)
+    (tmp_path / 'src' / 'lib' / 'a.js').write_bytes(b'a')
+    (tmp_path / 'src' / 'b.txt').write_bytes(b'bb')
+
+    code, stats = run_cli(tmp_path, capsys, '--dry-run')
+    assert code == 0
+    assert stats['files_to_copy'] == 2 and stats['copied'] == 0
+    assert not (tmp_path / 'dest').exists()
+
+    code, stats = run_cli(tmp_path, capsys, '--jobs', '2')
+    assert code == 0
+    assert stats['copied'] == 2 and stats['failed'] == []
+    assert (tmp_path / 'dest' / 'lib' / 'a.js').read_bytes() == b'a'
+    # 沒有設定統計資料夾時不會在目前的資料夾寫入統計檔
+    assert stats['stats_file'] is None
+
+
+def test_cli_reports_invalid_paths(tmp_path, capsys):
+    (tmp_path / 'src').mkdir()
+    args = ['--config', str(tmp_path / 'config.json'), '--source', str(tmp_path / 'src'),
+            '--dest', str(tmp_path / 'src' / 'backup')]
+    assert main(args) == 2
+    assert 'error' in json.loads(capsys.readouterr().err)
@@ -0,0 +1,38 @@
+"""平行複製：多個執行緒複製整個資料夾，單一檔案失敗不中斷其他檔案"""
+import os
+
+from backup_core import copy_files, scan_files
+
+
+def make_tree(source, count=60):
+    for i in range(count):
+        path = source / f'dir{i % 6}' / f'sub{i % 3}' / f'file{i:03d}.txt'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(f'content {i}'.encode() * (i + 1))
+
+
+def test_parallel_copy_matches_source(tmp_path):
+    source = tmp_path / 'src'
+    make_tree(source)
+    progress = []
+    scan = scan_files(str(source), str(tmp_path / 'dest'))
+    result = copy_files(scan, workers=8, progress_callback=lambda done, total: progress.append((done, total)))
+    assert not result.failed_files
+    assert result.copied_count == scan.total_files == 60
+    assert progress[-1] == (60, 60)
+    for relative_path, _, _ in scan.files.iter_entries():
+        with open(os.path.join(source, relative_path), 'rb') as f, \
+                open(os.path.join(tmp_path, 'dest', relative_path), 'rb') as g:
+            assert f.read() == g.read()
+
+
+def test_failed_file_does_not_stop_the_others(tmp_path):
+    source = tmp_path / 'src'
+    make_tree(source, count=20)
+    scan = scan_files(str(source), str(tmp_path / 'dest'))
+    # 掃描後才刪除的檔案
+    missing = source / 'dir0' / 'sub0' / 'file000.txt'
+    missing.unlink()
+    result = copy_files(scan, workers=4, retries=0)
+    assert [path for path, _ in result.failed_files] == [str(missing)]
+    assert result.copied_count == 19
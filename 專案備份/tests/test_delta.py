@@ -0,0 +1,69 @@
+"""差異傳輸：只改寫不同的區塊，長度變化與硬連結的目標"""
+import os
+
+from backup_core.copier import delta_or_copy
+from backup_core.delta import DELTA_BLOCK_SIZE, delta_copy_file
+
+BLOCKS = 8
+
+
+def make_pair(tmp_path, old):
+    src = tmp_path / 'src.bin'
+    dest = tmp_path / 'dest.bin'
+    dest.write_bytes(old)
+    return src, dest
+
+
+def block_data():
+    return b''.join(bytes([i]) * DELTA_BLOCK_SIZE for i in range(BLOCKS))
+
+
+def test_unchanged_file_writes_nothing(tmp_path):
+    data = block_data()
+    src, dest = make_pair(tmp_path, data)
+    src.write_bytes(data)
+    assert delta_copy_file(str(src), str(dest)) == 0
+    assert dest.read_bytes() == data
+    assert os.stat(dest).st_mtime_ns == os.stat(src).st_mtime_ns
+
+
+def test_changed_block_writes_only_that_block(tmp_path):
+    old = block_data()
+    src, dest = make_pair(tmp_path, old)
+    new = bytearray(old)
+    new[3 * DELTA_BLOCK_SIZE + 10] ^= 0xFF
+    src.write_bytes(new)
+    assert delta_copy_file(str(src), str(dest)) == DELTA_BLOCK_SIZE
+    assert dest.read_bytes() == bytes(new)
+
+
+def test_grown_file_writes_appended_part(tmp_path):
+    old = block_data()
+    src, dest = make_pair(tmp_path, old)
+    new = old + b'tail' * 100
+    src.write_bytes(new)
+    assert delta_copy_file(str(src), str(dest)) == len(new) - len(old)
+    assert dest.read_bytes() == new
+
+
+def test_truncated_file_is_shortened(tmp_path):
+    old = block_data()
+    src, dest = make_pair(tmp_path, old)
+    new = old[:2 * DELTA_BLOCK_SIZE + 5]
+    src.write_bytes(new)
+    assert delta_copy_file(str(src), str(dest)) == 0
+    assert dest.read_bytes() == new
+
+
+def test_hard_linked_target_falls_back_to_full_copy(tmp_path):
+    old = block_data()
+    src, dest = make_pair(tmp_path, old)
+    other = tmp_path / 'snapshot.bin'
+    os.link(dest, other)
+    new = b'new' + old[3:]
+    src.write_bytes(new)
+    assert delta_copy_file(str(src), str(dest)) is None
+    assert delta_or_copy(str(src), str(dest)) != 'delta'
+    assert dest.read_bytes() == new
+    # 共用同一份內容的其他路徑不受影響
+    assert other.read_bytes() == old
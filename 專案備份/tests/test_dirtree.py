@@ -0,0 +1,35 @@
+"""目標資料夾結構：每個資料夾只建立一次，複製完成後保留來源資料夾的修改時間"""
+import os
+
+from backup_core import copy_files, scan_files
+from backup_core.dirtree import create_directories, plan_directories
+
+
+def test_plan_directories_adds_parents_by_level():
+    levels = plan_directories([os.path.join('a', 'b', 'c'), os.path.join('a', 'x'), '', 'd'])
+    assert levels == [['a', 'd'], [os.path.join('a', 'b'), os.path.join('a', 'x')],
+                      [os.path.join('a', 'b', 'c')]]
+
+
+def test_create_directories_reports_failures(tmp_path):
+    (tmp_path / 'dest').mkdir()
+    (tmp_path / 'dest' / 'blocked').write_bytes(b'a file, not a folder')
+    failed = create_directories(str(tmp_path / 'dest'), plan_directories(['ok', os.path.join('blocked', 'sub')]))
+    assert [os.path.basename(path) for path, _ in failed] == ['sub']
+    assert (tmp_path / 'dest' / 'ok').is_dir()
+
+
+def test_copy_keeps_directory_times(tmp_path):
+    source = tmp_path / 'src'
+    for relative_path in (os.path.join('a', 'b', 'one.txt'), os.path.join('a', 'two.txt'), 'three.txt'):
+        path = source / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'data')
+    for depth, directory in enumerate((source / 'a' / 'b', source / 'a', source)):
+        os.utime(directory, ns=(1_000_000_000, (1_500_000_000 + depth) * 10 ** 9))
+
+    result = copy_files(scan_files(str(source), str(tmp_path / 'dest')), workers=4)
+    assert not result.failed_files
+    for relative_path in (os.path.join('a', 'b'), 'a', ''):
+        assert (os.stat(os.path.join(tmp_path, 'dest', relative_path)).st_mtime_ns
+                == os.stat(os.path.join(source, relative_path)).st_mtime_ns)
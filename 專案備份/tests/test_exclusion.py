@@ -0,0 +1,42 @@
+"""排除規則：gitignore 的反向規則與只比對資料夾的規則"""
+import os
+
+from backup_core import ExclusionRules, scan_files
+
+
+def test_negation_reincludes_later_match():
+    rules = ExclusionRules(patterns=['*.log', '!keep.log'], ignore_case=False)
+    assert rules.is_excluded('debug.log', False)
+    assert rules.is_excluded('sub/debug.log', False)
+    assert not rules.is_excluded('keep.log', False)
+    assert not rules.is_excluded('sub/keep.log', False)
+    # 後面的規則優先：再次排除
+    rules = ExclusionRules(patterns=['*.log', '!keep.log', 'sub/keep.log'], ignore_case=False)
+    assert not rules.is_excluded('keep.log', False)
+    assert rules.is_excluded('sub/keep.log', False)
+
+
+def test_directory_only_pattern_skips_files_with_same_name():
+    rules = ExclusionRules(patterns=['build/'], ignore_case=False)
+    assert rules.is_excluded('build', True)
+    assert rules.is_excluded('src/build', True)
+    assert not rules.is_excluded('build', False)
+    assert not rules.is_excluded('src/build', False)
+
+
+def test_anchored_pattern_only_matches_at_root():
+    rules = ExclusionRules(patterns=['/dist'], ignore_case=False)
+    assert rules.is_excluded('dist', True)
+    assert not rules.is_excluded('src/dist', True)
+
+
+def test_scan_applies_negation_and_directory_rules(tmp_path):
+    source = tmp_path / 'src'
+    for path in ('build/out.o', 'src/build', 'logs/a.log', 'logs/keep.log', 'main.c'):
+        full = source / path
+        full.parent.mkdir(parents=True, exist_ok=True)
+        full.write_bytes(b'x')
+    rules = ExclusionRules(patterns=['build/', '*.log', '!keep.log'], ignore_case=False)
+    scan = scan_files(str(source), str(tmp_path / 'dest'), rules)
+    planned = sorted(relative_path for relative_path, _, _ in scan.files.iter_entries())
+    assert planned == sorted([os.path.join('logs', 'keep.log'), 'main.c', os.path.join('src', 'build')])
@@ -0,0 +1,61 @@
+"""多目標備份：續傳日誌、校驗碼與不支援的選項"""
+import os
+
+import pytest
+
+from backup_core import default_config, fanout_copy, scan_files, verify_backup
+from backup_core.cli import run_backup
+from backup_core.journal import has_journal
+
+
+def make_source(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'sub').mkdir(parents=True)
+    (source / 'a.txt').write_bytes(b'a' * 1000)
+    (source / 'sub' / 'b.txt').write_bytes(b'b' * 2000)
+    return str(source)
+
+
+def test_resume_writes_only_unfinished_destinations(tmp_path):
+    source = make_source(tmp_path)
+    first, second = str(tmp_path / 'd1'), str(tmp_path / 'd2')
+    # 第二個目標的 sub 是檔案：sub/b.txt 在這個目標失敗，日誌保留
+    os.makedirs(second)
+    with open(os.path.join(second, 'sub'), 'w') as f:
+        f.write('blocker')
+    result = fanout_copy(scan_files(source, first), [second], workers=2, resume=True, retries=0)
+    assert [os.path.basename(path) for path, _ in result.failed_files] == ['b.txt']
+    assert has_journal(first) and has_journal(second)
+
+    os.remove(os.path.join(second, 'sub'))
+    result = fanout_copy(scan_files(source, first), [second], workers=2, resume=True, retries=0)
+    assert not result.failed_files
+    # a.txt 在兩個目標都已完成，不再讀取；b.txt 只寫入第二個目標
+    assert result.resumed_count == 1
+    assert result.bytes_read == 2000
+    assert [r.resumed_count for r in result.results] == [2, 1]
+    with open(os.path.join(second, 'sub', 'b.txt'), 'rb') as f:
+        assert f.read() == b'b' * 2000
+    assert not has_journal(first) and not has_journal(second)
+
+
+def test_verify_records_checksums_in_every_destination(tmp_path):
+    source = make_source(tmp_path)
+    first, second = str(tmp_path / 'd1'), str(tmp_path / 'd2')
+    result = fanout_copy(scan_files(source, first), [second], workers=2, verify=True)
+    assert result.copied_count == 2
+    for dest_dir in (first, second):
+        verified = verify_backup(dest_dir, workers=2)
+        assert verified.is_ok and verified.checked_count == 2
+
+
+def test_cli_rejects_options_fanout_cannot_apply(tmp_path):
+    config = default_config()
+    config.update(source_dir=make_source(tmp_path), dest_dir=str(tmp_path / 'd1'),
+                  extra_dest_dirs=[str(tmp_path / 'd2')], delta_transfer=True, stats_dir='')
+    with pytest.raises(ValueError, match='差異傳輸'):
+        run_backup(config)
+    config.update(delta_transfer=False, copy_method='buffered')
+    with pytest.raises(ValueError, match='buffered'):
+        run_backup(config)
+    assert not os.path.exists(str(tmp_path / 'd1'))
@@ -0,0 +1,59 @@
+"""快速複製：每種複製方式的內容與時間，以及不支援時改用下一種方式"""
+import errno
+import os
+
+import pytest
+
+from backup_core import fastcopy
+from backup_core.fastcopy import COPY_METHODS, copy_file_fast
+
+DATA_SIZE = 3 * 1024 * 1024 + 17
+
+
+def make_source(tmp_path):
+    source = tmp_path / 'source.bin'
+    source.write_bytes(os.urandom(DATA_SIZE))
+    os.utime(source, ns=(1_500_000_000_000_000_000, 1_600_000_000_123_456_789))
+    return source
+
+
+def assert_same(source, dest):
+    assert dest.read_bytes() == source.read_bytes()
+    assert os.stat(dest).st_mtime_ns == os.stat(source).st_mtime_ns
+
+
+@pytest.mark.parametrize('method', COPY_METHODS)
+def test_every_method_copies_content_and_times(tmp_path, method):
+    source = make_source(tmp_path)
+    dest = tmp_path / 'dest.bin'
+    used = copy_file_fast(str(source), str(dest), method, buffer_size=64 * 1024)
+    assert used in COPY_METHODS
+    assert_same(source, dest)
+
+
+def failing(error_number):
+    def fail(*args, **kwargs):
+        raise OSError(error_number, os.strerror(error_number))
+    return fail
+
+
+@pytest.mark.parametrize('error_number', [errno.EXDEV, errno.EINVAL])
+def test_kernel_copy_falls_back_when_unsupported(tmp_path, monkeypatch, error_number):
+    source = make_source(tmp_path)
+    if fastcopy.fcntl is not None:
+        monkeypatch.setattr(fastcopy.fcntl, 'ioctl', failing(error_number))
+    monkeypatch.setattr(fastcopy.os, 'copy_file_range', failing(error_number), raising=False)
+    monkeypatch.setattr(fastcopy.os, 'sendfile', failing(error_number), raising=False)
+    for method in ('auto', 'reflink', 'copy_file_range', 'sendfile'):
+        dest = tmp_path / f'{method}.bin'
+        assert copy_file_fast(str(source), str(dest), method) == 'buffered'
+        assert_same(source, dest)
+
+
+def test_other_errors_are_not_hidden(tmp_path, monkeypatch):
+    source = make_source(tmp_path)
+    if not fastcopy._HAS_COPY_FILE_RANGE:
+        pytest.skip("此系統沒有 copy_file_range")
+    monkeypatch.setattr(fastcopy.os, 'copy_file_range', failing(errno.EIO))
+    with pytest.raises(OSError):
+        copy_file_fast(str(source), str(tmp_path / 'dest.bin'), 'copy_file_range')
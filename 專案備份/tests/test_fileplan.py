@@ -0,0 +1,40 @@
+"""檔案清單：記憶體與寫到磁碟 (sqlite) 兩種形式的讀取結果相同"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from backup_core import fileplan
+from backup_core.fileplan import FilePlan
+
+
+def build(count, memory_budget, finish=True):
+    plan = FilePlan('src', 'dest', memory_budget)
+    for i in range(count):
+        plan.append(os.path.join(f'd{i % 7}', f'f{i}.txt'), i, i * 10)
+    if finish:
+        plan.finish()
+    return plan
+
+
+def test_spilled_plan_matches_memory_plan():
+    in_memory = build(500, None)
+    spilled = build(500, 1024)
+    try:
+        assert not in_memory.spilled and spilled.spilled
+        assert list(spilled.iter_entries()) == list(in_memory.iter_entries())
+        assert spilled.entry(-1) == in_memory.entry(499)
+        assert spilled[3] == (os.path.join('src', 'd3', 'f3.txt'), os.path.join('dest', 'd3', 'f3.txt'))
+    finally:
+        spilled.close()
+
+
+def test_concurrent_readers_flush_pending_rows_once(monkeypatch):
+    monkeypatch.setattr(fileplan, 'SPILL_BATCH_SIZE', 64)
+    # 沒有呼叫 finish：讀取執行緒同時寫入尚未寫入的檔案
+    plan = build(1000, 1024, finish=False)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            entries = list(executor.map(plan.entry, range(len(plan) - 1, -1, -1)))
+        assert entries[::-1] == list(plan.iter_entries())
+        assert len(set(entries)) == 1000
+    finally:
+        plan.close()
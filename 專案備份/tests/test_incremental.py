@@ -0,0 +1,42 @@
+"""增量備份：加上時間戳記時每個快照都完整，未變更的檔案以硬連結共用"""
+import os
+
+import pytest
+
+from backup_core import default_config, list_snapshots
+from backup_core.cli import run_backup, run_stream_backup
+from backup_core.manifest import MANIFEST_FILE, load_manifest
+
+
+def backup_twice(tmp_path, run):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / 'same.txt').write_bytes(b'same')
+    (source / 'changed.txt').write_bytes(b'old')
+    config = default_config()
+    config.update(source_dir=str(source), dest_dir=str(tmp_path / 'backup'), append_timestamp=True,
+                  incremental=True, stats_dir='')
+    first = run(config)
+    assert first['files_to_copy'] == 2
+    # 改成較早的時間戳記，下一次執行會建立新的快照
+    os.rename(first['dest'], str(tmp_path / 'backup_20000101_000000'))
+
+    (source / 'changed.txt').write_bytes(b'new content')
+    second = run(config)
+    return config, second
+
+
+@pytest.mark.parametrize('run', [run_backup, run_stream_backup])
+def test_timestamped_incremental_snapshot_is_complete(tmp_path, run):
+    config, second = backup_twice(tmp_path, run)
+    previous = str(tmp_path / 'backup_20000101_000000')
+    assert second['link_dest'] == previous
+    snapshots = list_snapshots(config['dest_dir'])
+    assert len(snapshots) == 2
+    latest = snapshots[-1][1]
+    assert sorted(os.listdir(latest)) == sorted(['changed.txt', 'same.txt', MANIFEST_FILE])
+    assert (tmp_path / os.path.basename(latest) / 'changed.txt').read_bytes() == b'new content'
+    # 未變更的檔案與上一個快照共用同一份內容
+    assert os.path.samefile(os.path.join(latest, 'same.txt'), os.path.join(previous, 'same.txt'))
+    assert not os.path.samefile(os.path.join(latest, 'changed.txt'), os.path.join(previous, 'changed.txt'))
+    assert sorted(load_manifest(latest)) == ['changed.txt', 'same.txt']
@@ -0,0 +1,72 @@
+"""複製日誌：中斷後重新執行時略過已完成的檔案"""
+import os
+
+from backup_core import copy_files, scan_files
+from backup_core.journal import CopyJournal, find_unfinished_snapshot, has_journal
+
+
+def make_source(tmp_path, count=5):
+    source = tmp_path / 'src'
+    source.mkdir()
+    for i in range(count):
+        (source / f'f{i}.txt').write_bytes(b'x' * (i + 1))
+    return str(source)
+
+
+def interrupt_after(source, dest, names):
+    """模擬複製到一半中斷：部分檔案已複製並記入日誌，程序在關閉日誌前結束"""
+    scan = scan_files(source, dest)
+    journal = CopyJournal(dest, source)
+    journal.start()
+    for relative_path, size, mtime_ns in scan.files.iter_entries():
+        if relative_path in names:
+            copy_files_one(source, dest, relative_path)
+            journal.record(relative_path, size, mtime_ns)
+    journal._sync()
+    journal._file.close()
+    # 中斷時最後一行可能只寫了一半
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('["f4.txt", 5')
+
+
+def copy_files_one(source, dest, relative_path):
+    with open(os.path.join(source, relative_path), 'rb') as f:
+        data = f.read()
+    with open(os.path.join(dest, relative_path), 'wb') as f:
+        f.write(data)
+
+
+def test_resume_skips_files_completed_before_interruption(tmp_path):
+    source = make_source(tmp_path)
+    dest = str(tmp_path / 'dest')
+    interrupt_after(source, dest, {'f0.txt', 'f1.txt'})
+    assert has_journal(dest)
+
+    result = copy_files(scan_files(source, dest), workers=2, resume=True)
+    assert not result.failed_files
+    assert result.resumed_count == 2
+    assert result.copied_count == 3
+    assert not has_journal(dest)  # 全部完成後刪除日誌
+    for i in range(5):
+        with open(os.path.join(dest, f'f{i}.txt'), 'rb') as f:
+            assert f.read() == b'x' * (i + 1)
+
+
+def test_resume_recopies_files_changed_since_interruption(tmp_path):
+    source = make_source(tmp_path)
+    dest = str(tmp_path / 'dest')
+    interrupt_after(source, dest, {'f0.txt', 'f1.txt'})
+    with open(os.path.join(source, 'f0.txt'), 'wb') as f:
+        f.write(b'changed')
+
+    result = copy_files(scan_files(source, dest), workers=2, resume=True)
+    assert result.resumed_count == 1
+    with open(os.path.join(dest, 'f0.txt'), 'rb') as f:
+        assert f.read() == b'changed'
+
+
+def test_unfinished_snapshot_is_reused(tmp_path):
+    source = make_source(tmp_path)
+    snapshot = str(tmp_path / 'backup_20240101_120000')
+    interrupt_after(source, snapshot, {'f0.txt'})
+    assert find_unfinished_snapshot(str(tmp_path / 'backup')) == snapshot
@@ -0,0 +1,97 @@
+"""鏡像模式：新增 / 更新 / 刪除的比對與執行"""
+import os
+
+import pytest
+
+from backup_core import ExclusionRules, ScanCache, plan_mirror, run_mirror
+from backup_core.cli import main
+from backup_core.mirror import OP_COPY, OP_UPDATE, PROTECTED_FILES
+
+
+def write(path, data, mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_in_place_edit_is_copied_with_scan_cache(tmp_path):
+    source, dest = str(tmp_path / 'src'), str(tmp_path / 'dest')
+    write(os.path.join(source, 'sub', 'a.txt'), b'old', mtime=1_000_000)
+    cache = ScanCache(source)
+    run_mirror(plan_mirror(source, dest, cache=cache), workers=2)
+    directory_mtime = os.stat(os.path.join(source, 'sub')).st_mtime_ns
+
+    # 原地改寫內容：資料夾的修改時間不變，快取中的大小與時間已過期
+    with open(os.path.join(source, 'sub', 'a.txt'), 'r+b') as f:
+        f.write(b'new content')
+    os.utime(os.path.join(source, 'sub', 'a.txt'), (2_000_000, 2_000_000))
+    assert os.stat(os.path.join(source, 'sub')).st_mtime_ns == directory_mtime
+
+    plan = plan_mirror(source, dest, cache=cache)
+    assert plan.total_files == 1
+    assert plan.unchanged_count == 0
+    result = run_mirror(plan, workers=2)
+    assert not result.failed_files
+    assert read(os.path.join(dest, 'sub', 'a.txt')) == b'new content'
+
+
+def test_mirror_updates_deletes_and_keeps_protected_files(tmp_path):
+    source, dest = str(tmp_path / 'src'), str(tmp_path / 'dest')
+    write(os.path.join(source, 'keep.txt'), b'keep', mtime=1_000_000)
+    write(os.path.join(source, 'edit.txt'), b'v1', mtime=1_000_000)
+    write(os.path.join(source, 'gone', 'old.txt'), b'old', mtime=1_000_000)
+    run_mirror(plan_mirror(source, dest), workers=2)
+    # 工具自己的檔案 (清單、日誌、校驗碼) 不在來源中，但不能被刪除
+    for name in PROTECTED_FILES:
+        write(os.path.join(dest, name), b'{}')
+
+    write(os.path.join(source, 'edit.txt'), b'version 2', mtime=2_000_000)
+    os.remove(os.path.join(source, 'gone', 'old.txt'))
+    os.rmdir(os.path.join(source, 'gone'))
+    write(os.path.join(source, 'new.txt'), b'new', mtime=1_000_000)
+
+    plan = plan_mirror(source, dest)
+    planned = dict(zip((relative_path for relative_path, _, _ in plan.files.iter_entries()), plan.operations))
+    assert planned == {'edit.txt': OP_UPDATE, 'new.txt': OP_COPY}
+    assert [os.path.basename(path) for path, _ in plan.deletes] == ['old.txt']
+    assert plan.unchanged_count == 1
+
+    result = run_mirror(plan, workers=2)
+    assert not result.failed_files
+    assert result.deleted_count == 1 and result.removed_dirs == 1
+    assert sorted(os.listdir(dest)) == sorted(['edit.txt', 'keep.txt', 'new.txt', *PROTECTED_FILES])
+    assert read(os.path.join(dest, 'edit.txt')) == b'version 2'
+
+
+def test_mirror_removes_directories_missing_from_source(tmp_path):
+    source, dest = str(tmp_path / 'src'), str(tmp_path / 'dest')
+    write(os.path.join(source, 'a.txt'), b'a')
+    os.makedirs(os.path.join(source, 'empty'))
+    # 目標中來源沒有的空資料夾，以及只剩被排除內容的資料夾
+    os.makedirs(os.path.join(dest, 'old', 'deeper'))
+    write(os.path.join(dest, 'cache', 'build.log'), b'log')
+    rules = ExclusionRules(patterns=['*.log'])
+
+    plan = plan_mirror(source, dest, rules)
+    assert plan.has_deletes and not plan.deletes
+    result = run_mirror(plan, workers=2)
+    assert not result.failed_files
+    assert result.removed_dirs == 2
+    assert sorted(os.listdir(dest)) == ['a.txt', 'cache']
+    assert not plan_mirror(source, dest, rules).has_deletes
+
+
+def test_mirror_rejects_stream(tmp_path, capsys):
+    source = tmp_path / 'src'
+    source.mkdir()
+    args = ['--config', str(tmp_path / 'config.json'), '--source', str(source), '--dest', str(tmp_path / 'dest')]
+    assert main(args + ['--mirror', '--stream']) == 2
+    assert '鏡像' in capsys.readouterr().err
+    assert not (tmp_path / 'dest').exists()
@@ -0,0 +1,95 @@
+"""封包庫：寫入與取出，以及中斷後再寫入"""
+import os
+
+import pytest
+
+from backup_core import PackStore, pack_tree
+from backup_core.packstore import PACK_DIR, SMALL_FILE_LIMIT, write_pack
+
+
+def make_source(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'sub').mkdir(parents=True)
+    (source / 'a.txt').write_bytes(b'alpha' * 100)
+    (source / 'sub' / 'b.txt').write_bytes(b'beta')
+    (source / 'sub' / 'dup.txt').write_bytes(b'alpha' * 100)  # 與 a.txt 內容相同，只存一份
+    return source
+
+
+def pack_files(store):
+    return sorted(os.listdir(os.path.join(store, PACK_DIR)))
+
+
+def extracted(store, dest, snapshot=None):
+    with PackStore(store) as pack:
+        result = pack.extract(str(dest), snapshot, workers=2)
+    assert not result.failed_files
+    contents = {}
+    for directory, _, names in os.walk(dest):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                contents[os.path.relpath(path, dest)] = f.read()
+    return contents
+
+
+def test_round_trip_after_interrupted_write(tmp_path):
+    source = make_source(tmp_path)
+    store = str(tmp_path / 'store')
+    first = pack_tree(str(source), store, workers=2)
+    assert not first.failed_files and first.copied_count == 3
+    pack_path = os.path.join(store, PACK_DIR, pack_files(store)[-1])
+    indexed_size = os.path.getsize(pack_path)
+
+    # 模擬中斷：內容已附加到封包檔，但讀到一半程序結束，索引沒有寫入
+    (source / 'c.txt').write_bytes(b'gamma' * 1000)
+
+    def interrupted():
+        yield str(source / 'c.txt'), 'c.txt'
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        write_pack(interrupted(), store, workers=2, source_dir=str(source))
+    with open(pack_path, 'ab') as f:
+        f.write(b'garbage from a crashed writer')
+    with PackStore(store) as pack:
+        assert len(pack.snapshots()) == 1
+
+    second = pack_tree(str(source), store, workers=2)
+    assert not second.failed_files
+    # 未被索引引用的尾端被截掉，只留下新內容
+    assert os.path.getsize(pack_path) == indexed_size + len(b'gamma' * 1000)
+
+    expected = {'a.txt': b'alpha' * 100, os.path.join('sub', 'b.txt'): b'beta',
+                os.path.join('sub', 'dup.txt'): b'alpha' * 100}
+    with PackStore(store) as pack:
+        snapshots = [snapshot.name for snapshot in pack.snapshots()]
+        assert pack.read('sub/b.txt') == b'beta'
+    assert len(snapshots) == 2
+    assert extracted(store, tmp_path / 'out1', snapshots[0]) == expected
+    assert extracted(store, tmp_path / 'out2') == dict(expected, **{'c.txt': b'gamma' * 1000})
+
+
+def test_touched_large_file_does_not_grow_pack(tmp_path):
+    source = make_source(tmp_path)
+    big = source / 'big.bin'
+    big.write_bytes(os.urandom(SMALL_FILE_LIMIT * 3))
+    store = str(tmp_path / 'store')
+    pack_tree(str(source), store, workers=2)
+    pack_path = os.path.join(store, PACK_DIR, pack_files(store)[-1])
+    size = os.path.getsize(pack_path)
+
+    # 只改修改時間 (例如 git checkout)：內容相同，寫入後發現已存在要捨棄
+    os.utime(big, (2_000_000_000, 2_000_000_000))
+    result = pack_tree(str(source), store, workers=2)
+    assert result.deduplicated_count == 1
+    assert result.bytes_written == 0
+    assert os.path.getsize(pack_path) == size
+
+    # 之後的新內容接著寫在原本的尾端，取出的內容正確
+    (source / 'new.txt').write_bytes(b'new')
+    pack_tree(str(source), store, workers=2)
+    assert os.path.getsize(pack_path) == size + 3
+    contents = extracted(store, tmp_path / 'out')
+    assert contents['big.bin'] == big.read_bytes()
+    assert contents['new.txt'] == b'new'
@@ -0,0 +1,41 @@
+"""串流備份：邊掃描邊複製的結果與先掃描再複製相同"""
+import os
+
+from backup_core import ExclusionRules, stream_backup
+
+
+def make_tree(source):
+    for i in range(40):
+        path = source / f'pkg{i % 5}' / f'file{i:02d}.js'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'x' * i)
+    (source / 'pkg0' / 'debug.log').write_bytes(b'log')
+
+
+def copied_files(dest):
+    return sorted(os.path.relpath(os.path.join(directory, name), dest)
+                  for directory, _, names in os.walk(dest) for name in names)
+
+
+def test_stream_copies_everything_and_applies_rules(tmp_path):
+    source, dest = tmp_path / 'src', tmp_path / 'dest'
+    make_tree(source)
+    progress = []
+    result = stream_backup(str(source), str(dest), ExclusionRules(patterns=['*.log']), workers=4, scan_workers=2,
+                           progress_callback=lambda done, found, finished: progress.append((done, found, finished)))
+    assert not result.failed_files
+    assert result.total_files == result.copied_count == 40
+    assert progress[-1] == (40, 40, True)
+    assert copied_files(dest) == sorted(os.path.join(f'pkg{i % 5}', f'file{i:02d}.js') for i in range(40))
+    # 資料夾的修改時間與來源相同
+    assert os.stat(dest / 'pkg3').st_mtime_ns == os.stat(source / 'pkg3').st_mtime_ns
+
+
+def test_incremental_stream_copies_only_changes(tmp_path):
+    source, dest = tmp_path / 'src', tmp_path / 'dest'
+    make_tree(source)
+    stream_backup(str(source), str(dest), incremental=True, workers=4)
+    (source / 'pkg1' / 'file01.js').write_bytes(b'changed')
+    result = stream_backup(str(source), str(dest), incremental=True, workers=4)
+    assert result.copied_count == 1 and result.unchanged_count == 40
+    assert (dest / 'pkg1' / 'file01.js').read_bytes() == b'changed'
@@ -0,0 +1,87 @@
+"""還原：選取項目、略過相同的檔案與暫存檔"""
+import os
+import shutil
+
+import pytest
+
+from backup_core import copy_files, default_config, plan_restore
+from backup_core.cli import run_backup, run_restore
+from backup_core.copier import PARTIAL_SUFFIX
+from backup_core.manifest import MANIFEST_FILE, save_manifest
+
+
+def make_backup(tmp_path):
+    backup = tmp_path / 'backup'
+    (backup / 'src' / 'lib').mkdir(parents=True)
+    (backup / 'src' / 'main.js').write_bytes(b'main')
+    (backup / 'src' / 'lib' / 'util.js').write_bytes(b'util')
+    (backup / 'src' / 'lib' / ('big.bin' + PARTIAL_SUFFIX)).write_bytes(b'half')
+    (backup / 'README.md').write_bytes(b'readme')
+    (backup / MANIFEST_FILE).write_text('{}')
+    return str(backup)
+
+
+def planned(plan):
+    return sorted(relative_path for relative_path, _, _ in plan.files.iter_entries())
+
+
+def test_restore_skips_partial_and_tool_files(tmp_path):
+    backup = make_backup(tmp_path)
+    plan = plan_restore(backup, str(tmp_path / 'target'))
+    assert planned(plan) == sorted(['README.md', os.path.join('src', 'main.js'), os.path.join('src', 'lib', 'util.js')])
+
+
+def test_restore_only_writes_differing_files(tmp_path):
+    backup = make_backup(tmp_path)
+    target = str(tmp_path / 'target')
+    shutil.copytree(backup, target)  # copytree 保留修改時間
+    with open(os.path.join(target, 'src', 'main.js'), 'wb') as f:
+        f.write(b'broken')
+    os.remove(os.path.join(target, 'README.md'))
+
+    # 記憶體預算很小時清單改寫到磁碟，結果相同
+    plan = plan_restore(backup, target, memory_budget=1)
+    assert planned(plan) == ['README.md', os.path.join('src', 'main.js')]
+    assert plan.unchanged_count == 1
+    result = copy_files(plan, workers=2)
+    assert not result.failed_files
+    with open(os.path.join(target, 'src', 'main.js'), 'rb') as f:
+        assert f.read() == b'main'
+
+
+def test_restore_selection_by_path_and_glob(tmp_path):
+    backup = make_backup(tmp_path)
+    target = str(tmp_path / 'target')
+    assert planned(plan_restore(backup, target, ['src/lib'])) == [os.path.join('src', 'lib', 'util.js')]
+    assert planned(plan_restore(backup, target, ['*.md'])) == ['README.md']
+    assert planned(plan_restore(backup, target, ['src/**/*.js', '!util.js'])) == [os.path.join('src', 'main.js')]
+
+
+def test_restore_after_timestamped_incremental_run(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'lib').mkdir(parents=True)
+    (source / 'lib' / 'same.js').write_bytes(b'same')
+    (source / 'changed.js').write_bytes(b'old')
+    config = default_config()
+    config.update(source_dir=str(source), dest_dir=str(tmp_path / 'backup'), append_timestamp=True,
+                  incremental=True, stats_dir='')
+    first = run_backup(config)
+    # 改成較早的時間戳記，下一次執行會建立新的快照
+    os.rename(first['dest'], str(tmp_path / 'backup_20000101_000000'))
+    (source / 'changed.js').write_bytes(b'new')
+    run_backup(config)
+
+    target = tmp_path / 'target'
+    stats = run_restore(config, str(target))
+    assert stats['restored'] == 2
+    assert (target / 'lib' / 'same.js').read_bytes() == b'same'
+    assert (target / 'changed.js').read_bytes() == b'new'
+
+
+def test_restore_refuses_incomplete_snapshot(tmp_path):
+    backup = make_backup(tmp_path)
+    save_manifest(backup, {'README.md': [6, 0, None], 'src/gone.js': [4, 0, None]})
+    with pytest.raises(ValueError, match='不完整'):
+        plan_restore(backup, str(tmp_path / 'target'))
+    # 只還原備份內完整的部分時不受影響
+    assert planned(plan_restore(backup, str(tmp_path / 'target'), ['*.md'])) == ['README.md']
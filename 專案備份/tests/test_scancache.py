@@ -0,0 +1,55 @@
+"""掃描快取：修改時間未變的資料夾直接使用快取，改變時重新讀取"""
+import os
+
+from backup_core import ScanCache, walk_tree
+
+
+def make_tree(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'sub').mkdir(parents=True)
+    (source / 'a.txt').write_bytes(b'a')
+    (source / 'sub' / 'b.txt').write_bytes(b'bb')
+    return str(source)
+
+
+def listed(source, cache):
+    return sorted((relative_path, size) for batch in walk_tree(source, workers=1, cache=cache)
+                  for _, relative_path, size, _ in batch)
+
+
+def test_unchanged_directories_come_from_cache(tmp_path):
+    source = make_tree(tmp_path)
+    cache = ScanCache()
+    first = listed(source, cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert listed(source, cache) == first
+    assert (cache.hits, cache.misses) == (2, 0)
+
+
+def test_changed_directory_is_read_again(tmp_path):
+    source = make_tree(tmp_path)
+    cache = ScanCache()
+    listed(source, cache)
+    sub = os.path.join(source, 'sub')
+    with open(os.path.join(sub, 'c.txt'), 'wb') as f:
+        f.write(b'ccc')
+    # 檔案系統的時間精確度可能很低，明確改變資料夾的修改時間
+    st = os.stat(sub)
+    os.utime(sub, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert (os.path.join('sub', 'c.txt'), 3) in listed(source, cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    source = make_tree(tmp_path)
+    cache = ScanCache()
+    first = listed(source, cache)
+    path = str(tmp_path / 'cache' / 'scan.json')
+    cache.save(path)
+
+    loaded = ScanCache.load(path, source)
+    assert len(loaded) == len(cache) == 2
+    assert listed(source, loaded) == first
+    assert (loaded.hits, loaded.misses) == (2, 0)
+    # 其他來源資料夾的快取不能沿用
+    assert len(ScanCache.load(path, str(tmp_path / 'other'))) == 0
@@ -0,0 +1,44 @@
+"""資料夾走訪：平行與單執行緒的結果相同，排除的資料夾不進入，不跟隨指向資料夾的符號連結"""
+import os
+
+import pytest
+
+from backup_core import ExclusionRules, walk_tree
+
+
+def make_tree(root):
+    for relative_path in ('a.txt', os.path.join('src', 'b.js'), os.path.join('src', 'deep', 'c.js'),
+                          os.path.join('node_modules', 'pkg', 'index.js'), os.path.join('docs', 'd.md')):
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(relative_path.encode())
+
+
+def walked(root, rules=None, workers=1):
+    return sorted((relative_path, size) for batch in walk_tree(str(root), rules, workers)
+                  for _, relative_path, size, _ in batch)
+
+
+def test_parallel_walk_matches_os_walk(tmp_path):
+    make_tree(tmp_path)
+    expected = sorted((os.path.relpath(os.path.join(directory, name), tmp_path),
+                       os.path.getsize(os.path.join(directory, name)))
+                      for directory, _, names in os.walk(tmp_path) for name in names)
+    assert walked(tmp_path, workers=1) == expected
+    assert walked(tmp_path, workers=4) == expected
+
+
+def test_excluded_directories_are_not_entered(tmp_path):
+    make_tree(tmp_path)
+    rules = ExclusionRules(excluded_exact=['node_modules'], patterns=['*.md'])
+    assert [path for path, _ in walked(tmp_path, rules, workers=4)] == sorted(
+        ['a.txt', os.path.join('src', 'b.js'), os.path.join('src', 'deep', 'c.js')])
+
+
+def test_directory_symlinks_are_not_followed(tmp_path):
+    make_tree(tmp_path)
+    try:
+        os.symlink(tmp_path / 'src', tmp_path / 'link', target_is_directory=True)
+    except (OSError, NotImplementedError):
+        pytest.skip("無法建立符號連結")
+    assert not any(path.startswith('link') for path, _ in walked(tmp_path, workers=4))
@@ -0,0 +1,37 @@
+"""時間戳記快照：找出上一個快照，未變更的檔案以硬連結共用且不會改到舊快照"""
+import os
+
+from backup_core import copy_files, find_previous_snapshot, list_snapshots, scan_files
+
+
+def test_list_and_find_previous_snapshot(tmp_path):
+    base = str(tmp_path / 'backup')
+    for name in ('backup_20240102_000000', 'backup_20240101_120000', 'backup_20240103_000000', 'backup_old',
+                 'other_20240104_000000'):
+        (tmp_path / name).mkdir()
+    (tmp_path / 'backup_20240105_000000').write_bytes(b'not a folder')
+    assert [timestamp for timestamp, _ in list_snapshots(base)] == [
+        '20240101_120000', '20240102_000000', '20240103_000000']
+    current = str(tmp_path / 'backup_20240103_000000')
+    assert find_previous_snapshot(base, current) == str(tmp_path / 'backup_20240102_000000')
+    assert find_previous_snapshot(str(tmp_path / 'none')) is None
+
+
+def test_linked_snapshot_does_not_change_previous(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / 'same.txt').write_bytes(b'same')
+    (source / 'changed.txt').write_bytes(b'old')
+    previous = tmp_path / 'backup_20240101_000000'
+    copy_files(scan_files(str(source), str(previous)), workers=2)
+
+    (source / 'changed.txt').write_bytes(b'new version')
+    current = tmp_path / 'backup_20240102_000000'
+    # 目標中已有與舊快照共用的硬連結 (例如上一次中斷)，不能直接覆寫
+    current.mkdir()
+    os.link(previous / 'changed.txt', current / 'changed.txt')
+    result = copy_files(scan_files(str(source), str(current)), workers=2, link_dest=str(previous))
+    assert result.methods.get('hardlink') == 1
+    assert os.path.samefile(current / 'same.txt', previous / 'same.txt')
+    assert (current / 'changed.txt').read_bytes() == b'new version'
+    assert (previous / 'changed.txt').read_bytes() == b'old'
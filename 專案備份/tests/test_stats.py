@@ -0,0 +1,60 @@
+"""執行統計：位元組進度、失敗扣回、略過與硬連結不計入速度、寫入統計檔"""
+import json
+import os
+
+from backup_core import RunStats, copy_files, default_config, save_run_stats, scan_files
+
+
+def test_partial_progress_and_failure():
+    stats = RunStats(total_files=2, total_bytes=300)
+    stats.add_bytes(60)
+    stats.file_done(100, 0.005)  # 補上未逐段回報的 40 位元組
+    stats.add_bytes(50)
+    stats.file_failed()
+    stats.finish()
+    snapshot = stats.snapshot()
+    assert snapshot['files_done'] == 1 and snapshot['bytes_done'] == 100
+    assert snapshot['latency_histogram']['<10ms'] == 1
+    assert snapshot['eta_seconds'] is None
+
+
+def test_skipped_bytes_count_as_progress_not_speed():
+    stats = RunStats(total_files=2, total_bytes=1000)
+    stats.skip(900)
+    stats.file_done(100, 0.0)
+    snapshot = stats.snapshot()
+    assert snapshot['bytes_done'] == 100
+    assert snapshot['files_skipped'] == 1 and snapshot['bytes_skipped'] == 900
+
+
+def test_hard_linked_files_are_skipped_bytes(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / 'same.bin').write_bytes(b'x' * 1000)
+    (source / 'changed.bin').write_bytes(b'old')
+    previous = tmp_path / 'previous'
+    copy_files(scan_files(str(source), str(previous)), workers=1)
+    (source / 'changed.bin').write_bytes(b'new content')
+
+    result = copy_files(scan_files(str(source), str(tmp_path / 'current')), workers=2, link_dest=str(previous))
+    assert result.methods.get('hardlink') == 1
+    snapshot = result.stats.snapshot()
+    assert snapshot['files_done'] == 1 and snapshot['bytes_done'] == len(b'new content')
+    assert snapshot['files_skipped'] == 1 and snapshot['bytes_skipped'] == 1000
+
+
+def test_save_run_stats_writes_one_file_per_run(tmp_path):
+    stats_dir = str(tmp_path / 'stats')
+    stats = RunStats(total_files=1, total_bytes=10)
+    stats.file_done(10, 0.0)
+    stats.finish()
+    first = save_run_stats(stats_dir, stats, {'mode': 'copy'})
+    second = save_run_stats(stats_dir, stats)
+    assert first != second and len(os.listdir(stats_dir)) == 2
+    with open(first, encoding='utf-8') as f:
+        data = json.load(f)
+    assert data['mode'] == 'copy' and data['bytes_done'] == 10
+
+
+def test_stats_are_not_written_by_default():
+    assert default_config()['stats_dir'] == ''
@@ -0,0 +1,34 @@
+"""備份完整性驗證：複製時記錄校驗碼，之後找出損壞與遺失的檔案"""
+import os
+
+import pytest
+
+from backup_core import copy_files, scan_files, verify_backup
+
+
+def test_verify_reports_corrupted_and_missing_files(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'sub').mkdir(parents=True)
+    (source / 'ok.txt').write_bytes(b'fine')
+    (source / 'sub' / 'corrupt.bin').write_bytes(b'0123456789')
+    (source / 'gone.txt').write_bytes(b'gone')
+    dest = tmp_path / 'dest'
+    result = copy_files(scan_files(str(source), str(dest)), workers=2, verify=True)
+    assert not result.failed_files
+    assert verify_backup(str(dest)).is_ok
+
+    # 大小不變只改一個位元組，必須比對內容才找得到
+    with open(dest / 'sub' / 'corrupt.bin', 'r+b') as f:
+        f.seek(4)
+        f.write(b'X')
+    os.remove(dest / 'gone.txt')
+    verified = verify_backup(str(dest))
+    assert not verified.is_ok
+    assert verified.checked_count == 3 and verified.ok_count == 1
+    assert [key for key, _ in verified.mismatched] == ['sub/corrupt.bin']
+    assert verified.missing == ['gone.txt']
+
+
+def test_verify_without_checksums_is_an_error(tmp_path):
+    with pytest.raises(ValueError):
+        verify_backup(str(tmp_path))
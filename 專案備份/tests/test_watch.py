@@ -0,0 +1,59 @@
+"""持續同步：變動的合併與等待時間、定期掃描的比對"""
+import os
+
+from backup_core import watch
+from backup_core.watch import CHANGE_DIR, CHANGE_FILE, CHANGE_RESCAN, ChangeBatcher, PollingWatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_batcher_waits_for_quiet_period_and_max_delay(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(watch.time, 'monotonic', clock)
+    batcher = ChangeBatcher(debounce=2.0, max_delay=5.0)
+    assert batcher.wait_time() is None
+    batcher.add(CHANGE_FILE, 'a.txt')
+    assert batcher.wait_time() == 2.0
+    # 持續有變動時延後，但不超過第一個變動後 max_delay 秒
+    for _ in range(4):
+        clock.now += 1.5
+        batcher.add(CHANGE_FILE, 'a.txt')
+    assert batcher.wait_time() == 0.0
+    assert batcher.take() == (False, {'a.txt'}, {})
+    assert not batcher and batcher.wait_time() is None
+
+
+def test_batcher_merges_paths_inside_changed_directories():
+    batcher = ChangeBatcher()
+    batcher.add(CHANGE_FILE, os.path.join('src', 'a.js'))
+    batcher.add(CHANGE_FILE, 'README.md')
+    batcher.add(CHANGE_DIR, os.path.join('src', 'lib'), 'rules')
+    batcher.add(CHANGE_DIR, 'src', None)
+    assert batcher.take() == (False, {'README.md'}, {'src': None})
+
+    batcher.add(CHANGE_FILE, 'README.md')
+    batcher.add(CHANGE_RESCAN, '')
+    assert batcher.take() == (True, set(), {})
+
+
+def test_polling_watcher_reports_create_modify_delete(tmp_path):
+    (tmp_path / 'keep.txt').write_bytes(b'keep')
+    (tmp_path / 'edit.txt').write_bytes(b'old')
+    (tmp_path / 'gone.txt').write_bytes(b'gone')
+    watcher = PollingWatcher(str(tmp_path), interval=0)
+
+    (tmp_path / 'edit.txt').write_bytes(b'new content')
+    (tmp_path / 'gone.txt').unlink()
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'new.txt').write_bytes(b'new')
+    changes = watcher.read(0)
+    assert sorted(changes) == sorted([(CHANGE_FILE, 'edit.txt', None), (CHANGE_FILE, 'gone.txt', None),
+                                      (CHANGE_FILE, os.path.join('sub', 'new.txt'), None)])
+    assert watcher.read(0) == []
+    watcher.close()
@@ -1,29 +1,61 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import os
-import shutil
+import re
 import threading
+import time
 import tkinter.ttk as ttk # 匯入 ttk
-import json # 匯入 json
-import datetime # 匯入 datetime
+import tkinter.font as tkfont
+
+# 掃描、排除與複製邏輯放在不依賴 tkinter 的 backup_core，命令列版 (python -m backup_core) 共用同一套流程
+import backup_core
+from backup_core import (
+    CONFIG_FILE,
+    DEFAULT_COPY_WORKERS,
+    DEFAULT_SCAN_WORKERS,
+    MAX_COPY_WORKERS,
+    OUTPUT_MODES,
+    OUTPUT_PACK,
+    ExclusionRules,
+    MirrorPlan,
+    PreviewIndex,
+    RunStats,
+    ScanCache,
+    archive_path_for,
+    archive_scan,
+    archive_tree,
+    clamp_workers,
+    copy_files,
+    fanout_copy,
+    find_previous_snapshot,
+    find_unfinished_snapshot,
+    format_size,
+    get_extra_dest_dirs,
+    list_restore_points,
+    list_snapshots,
+    pack_scan,
+    pack_store_path,
+    pack_tree,
+    plan_mirror,
+    plan_restore,
+    run_mirror,
+    save_run_stats,
+    scan_files,
+    stream_backup,
+    unsupported_options,
+    validate_paths,
+    verify_backup,
+    watch_backup,
+)
 
-# --- 設定區 ---
-# 預設排除規則 - 如果設定檔沒有會用這些
-DEFAULT_EXCLUDED_FOLDERS_EXACT = {".git", "node_modules"}
-DEFAULT_EXCLUDED_FOLDERS_PREFIX = {"firebase-export-"}
-# --- 設定區結束 ---
-
-# 設定檔名稱
-CONFIG_FILE = "config.json"
-
-# 將排除列表轉換為小寫，方便比較 - 現在由 load_config 初始化
-EXCLUDED_FOLDERS_EXACT_LOWER = set()
-EXCLUDED_FOLDERS_PREFIX_LOWER = set()
 # 全域變數儲存原始大小寫的排除列表，用於編輯器
 excluded_exact_list = []
 excluded_prefix_list = []
+exclude_patterns_list = [] # gitignore 格式的規則 (萬用字元、! 反向)，依順序套用
+use_gitignore = False # 是否套用專案內各層的 .gitignore
 
 # --- 全域變數 ---
+root = None
 source_dir_var = None
 dest_dir_var = None
 status_label_var = None
@@ -34,38 +66,147 @@ total_files_count = 0
 progress_bar = None # 新增進度條變數
 preview_button = None # 新增預覽按鈕變數
 editor_button = None # 新增編輯規則按鈕
+stream_button = None # 新增串流備份按鈕
+verify_button = None # 新增驗證備份按鈕
 append_timestamp_var = None # 新增時間戳記開關變數
 calculate_full_button = None # 新增計算完整按鈕變數
 last_calculation_mode = None # 追蹤上次計算模式 ('selective' or 'full')
+incremental_var = None # 新增增量備份開關變數
+manifest_hash_var = None # 新增清單記錄內容雜湊開關變數
+copy_workers_var = None # 新增複製執行緒數變數
+snapshot_links_var = None # 新增快照硬連結開關變數
+current_scan = None # 最近一次計算的結果 (backup_core.ScanResult)
+preview_index = None # 預覽視窗用的索引 (backup_core.PreviewIndex)，開啟預覽時才建立
+scan_workers = DEFAULT_SCAN_WORKERS # 掃描執行緒數 (只存在設定檔中)
+copy_method = 'auto' # 複製方式 (只存在設定檔中，見 backup_core.COPY_METHODS)
+copy_buffer_size = 1024 * 1024 # 一般讀寫時的緩衝區大小 (只存在設定檔中)
+unchanged_files_count = 0 # 增量模式下未變更而略過的檔案數
+output_mode_var = None # 新增輸出方式變數 ('folder' 或封存格式)
+archive_level = None # 封存壓縮等級 (只存在設定檔中，None 使用各格式的預設值)
+scan_cache = None # 來源資料夾內容的快取 (backup_core.ScanCache)，重新計算時只讀取有變動的資料夾
+scan_cache_file = '' # 掃描快取的檔案路徑 (只存在設定檔中，空白時只保存在記憶體中)
+resume_journal_var = None # 新增續傳日誌開關變數
+mirror_var = None # 新增鏡像模式開關變數
+mirror_prune_excluded = False # 鏡像模式下是否也刪除目標中被排除的檔案 (只存在設定檔中)
+copy_retries = 3 # 暫時性錯誤的重試次數 (只存在設定檔中)
+retry_delay = 1.0 # 第一次重試前等待的秒數 (只存在設定檔中)
+verify_var = None # 新增複製時計算校驗碼開關變數
+current_stats = None # 目前複製的執行統計 (backup_core.RunStats)，進度以位元組計算
+stats_dir = '' # 每次執行的統計寫入的資料夾 (只存在設定檔中，空白時不寫入)
+plan_memory_mb = 512 # 檔案清單在記憶體中的上限 (只存在設定檔中，超過時改寫到暫存檔)
+large_file_mb = 256 # 超過這個大小 (MB) 的檔案分段平行複製 (只存在設定檔中，0 為停用)
+delta_transfer = False # 差異傳輸：目標已有舊版本的大檔案只改寫不同的區塊 (只存在設定檔中)
+delta_file_mb = 64 # 差異傳輸只用在這個大小 (MB) 以上的檔案 (只存在設定檔中)
+extra_dest_dirs = [] # 多目標備份：每個檔案只讀一次，同時也寫入這些資料夾 (只存在設定檔中)
+fanout_lag_mb = 256 # 多目標備份時快的目標最多比慢的目標超前多少 MB (只存在設定檔中)
+fanout_stats = None # 多目標備份時其他目標的執行統計 (進度中分別顯示)
+watch_button = None # 新增持續同步按鈕
+restore_button = None # 新增從備份還原按鈕
+watch_stop_event = None # 持續同步進行中時為 threading.Event，設定後停止
+watch_debounce = 2.0 # 持續同步時變動停止多少秒後才複製 (只存在設定檔中)
+watch_poll_interval = 5.0 # 無法使用 inotify 時重新掃描的間隔 (只存在設定檔中)
 
 # --- 核心功能函式 ---
 
 def get_actual_dest_dir():
-    """根據時間戳記開關狀態獲取實際的目標資料夾路徑"""
-    base_dest_dir = dest_dir_var.get()
-    if not base_dest_dir:
-        return None # 如果基礎路徑未設定，返回 None
-
-    if append_timestamp_var and append_timestamp_var.get():
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        # 嘗試從基礎路徑分離檔名和副檔名（如果有的話），將時間戳加在名稱後面
-        base_name, ext = os.path.splitext(os.path.basename(base_dest_dir))
-        dir_name = os.path.dirname(base_dest_dir)
-        # 組合新的帶時間戳記的名稱
-        new_name = f"{base_name}_{timestamp}{ext}" if ext else f"{base_name}_{timestamp}"
-        return os.path.join(dir_name, new_name)
-    else:
-        return base_dest_dir
-
-def is_excluded(folder_name):
-    """檢查資料夾名稱是否應該被排除 (使用全域小寫集合)"""
-    lower_name = folder_name.lower()
-    if lower_name in EXCLUDED_FOLDERS_EXACT_LOWER:
-        return True
-    for prefix in EXCLUDED_FOLDERS_PREFIX_LOWER:
-        if lower_name.startswith(prefix):
-            return True
-    return False
+    """根據時間戳記開關狀態獲取實際的目標資料夾路徑 (續傳時沿用上次未完成的快照)"""
+    append_timestamp = bool(append_timestamp_var and append_timestamp_var.get())
+    if append_timestamp and get_resume() and get_output_mode() == 'folder':
+        unfinished = find_unfinished_snapshot(dest_dir_var.get())
+        if unfinished:
+            return unfinished
+    return backup_core.get_actual_dest_dir(dest_dir_var.get(), append_timestamp)
+
+def is_mirror_mode():
+    """是否為鏡像模式 (只適用於資料夾輸出)"""
+    return bool(mirror_var and mirror_var.get()) and get_output_mode() == 'folder'
+
+def has_pending_work(scan):
+    """計算結果中是否有要複製 (或鏡像模式下要刪除) 的檔案"""
+    if scan is None:
+        return False
+    return bool(scan.files) or (isinstance(scan, MirrorPlan) and scan.has_deletes)
+
+def get_resume():
+    """是否記錄複製日誌 (中斷後可續傳)"""
+    return bool(resume_journal_var and resume_journal_var.get())
+
+def get_verify():
+    """是否在複製時計算校驗碼 (只適用於資料夾輸出)"""
+    return bool(verify_var and verify_var.get()) and get_output_mode() == 'folder'
+
+def get_delta_threshold():
+    """差異傳輸的大小門檻 (位元組)，未開啟時為 None"""
+    return delta_file_mb * 1024 * 1024 if delta_transfer else None
+
+def get_fanout_dest_dirs(actual_dest_dir):
+    """多目標備份的其他目標資料夾 (加上與主要目標相同的時間戳記)，只用於一般的資料夾備份"""
+    if not extra_dest_dirs or get_output_mode() != 'folder':
+        return []
+    return get_extra_dest_dirs(extra_dest_dirs, dest_dir_var.get(), actual_dest_dir)
+
+def get_copy_workers():
+    """取得複製執行緒數 (輸入無效時使用預設值)"""
+    try:
+        return clamp_workers(copy_workers_var.get() if copy_workers_var else DEFAULT_COPY_WORKERS)
+    except tk.TclError:
+        return DEFAULT_COPY_WORKERS
+
+def get_output_mode():
+    """取得輸出方式：'folder' 複製成資料夾，其餘為封存格式 (例如 'tar.gz')"""
+    mode = output_mode_var.get() if output_mode_var else 'folder'
+    return mode if mode in OUTPUT_MODES else 'folder'
+
+def get_output_path(actual_dest_dir):
+    """實際寫入的位置：資料夾模式為目標資料夾，封存模式為加上副檔名的封存檔，封包庫不加時間戳記 (所有快照共用)"""
+    output_mode = get_output_mode()
+    if output_mode == 'folder' or not actual_dest_dir:
+        return actual_dest_dir
+    if output_mode == OUTPUT_PACK:
+        return pack_store_path(dest_dir_var.get())
+    return archive_path_for(actual_dest_dir, output_mode)
+
+def get_scan_cache(source_dir):
+    """取得來源資料夾的掃描快取 (第一次使用時從磁碟讀取)"""
+    global scan_cache
+    if scan_cache is None or scan_cache.source_dir != source_dir:
+        scan_cache = ScanCache.load(scan_cache_file, source_dir) if scan_cache_file else ScanCache(source_dir)
+    return scan_cache
+
+def save_scan_cache(cache):
+    """設定了掃描快取檔案時寫回磁碟 (在背景線程呼叫)"""
+    if scan_cache_file:
+        try:
+            cache.save(scan_cache_file)
+        except OSError as e:
+            print(f"儲存掃描快取 {scan_cache_file} 時發生錯誤: {e}")
+
+def save_run_statistics(stats, info):
+    """設定了統計資料夾時寫入本次執行的統計 (在背景線程呼叫，info 需在主線程先準備好)"""
+    if stats is None or not stats_dir:
+        return
+    try:
+        save_run_stats(stats_dir, stats, info)
+    except OSError as e:
+        print(f"儲存執行統計到 {stats_dir} 時發生錯誤: {e}")
+
+def get_exclusion_rules():
+    """依目前的排除設定編譯規則 (在啟動計算時呼叫一次)"""
+    return ExclusionRules(excluded_exact_list, excluded_prefix_list, exclude_patterns_list, use_gitignore)
+
+def get_link_dest(actual_dest_dir):
+    """快照硬連結開啟時回傳上一個時間戳記快照的路徑，否則回傳 None
+
+    加上時間戳記的增量備份一律使用硬連結，讓每個快照都完整 (多目標備份除外，改為完整複製)。
+    """
+    if get_output_mode() != 'folder': # 封存檔無法與資料夾快照共用檔案
+        return None
+    if not (append_timestamp_var and append_timestamp_var.get()):
+        return None
+    implied = bool(incremental_var and incremental_var.get()) and not extra_dest_dirs
+    if not (snapshot_links_var and snapshot_links_var.get()) and not implied:
+        return None
+    return find_previous_snapshot(dest_dir_var.get(), actual_dest_dir)
 
 def select_directory(dir_var, title="選擇資料夾"):
     """開啟資料夾選擇對話框並更新變數"""
@@ -77,15 +218,31 @@ def select_directory(dir_var, title="選擇資料夾"):
         # 儲存設定 (包含路徑和規則)
         save_config()
 
+def on_incremental_toggle():
+    """增量備份設定變更時儲存並重新計算"""
+    save_config()
+    reset_calculation()
+
+def on_output_mode_change(event=None):
+    """輸出方式變更時儲存並重新計算 (封存模式不使用增量清單)"""
+    save_config()
+    reset_calculation()
+
 def reset_calculation():
     """重置計算狀態和按鈕"""
-    global files_to_copy_list, total_files_count
+    global files_to_copy_list, total_files_count, current_scan, unchanged_files_count, preview_index
     files_to_copy_list = []
     total_files_count = 0
+    current_scan = None
+    preview_index = None
+    unchanged_files_count = 0
     status_label_var.set("請先選擇來源和目標資料夾，然後計算檔案數量。(可編輯排除規則或開啓時間戳記)")
     copy_button.config(state=tk.DISABLED)
     calculate_button.config(state=tk.NORMAL)
     if progress_bar: # 重置進度條
+        if str(progress_bar['mode']) != 'determinate': # 串流備份中途出錯時停止不確定模式
+            progress_bar.stop()
+            progress_bar.config(mode='determinate')
         progress_bar['value'] = 0
         progress_bar['maximum'] = 100 # 預設值
     if preview_button: # 重置預覽按鈕
@@ -95,6 +252,14 @@ def reset_calculation():
     last_calculation_mode = None
     if calculate_full_button:
         calculate_full_button.config(state=tk.NORMAL)
+    if stream_button:
+        stream_button.config(state=tk.NORMAL)
+    if verify_button:
+        verify_button.config(state=tk.NORMAL)
+    if watch_button:
+        watch_button.config(state=tk.NORMAL)
+    if restore_button:
+        restore_button.config(state=tk.NORMAL)
 
 def calculate_files_to_copy():
     """計算需要複製的檔案數量和列表 (排除模式)"""
@@ -112,26 +277,24 @@ def _start_file_calculation(ignore_exclusions, mode):
     source_dir = source_dir_var.get()
     actual_dest_dir = get_actual_dest_dir()
 
-    if not source_dir or not actual_dest_dir:
-        messagebox.showerror("錯誤", "請先選擇來源和目標資料夾！")
-        return
-
-    if not os.path.isdir(source_dir):
-         messagebox.showerror("錯誤", f"來源資料夾不存在或無效：\n{source_dir}")
-         return
-
-    # 檢查目標是否為來源的子資料夾
     try:
-        if source_dir == actual_dest_dir or os.path.commonpath([source_dir]) == os.path.commonpath([source_dir, actual_dest_dir]):
-             messagebox.showerror("錯誤", "目標資料夾不能是來源資料夾本身或其子資料夾！")
-             return
-    except ValueError: # 如果路徑在不同磁碟機會引發 ValueError
-        pass # 不同磁碟機則肯定不是子資料夾
+        validate_paths(source_dir, get_output_path(actual_dest_dir))
+    except ValueError as e:
+        messagebox.showerror("錯誤", str(e))
+        return
 
     files_to_copy_list = []
     total_files_count = 0
     last_calculation_mode = mode # 記錄本次計算模式
     mode_text = "(完整模式)" if ignore_exclusions else "(排除模式)"
+    mirror = is_mirror_mode()
+    # 封存檔每次都包含完整內容，鏡像模式直接比對目標，都不套用增量清單
+    incremental = bool(incremental_var and incremental_var.get()) and get_output_mode() == 'folder' and not mirror
+    use_hash = incremental and bool(manifest_hash_var and manifest_hash_var.get())
+    if incremental:
+        mode_text += "(增量)"
+    if mirror:
+        mode_text += "(鏡像)"
     status_label_var.set(f"正在計算檔案數量 {mode_text}...")
 
     # 禁用所有計算和複製按鈕
@@ -144,28 +307,23 @@ def _start_file_calculation(ignore_exclusions, mode):
     if progress_bar:
         progress_bar['value'] = 0
 
+    # 排除規則在啟動計算時固定下來，完整模式不套用
+    rules = None if ignore_exclusions else get_exclusion_rules()
+    cache = get_scan_cache(source_dir)
+    memory_budget = plan_memory_mb * 1024 * 1024
+
     # 使用 threading 避免 GUI 卡住
     def calculation_thread():
-        global total_files_count
         try:
-            count = 0
-            temp_file_list = []
-            for dirpath, dirs, files in os.walk(source_dir, topdown=True):
-                # --- 核心排除/完整邏輯 --- #
-                if not ignore_exclusions:
-                    # 只有在非忽略排除模式下才修改 dirs
-                    dirs[:] = [d for d in dirs if not is_excluded(d)]
-                # --- 邏輯結束 --- #
-
-                for file in files:
-                    source_path = os.path.join(dirpath, file)
-                    relative_path = os.path.relpath(source_path, source_dir)
-                    dest_path = os.path.join(actual_dest_dir, relative_path)
-                    temp_file_list.append((source_path, dest_path))
-                    count += 1
-
+            if mirror:
+                scan = plan_mirror(source_dir, actual_dest_dir, rules, workers=scan_workers,
+                                   prune_excluded=mirror_prune_excluded, cache=cache, memory_budget=memory_budget)
+            else:
+                scan = scan_files(source_dir, actual_dest_dir, rules, incremental=incremental, use_hash=use_hash,
+                                  workers=scan_workers, cache=cache, memory_budget=memory_budget)
+            save_scan_cache(cache)
             # 計算完成後，在主線程更新全域變數和 UI
-            root.after(0, lambda fl=temp_file_list, c=count: update_calculation_result(fl, c))
+            root.after(0, lambda s=scan: update_calculation_result(s))
 
         except Exception as e:
              # 使用輔助函式處理錯誤
@@ -175,24 +333,35 @@ def _start_file_calculation(ignore_exclusions, mode):
     thread = threading.Thread(target=calculation_thread, daemon=True)
     thread.start()
 
-def update_calculation_result(calculated_list, calculated_count):
+def update_calculation_result(scan):
     """在主線程中更新計算結果的 UI"""
     global files_to_copy_list, total_files_count, last_calculation_mode
-    files_to_copy_list = calculated_list
-    total_files_count = calculated_count
+    global current_scan, unchanged_files_count, preview_index
+    current_scan = scan
+    preview_index = None # 新的計算結果，預覽索引下次開啟時重建
+    files_to_copy_list = scan.files
+    total_files_count = scan.total_files
+    unchanged_files_count = scan.unchanged_count
 
     mode_text = "(完整模式)" if last_calculation_mode == 'full' else "(排除模式)"
+    # 增量模式時顯示變更/未變更的數量
+    incremental_text = f"（{total_files_count} 個已變更 / {unchanged_files_count} 個未變更）" if scan.incremental else ""
 
-    if total_files_count > 0:
-        status_label_var.set(f"計算完成 {mode_text}！總共需要複製 {total_files_count} 個檔案。可以開始複製。")
+    if isinstance(scan, MirrorPlan): # 鏡像模式另外顯示更新與刪除的數量
+        mode_text += "(鏡像)"
+        incremental_text = (f"（其中 {scan.update_count} 個更新，{unchanged_files_count} 個未變更；"
+                            f"將刪除 {scan.delete_count} 個目標中多餘的檔案 ({format_size(scan.delete_bytes)})）")
+
+    if has_pending_work(scan):
+        status_label_var.set(f"計算完成 {mode_text}！總共需要複製 {total_files_count} 個檔案 ({format_size(scan.total_bytes)}){incremental_text}。可以開始複製。")
         copy_button.config(state=tk.NORMAL)
         if preview_button:
             preview_button.config(state=tk.NORMAL)
         if progress_bar:
-            progress_bar['maximum'] = total_files_count
+            progress_bar['maximum'] = max(1, total_files_count + (scan.delete_count if isinstance(scan, MirrorPlan) else 0))
             progress_bar['value'] = 0
     else:
-        status_label_var.set(f"計算完成 {mode_text}，沒有找到需要複製的檔案（或來源為空）。")
+        status_label_var.set(f"計算完成 {mode_text}，沒有找到需要複製的檔案（或來源為空）{incremental_text}。")
         copy_button.config(state=tk.DISABLED)
         if preview_button:
             preview_button.config(state=tk.DISABLED)
@@ -215,18 +384,48 @@ def show_error_and_reset(error_message):
 
 def start_copying():
     """開始執行複製操作"""
-    global files_to_copy_list, total_files_count
-    if not files_to_copy_list:
+    global files_to_copy_list, total_files_count, current_stats, fanout_stats
+    if not has_pending_work(current_scan):
         messagebox.showwarning("提示", "沒有需要複製的檔案，請先計算檔案數量。")
         return
+    mirror = isinstance(current_scan, MirrorPlan)
 
-    # --- 修改：使用實際目標路徑確認 --- #
-    actual_dest_dir = get_actual_dest_dir()
+    # --- 修改：使用計算時決定的目標路徑確認 --- #
+    actual_dest_dir = current_scan.dest_dir
     if not actual_dest_dir:
         messagebox.showerror("錯誤", "無法獲取目標資料夾路徑！")
         return
 
-    confirm_message = f"確定要將 {total_files_count} 個檔案從\n{source_dir_var.get()}\n複製到\n{actual_dest_dir}\n嗎？\n(目標資料夾內若有同名檔案將被覆蓋)"
+    output_mode = get_output_mode()
+    extra_dirs = [] if mirror else get_fanout_dest_dirs(actual_dest_dir)
+    try:
+        for extra_dir in extra_dirs:
+            validate_paths(current_scan.source_dir, extra_dir)
+    except ValueError as e:
+        messagebox.showerror("錯誤", str(e))
+        return
+    link_dest = get_link_dest(actual_dest_dir)
+    unsupported = unsupported_options(copy_method, link_dest, delta_transfer) if extra_dirs else []
+    if unsupported: # 多目標備份無法套用的選項不默默忽略
+        messagebox.showerror("錯誤", f"多目標備份不能與{'、'.join(unsupported)}同時使用，請先關閉後再複製。")
+        return
+    link_text = f"\n(未變更的檔案將以硬連結共用快照：{link_dest})" if link_dest else ""
+    if mirror:
+        confirm_message = (f"確定要將\n{actual_dest_dir}\n同步成與\n{source_dir_var.get()}\n相同嗎？\n"
+                           f"將複製 {total_files_count} 個檔案 (其中 {current_scan.update_count} 個覆蓋既有檔案)，"
+                           f"並刪除 {current_scan.delete_count} 個來源已不存在的檔案。\n(刪除無法復原，建議先預覽)")
+        if extra_dest_dirs:
+            confirm_message += "\n(鏡像模式只同步主要的目標資料夾，不寫入其他目標)"
+    elif extra_dirs:
+        extra_text = "\n".join(extra_dirs)
+        confirm_message = (f"確定要將 {total_files_count} 個檔案從\n{source_dir_var.get()}\n複製到\n{actual_dest_dir}\n"
+                           f"並同時寫入\n{extra_text}\n嗎？\n(每個檔案只讀取一次，目標資料夾內若有同名檔案將被覆蓋)")
+    elif output_mode == 'folder':
+        confirm_message = f"確定要將 {total_files_count} 個檔案從\n{source_dir_var.get()}\n複製到\n{actual_dest_dir}\n嗎？\n(目標資料夾內若有同名檔案將被覆蓋){link_text}"
+    elif output_mode == OUTPUT_PACK:
+        confirm_message = f"確定要將 {total_files_count} 個檔案從\n{source_dir_var.get()}\n寫入封包庫\n{get_output_path(actual_dest_dir)}\n的新快照嗎？\n(內容相同的檔案只保存一份)"
+    else:
+        confirm_message = f"確定要將 {total_files_count} 個檔案從\n{source_dir_var.get()}\n寫入封存檔\n{get_output_path(actual_dest_dir)}\n嗎？\n(同名的封存檔將被覆蓋)"
     if not messagebox.askyesno("確認複製", confirm_message):
         return
     # --- 修改結束 --- #
@@ -234,33 +433,76 @@ def start_copying():
     status_label_var.set(f"正在複製 0 / {total_files_count} 個檔案...")
     calculate_button.config(state=tk.DISABLED)
     copy_button.config(state=tk.DISABLED)
-
-    # 使用 threading 避免 GUI 卡住
+    if stream_button:
+        stream_button.config(state=tk.DISABLED)
+
+    scan = current_scan # 複製期間固定使用這份計算結果
+    worker_count = get_copy_workers()
+    use_hash = bool(manifest_hash_var and manifest_hash_var.get())
+    resume = get_resume()
+    verify = get_verify()
+    resume_hint = "\n\n已完成的檔案記錄在複製日誌中，重新執行時會從中斷處繼續。" if resume else ""
+    # 封存模式以檔案數顯示進度，資料夾模式以位元組數顯示並計算速度
+    stats = current_stats = RunStats.for_scan(scan) if output_mode == 'folder' else None
+    # 多目標備份：每個目標各自的統計，第一個為主要目標
+    lane_stats = [stats] + [RunStats.for_scan(scan) for _ in extra_dirs] if extra_dirs else None
+    fanout_stats = lane_stats[1:] if extra_dirs else None
+    stats_info = {'source': scan.source_dir, 'dest': actual_dest_dir,
+                  'mode': 'mirror' if mirror else last_calculation_mode or 'selective'}
+    if extra_dirs:
+        stats_info['extra_dests'] = extra_dirs
+
+    # 使用 threading 避免 GUI 卡住，實際複製交給 backup_core 的執行緒池平行處理
     def copy_thread():
-        copied_count = 0
         try:
-            for i, (src_path, dest_path) in enumerate(files_to_copy_list):
-                # 確保目標路徑的目錄存在
-                dest_folder = os.path.dirname(dest_path)
-                os.makedirs(dest_folder, exist_ok=True)
-
-                # 複製檔案 (copy2 會盡量保留原始檔案的 metadata)
-                shutil.copy2(src_path, dest_path)
-                copied_count += 1
-
-                # 更新進度 (不需要太頻繁，避免拖慢)
-                # 同時更新進度條和標籤
-                update_interval = max(1, total_files_count // 100) # 大約更新100次或每個都更新（如果檔案少）
-                if (i + 1) % update_interval == 0 or (i + 1) == total_files_count:
-                     final_count = copied_count # 捕獲當前計數
-                     root.after(0, lambda c=final_count: update_progress(c, total_files_count))
-
+            if mirror:
+                result = run_mirror(scan, workers=worker_count, method=copy_method, buffer_size=copy_buffer_size,
+                                    resume=resume, retries=copy_retries, retry_delay=retry_delay, verify=verify, stats=stats,
+                                    large_file_threshold=large_file_mb * 1024 * 1024,
+                                    delta_threshold=get_delta_threshold(),
+                                    progress_callback=lambda done, total: root.after(0, lambda c=done, t=total: update_progress(c, t)))
+                save_run_statistics(stats, stats_info)
+                root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files, resumed_count=r.resumed_count,
+                                                                  retried_count=r.retried_count, deleted_count=r.deleted_count,
+                                                                  stats=stats))
+                return
+            if output_mode == OUTPUT_PACK:
+                result = pack_scan(scan, get_output_path(actual_dest_dir), workers=worker_count,
+                                   progress_callback=lambda done, total: root.after(0, lambda c=done, t=total: update_progress(c, t)))
+                root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files, pack_result=r))
+                return
+            if output_mode != 'folder':
+                result = archive_scan(scan, output_mode, workers=worker_count, level=archive_level,
+                                      progress_callback=lambda done, total: root.after(0, lambda c=done, t=total: update_progress(c, t)))
+                root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files, archive_path=r.archive_path))
+                return
+            if extra_dirs:
+                result = fanout_copy(scan, extra_dirs, workers=worker_count, use_hash=use_hash,
+                                     buffer_size=copy_buffer_size, retries=copy_retries, retry_delay=retry_delay,
+                                     stats=lane_stats, max_lag=fanout_lag_mb * 1024 * 1024,
+                                     resume=resume, verify=verify,
+                                     progress_callback=lambda done, total: root.after(0, lambda c=done, t=total: update_progress(c, t)))
+                save_run_statistics(stats, stats_info)
+                root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files,
+                                                                  resumed_count=r.resumed_count,
+                                                                  retried_count=r.retried_count, stats=stats,
+                                                                  fanout_result=r))
+                return
+            result = copy_files(scan, workers=worker_count, use_hash=use_hash, link_dest=link_dest,
+                                method=copy_method, buffer_size=copy_buffer_size,
+                                resume=resume, retries=copy_retries, retry_delay=retry_delay, verify=verify, stats=stats,
+                                large_file_threshold=large_file_mb * 1024 * 1024,
+                                delta_threshold=get_delta_threshold(),
+                                progress_callback=lambda done, total: root.after(0, lambda c=done, t=total: update_progress(c, t)))
+            save_run_statistics(stats, stats_info)
             # 完成後更新狀態
-            root.after(0, show_copy_complete)
+            root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files, r.linked_count,
+                                                              resumed_count=r.resumed_count, retried_count=r.retried_count,
+                                                              stats=stats))
 
         except Exception as e:
              # 修正 lambda 錯誤
-            root.after(0, lambda err=e: show_error_and_reset(f"複製檔案時發生錯誤：\n{err}"))
+            root.after(0, lambda err=e: show_error_and_reset(f"複製檔案時發生錯誤：\n{err}{resume_hint}"))
 
 
     # 啟動複製線程
@@ -268,74 +510,591 @@ def start_copying():
     thread.start()
 
 
-def show_copy_complete():
-     """顯示複製完成訊息"""
-     global total_files_count
-     messagebox.showinfo("完成", f"複製完成！\n成功複製 {total_files_count} 個檔案。")
-     status_label_var.set(f"複製完成！共複製 {total_files_count} 個檔案。")
+# --- 串流備份 (邊掃描邊複製) ---
+def start_streaming():
+    """不先計算檔案數量，直接邊掃描邊複製 (排除模式)"""
+    global current_stats, fanout_stats
+    source_dir = source_dir_var.get()
+    actual_dest_dir = get_actual_dest_dir()
+
+    if is_mirror_mode(): # 鏡像需要先比對來源與目標才知道要刪除哪些檔案
+        messagebox.showinfo("提示", "鏡像模式需要先計算檔案數量並確認刪除清單，無法邊掃描邊複製。")
+        return
+    if get_fanout_dest_dirs(actual_dest_dir):
+        messagebox.showinfo("提示", "設定了多個目標資料夾時需要先計算檔案數量，無法邊掃描邊複製。")
+        return
+
+    output_mode = get_output_mode()
+    output_path = get_output_path(actual_dest_dir)
+
+    try:
+        validate_paths(source_dir, output_path)
+    except ValueError as e:
+        messagebox.showerror("錯誤", str(e))
+        return
+
+    link_dest = get_link_dest(actual_dest_dir)
+    link_text = f"\n(未變更的檔案將以硬連結共用快照：{link_dest})" if link_dest else ""
+    if output_mode == 'folder':
+        confirm_message = f"確定要邊掃描邊將檔案從\n{source_dir}\n複製到\n{actual_dest_dir}\n嗎？\n(套用排除規則，目標資料夾內若有同名檔案將被覆蓋){link_text}"
+    elif output_mode == OUTPUT_PACK:
+        confirm_message = f"確定要邊掃描邊將檔案從\n{source_dir}\n寫入封包庫\n{output_path}\n的新快照嗎？\n(套用排除規則，內容相同的檔案只保存一份)"
+    else:
+        confirm_message = f"確定要邊掃描邊將檔案從\n{source_dir}\n寫入封存檔\n{output_path}\n嗎？\n(套用排除規則，同名的封存檔將被覆蓋)"
+    if not messagebox.askyesno("確認串流備份", confirm_message):
+        return
+
+    reset_calculation()
+    # 禁用所有計算和複製按鈕
+    calculate_button.config(state=tk.DISABLED)
+    if calculate_full_button:
+        calculate_full_button.config(state=tk.DISABLED)
+    if stream_button:
+        stream_button.config(state=tk.DISABLED)
+    status_label_var.set("正在邊掃描邊複製...")
+    # 掃描完成前總數未知，先以不確定模式顯示進度條
+    if progress_bar:
+        progress_bar.config(mode='indeterminate')
+        progress_bar.start(50)
+
+    rules = get_exclusion_rules()
+    incremental = bool(incremental_var and incremental_var.get())
+    use_hash = incremental and bool(manifest_hash_var and manifest_hash_var.get())
+    worker_count = get_copy_workers()
+    cache = get_scan_cache(source_dir)
+    resume = get_resume()
+    verify = get_verify()
+    resume_hint = "\n\n已完成的檔案記錄在複製日誌中，重新執行時會從中斷處繼續。" if resume else ""
+    stats = current_stats = RunStats() if output_mode == 'folder' else None
+    fanout_stats = None
+    stats_info = {'source': source_dir, 'dest': actual_dest_dir, 'mode': 'selective', 'stream': True}
+
+    def stream_thread():
+        try:
+            if output_mode == OUTPUT_PACK:
+                result = pack_tree(source_dir, output_path, rules, workers=worker_count, scan_workers=scan_workers,
+                                   progress_callback=lambda done, total:
+                                       root.after(0, lambda d=done: status_label_var.set(f"正在寫入封包庫，已處理 {d} 個檔案...")))
+                root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files, pack_result=r))
+                return
+            if output_mode != 'folder':
+                result = archive_tree(source_dir, output_path, output_mode, rules, workers=worker_count,
+                                      scan_workers=scan_workers, level=archive_level,
+                                      progress_callback=lambda done, total:
+                                          root.after(0, lambda d=done: status_label_var.set(f"正在寫入封存檔，已寫入 {d} 個檔案...")))
+                root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files, archive_path=r.archive_path))
+                return
+            result = stream_backup(source_dir, actual_dest_dir, rules, workers=worker_count,
+                                   scan_workers=scan_workers, incremental=incremental, use_hash=use_hash,
+                                   link_dest=link_dest, method=copy_method, buffer_size=copy_buffer_size,
+                                   cache=cache, resume=resume, retries=copy_retries, retry_delay=retry_delay,
+                                   verify=verify, stats=stats, large_file_threshold=large_file_mb * 1024 * 1024,
+                                   delta_threshold=get_delta_threshold(),
+                                   progress_callback=lambda done, found, finished:
+                                       root.after(0, lambda d=done, f=found, fin=finished: update_stream_progress(d, f, fin)))
+            save_scan_cache(cache)
+            save_run_statistics(stats, stats_info)
+            root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files, r.linked_count,
+                                                              resumed_count=r.resumed_count, retried_count=r.retried_count,
+                                                              stats=stats))
+
+        except Exception as e:
+            root.after(0, lambda err=e: show_error_and_reset(f"串流備份時發生錯誤：\n{err}{resume_hint}"))
+
+    thread = threading.Thread(target=stream_thread, daemon=True)
+    thread.start()
+
+def update_stream_progress(done_count, found_count, scan_finished):
+    """更新串流備份的進度 (掃描結束後進度條改為確定模式)"""
+    if scan_finished:
+        if progress_bar and str(progress_bar['mode']) != 'determinate':
+            progress_bar.stop()
+            progress_bar.config(mode='determinate')
+        if current_stats is not None:
+            update_progress(done_count, found_count)
+            return
+        if progress_bar:
+            progress_bar['maximum'] = max(1, found_count)
+            progress_bar['value'] = done_count
+        status_label_var.set(f"正在複製 {done_count} / {found_count} 個檔案...")
+    else:
+        speed_text = ""
+        if current_stats is not None:
+            snapshot = current_stats.snapshot()
+            speed_text = f"，{format_size(snapshot['bytes_done'])} ({snapshot['current_mb_per_second']:.1f} MB/s)"
+        status_label_var.set(f"正在複製 {done_count} 個檔案{speed_text}，已發現 {found_count} 個 (掃描中...)")
+
+def show_copy_complete(copied_count, failed_files=None, linked_count=0, archive_path=None,
+                       resumed_count=0, retried_count=0, deleted_count=0, stats=None, pack_result=None,
+                       fanout_result=None):
+     """顯示複製完成訊息 (有失敗檔案時列出第一個錯誤和失敗清單)"""
+     # 快照硬連結模式：說明有多少檔案沒有實際複製
+     linked_text = f"\n其中 {linked_count} 個未變更的檔案以硬連結共用上一個快照。" if linked_count else ""
+     if resumed_count: # 續傳：先前中斷的工作已完成的部分
+         linked_text += f"\n另有 {resumed_count} 個檔案已在先前中斷的工作中完成，本次略過。"
+     if retried_count:
+         linked_text += f"\n{retried_count} 個檔案暫時無法讀取，重試後成功。"
+     if deleted_count: # 鏡像模式：刪除的多餘檔案
+         linked_text += f"\n已刪除 {deleted_count} 個來源已不存在的檔案。"
+     if archive_path: # 封存模式：說明封存檔位置
+         linked_text += f"\n封存檔：{archive_path}"
+     if pack_result is not None: # 封包庫：快照名稱與去重結果
+         linked_text += (f"\n封包庫：{pack_result.store_dir}\n快照：{pack_result.snapshot}"
+                         f"\n{pack_result.deduplicated_count} 個檔案的內容已存在，"
+                         f"{format_size(pack_result.bytes_read)} 中只寫入 {format_size(pack_result.bytes_written)}。")
+     if stats is not None: # 傳輸量與速度
+         snapshot = stats.snapshot()
+         linked_text += (f"\n共 {format_size(snapshot['bytes_done'])}，耗時 {snapshot['elapsed_seconds']:.1f} 秒，"
+                         f"平均 {snapshot['average_mb_per_second']:.1f} MB/s，每秒 {snapshot['files_per_second']:.0f} 個檔案。")
+         if snapshot['delta_files']: # 差異傳輸：實際寫入量與檔案大小
+             linked_text += (f"\n{snapshot['delta_files']} 個檔案以差異傳輸更新，"
+                             f"{format_size(snapshot['delta_bytes'])} 中只寫入 {format_size(snapshot['delta_bytes_written'])}。")
+     if fanout_result is not None: # 多目標備份：各目標的結果與速度
+         linked_text += f"\n來源只讀取一次，共 {format_size(fanout_result.bytes_read)}。"
+         for dest_dir, result in zip(fanout_result.dest_dirs, fanout_result.results):
+             snapshot = result.stats.snapshot()
+             linked_text += (f"\n{dest_dir}：成功 {result.copied_count} 個，失敗 {len(result.failed_files)} 個，"
+                             f"平均 {snapshot['average_mb_per_second']:.1f} MB/s")
+     if failed_files:
+         first_src, first_error = failed_files[0]
+         shown = "\n".join(src for src, _ in failed_files[:20])
+         more = f"\n...以及其他 {len(failed_files) - 20} 個檔案" if len(failed_files) > 20 else ""
+         messagebox.showwarning("部分失敗",
+                                f"複製完成，但有 {len(failed_files)} 個檔案失敗。\n成功複製 {copied_count} 個檔案。{linked_text}\n\n"
+                                f"第一個錯誤：\n{first_src}\n{first_error}\n\n失敗的檔案：\n{shown}{more}")
+         status_label_var.set(f"複製完成，成功 {copied_count} 個，失敗 {len(failed_files)} 個檔案。")
+     else:
+         messagebox.showinfo("完成", f"複製完成！\n成功複製 {copied_count} 個檔案。{linked_text}")
+         status_label_var.set(f"複製完成！共複製 {copied_count} 個檔案。")
      if progress_bar: # 確保進度條顯示為完成
-         progress_bar['value'] = total_files_count
+         if str(progress_bar['mode']) != 'determinate': # 串流備份沒有任何檔案時仍停在不確定模式
+             progress_bar.stop()
+             progress_bar.config(mode='determinate')
+         progress_bar['value'] = progress_bar['maximum']
      # 可以選擇重置或保留狀態
      # reset_calculation() # 如果希望每次複製完都重置
      calculate_button.config(state=tk.NORMAL) # 允許重新計算或修改路徑
+     if calculate_full_button:
+         calculate_full_button.config(state=tk.NORMAL)
+     if stream_button:
+         stream_button.config(state=tk.NORMAL)
+     if restore_button:
+         restore_button.config(state=tk.NORMAL)
+
+# --- 驗證既有備份 ---
+def start_verify():
+    """依複製時記錄的校驗碼平行檢查一個備份資料夾"""
+    dest_dir = dest_dir_var.get()
+    snapshots = list_snapshots(dest_dir) if append_timestamp_var and append_timestamp_var.get() else []
+    initial_dir = snapshots[-1][1] if snapshots else dest_dir
+    backup_dir = filedialog.askdirectory(title="選擇要驗證的備份資料夾", initialdir=initial_dir or None)
+    if not backup_dir:
+        return
 
-def update_progress(current_count, total_count):
-    """更新進度條和狀態標籤"""
+    calculate_button.config(state=tk.DISABLED)
+    copy_button.config(state=tk.DISABLED)
+    if calculate_full_button:
+        calculate_full_button.config(state=tk.DISABLED)
+    if stream_button:
+        stream_button.config(state=tk.DISABLED)
+    if verify_button:
+        verify_button.config(state=tk.DISABLED)
+    status_label_var.set("正在驗證備份...")
+    worker_count = get_copy_workers()
+
+    def verify_thread():
+        try:
+            result = verify_backup(backup_dir, workers=worker_count,
+                                   progress_callback=lambda done, total: root.after(0, lambda c=done, t=total: update_verify_progress(c, t)))
+            root.after(0, lambda r=result: show_verify_complete(backup_dir, r))
+        except Exception as e:
+            root.after(0, lambda err=e: show_error_and_reset(f"驗證備份時發生錯誤：\n{err}"))
+
+    thread = threading.Thread(target=verify_thread, daemon=True)
+    thread.start()
+
+def update_verify_progress(current_count, total_count):
+    """更新驗證的進度"""
     if progress_bar:
+        progress_bar['maximum'] = max(1, total_count)
         progress_bar['value'] = current_count
-    status_label_var.set(f"正在複製 {current_count} / {total_count} 個檔案...")
+    status_label_var.set(f"正在驗證 {current_count} / {total_count} 個檔案...")
+
+def show_verify_complete(backup_dir, result):
+    """顯示驗證結果 (列出內容不符與遺失的檔案)"""
+    reset_calculation() # 驗證會佔用進度條，結束後回到尚未計算的狀態
+    if result.is_ok:
+        messagebox.showinfo("驗證完成", f"備份完整！\n{backup_dir}\n"
+                                        f"共檢查 {result.checked_count} 個檔案 ({format_size(result.bytes_checked)})，全部相符。")
+        status_label_var.set(f"驗證完成，{result.checked_count} 個檔案全部相符。")
+    else:
+        problems = [f"[內容不符] {key}：{reason}" for key, reason in result.mismatched]
+        problems += [f"[遺失] {key}" for key in result.missing]
+        problems += [f"[無法讀取] {key}：{error}" for key, error in result.errors]
+        shown = "\n".join(problems[:20])
+        more = f"\n...以及其他 {len(problems) - 20} 個問題" if len(problems) > 20 else ""
+        messagebox.showwarning("驗證發現問題",
+                               f"{backup_dir}\n共檢查 {result.checked_count} 個檔案，{result.ok_count} 個相符，"
+                               f"{len(problems)} 個有問題：\n\n{shown}{more}")
+        status_label_var.set(f"驗證完成，{len(problems)} 個檔案有問題。")
+
+# --- 從備份還原 ---
+def show_restore_dialog():
+    """選擇快照與要還原的項目 (相對路徑或萬用字元)，平行還原到指定的資料夾"""
+    points = list_restore_points(dest_dir_var.get())
+    if not points:
+        messagebox.showinfo("還原", "目標資料夾旁找不到可還原的備份。")
+        return
+    # 新的快照排在前面，預設選擇最新的時間戳記快照
+    points = [point for point in reversed(points) if point[0]] + [point for point in points if not point[0]]
+    labels = [f"{name}  ({path})" if name else f"目標資料夾本身  ({path})" for name, path in points]
+
+    restore_window = tk.Toplevel(root)
+    restore_window.title("從備份還原")
+    restore_window.geometry("640x420")
+    restore_window.transient(root)
+
+    point_frame = tk.Frame(restore_window)
+    point_frame.pack(fill=tk.X, padx=10, pady=(10, 5))
+    tk.Label(point_frame, text="從備份:").pack(side=tk.LEFT)
+    point_var = tk.StringVar(value=labels[0])
+    ttk.Combobox(point_frame, textvariable=point_var, values=labels, state='readonly').pack(
+        side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+    tk.Label(restore_window, text="要還原的項目 (每行一個相對路徑或萬用字元，例如 src、src/app.js、**/*.json；空白為全部):",
+             justify=tk.LEFT, wraplength=600).pack(anchor='w', padx=10)
+    patterns_text = tk.Text(restore_window, height=10)
+    patterns_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+    target_frame = tk.Frame(restore_window)
+    target_frame.pack(fill=tk.X, padx=10, pady=5)
+    tk.Label(target_frame, text="還原到:").pack(side=tk.LEFT)
+    target_var = tk.StringVar(value=source_dir_var.get())
+    tk.Entry(target_frame, textvariable=target_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+    def browse_target():
+        directory = filedialog.askdirectory(title="選擇還原到的資料夾", initialdir=target_var.get() or None,
+                                            parent=restore_window)
+        if directory:
+            target_var.set(directory)
+
+    tk.Button(target_frame, text="瀏覽...", command=browse_target).pack(side=tk.LEFT)
+
+    def start():
+        backup_dir = points[labels.index(point_var.get())][1]
+        target_dir = target_var.get()
+        patterns = [line.strip() for line in patterns_text.get('1.0', tk.END).splitlines() if line.strip()]
+        try:
+            validate_paths(backup_dir, target_dir)
+        except ValueError as e:
+            messagebox.showerror("錯誤", str(e), parent=restore_window)
+            return
+        restore_window.destroy()
+        start_restore(backup_dir, target_dir, patterns)
+
+    bottom_frame = tk.Frame(restore_window)
+    bottom_frame.pack(fill=tk.X, padx=10, pady=10)
+    tk.Button(bottom_frame, text="還原", command=start).pack(side=tk.RIGHT, padx=5)
+    tk.Button(bottom_frame, text="取消", command=restore_window.destroy).pack(side=tk.RIGHT)
+
+def start_restore(backup_dir, target_dir, patterns):
+    """比對備份與還原目標 (在背景線程)，確認後平行還原有差異的檔案"""
+    reset_calculation() # 還原會佔用進度條，原本的計算結果不再適用
+    calculate_button.config(state=tk.DISABLED)
+    if calculate_full_button:
+        calculate_full_button.config(state=tk.DISABLED)
+    if stream_button:
+        stream_button.config(state=tk.DISABLED)
+    if restore_button:
+        restore_button.config(state=tk.DISABLED)
+    status_label_var.set("正在比對備份與還原目標...")
+    scan_worker_count = scan_workers
+    memory_budget = plan_memory_mb * 1024 * 1024
+
+    def plan_thread():
+        try:
+            plan = plan_restore(backup_dir, target_dir, patterns, workers=scan_worker_count, memory_budget=memory_budget)
+            root.after(0, lambda p=plan: confirm_restore(p))
+        except Exception as e:
+            root.after(0, lambda err=e: show_error_and_reset(f"比對還原的檔案時發生錯誤：\n{err}"))
+
+    thread = threading.Thread(target=plan_thread, daemon=True)
+    thread.start()
+
+def confirm_restore(plan):
+    """顯示要還原的檔案數量，確認後開始平行還原"""
+    global current_stats, fanout_stats
+    if not plan.files:
+        reset_calculation()
+        messagebox.showinfo("還原", f"選取的 {plan.unchanged_count} 個檔案都與備份相同，不需要還原。")
+        return
+    if not messagebox.askyesno("確認還原",
+                               f"確定要從\n{plan.source_dir}\n還原 {plan.total_files} 個檔案 ({format_size(plan.total_bytes)}) 到\n"
+                               f"{plan.dest_dir}\n嗎？\n(另有 {plan.unchanged_count} 個與備份相同的檔案略過，"
+                               f"目標中同名的檔案將被覆蓋)"):
+        reset_calculation()
+        return
+
+    status_label_var.set(f"正在還原 0 / {plan.total_files} 個檔案...")
+    stats = current_stats = RunStats.for_scan(plan)
+    fanout_stats = None
+    stats_info = {'source': plan.source_dir, 'dest': plan.dest_dir, 'mode': 'restore'}
+    worker_count = get_copy_workers()
+
+    def restore_thread():
+        try:
+            result = copy_files(plan, workers=worker_count, method=copy_method, buffer_size=copy_buffer_size,
+                                retries=copy_retries, retry_delay=retry_delay, stats=stats,
+                                large_file_threshold=large_file_mb * 1024 * 1024,
+                                delta_threshold=get_delta_threshold(),
+                                progress_callback=lambda done, total: root.after(0, lambda c=done, t=total: update_progress(c, t)))
+            save_run_statistics(stats, stats_info)
+            root.after(0, lambda r=result: show_copy_complete(r.copied_count, r.failed_files,
+                                                              retried_count=r.retried_count, stats=stats))
+        except Exception as e:
+            root.after(0, lambda err=e: show_error_and_reset(f"還原檔案時發生錯誤：\n{err}"))
+
+    thread = threading.Thread(target=restore_thread, daemon=True)
+    thread.start()
+
+# --- 持續同步 (監看來源，只複製有變更的檔案) ---
+def toggle_watch():
+    """開始持續同步，進行中時再按一次則停止"""
+    if watch_stop_event is not None:
+        watch_stop_event.set()
+        watch_button.config(state=tk.DISABLED)
+        status_label_var.set("正在停止持續同步 (等待目前這一輪完成)...")
+        return
+    start_watch()
+
+def start_watch():
+    """完整同步一次後持續監看來源 (套用排除規則，一律寫到目標資料夾本身，不加時間戳記)"""
+    global watch_stop_event
+    source_dir = source_dir_var.get()
+    dest_dir = dest_dir_var.get()
+    if get_output_mode() != 'folder':
+        messagebox.showinfo("提示", "持續同步只能輸出到資料夾，請將輸出方式改為 folder。")
+        return
+    try:
+        validate_paths(source_dir, dest_dir)
+    except ValueError as e:
+        messagebox.showerror("錯誤", str(e))
+        return
+
+    mirror = is_mirror_mode()
+    mirror_text = "\n(鏡像模式：來源刪除的檔案也會從目標刪除)" if mirror else ""
+    if extra_dest_dirs:
+        mirror_text += "\n(持續同步只寫入主要的目標資料夾，不寫入其他目標)"
+    if not messagebox.askyesno("確認持續同步",
+                               f"確定要持續將\n{source_dir}\n同步到\n{dest_dir}\n嗎？\n"
+                               f"(套用排除規則，先完整比對一次，之後只複製有變更的檔案){mirror_text}"):
+        return
+
+    reset_calculation()
+    for button in (calculate_button, calculate_full_button, stream_button, verify_button):
+        if button:
+            button.config(state=tk.DISABLED)
+    watch_button.config(text="停止持續同步")
+    status_label_var.set("正在進行第一次完整同步...")
+    if progress_bar:
+        progress_bar.config(mode='indeterminate')
+        progress_bar.start(50)
+
+    stop_event = watch_stop_event = threading.Event()
+    rules = get_exclusion_rules()
+    worker_count = get_copy_workers()
+    verify = get_verify()
+
+    def watch_thread():
+        try:
+            watch_backup(source_dir, dest_dir, rules, workers=worker_count, scan_workers=scan_workers,
+                         mirror=mirror, prune_excluded=mirror_prune_excluded, method=copy_method,
+                         buffer_size=copy_buffer_size, retries=copy_retries, retry_delay=retry_delay, verify=verify,
+                         large_file_threshold=large_file_mb * 1024 * 1024,
+                         delta_threshold=get_delta_threshold(),
+                         debounce=watch_debounce, poll_interval=watch_poll_interval, stop_event=stop_event,
+                         on_sync=lambda sync: root.after(0, lambda s=sync: update_watch_status(s)))
+            root.after(0, show_watch_stopped)
+        except Exception as e:
+            root.after(0, lambda err=e: show_watch_stopped(f"持續同步時發生錯誤：\n{err}"))
+
+    thread = threading.Thread(target=watch_thread, daemon=True)
+    thread.start()
+
+def update_watch_status(sync):
+    """顯示最近一輪同步的結果"""
+    if progress_bar and str(progress_bar['mode']) != 'determinate': # 第一次完整同步完成
+        progress_bar.stop()
+        progress_bar.config(mode='determinate')
+        progress_bar['value'] = progress_bar['maximum']
+    kind = "完整同步" if sync.full else f"{sync.changed} 個變動"
+    deleted_text = f"，刪除 {sync.deleted_count} 個" if sync.deleted_count else ""
+    failed_text = f"，失敗 {len(sync.failed_files)} 個 (第一個：{sync.failed_files[0][0]})" if sync.failed_files else ""
+    status_label_var.set(f"持續同步中 (再按一次按鈕停止)。\n"
+                         f"{time.strftime('%H:%M:%S')} {kind}：複製 {sync.copied_count} 個檔案{deleted_text}{failed_text}，"
+                         f"耗時 {sync.seconds:.1f} 秒。")
+
+def show_watch_stopped(error_message=None):
+    """持續同步結束 (錯誤時顯示訊息)，回到尚未計算的狀態"""
+    global watch_stop_event
+    watch_stop_event = None
+    watch_button.config(text="持續同步")
+    reset_calculation()
+    if error_message:
+        messagebox.showerror("錯誤", error_message)
+    else:
+        status_label_var.set("已停止持續同步。")
+
+def update_progress(current_count, total_count):
+    """更新進度條和狀態標籤 (有執行統計時進度條以位元組計算，並顯示速度與剩餘時間)"""
+    if current_stats is None or not current_stats.total_bytes:
+        if progress_bar:
+            progress_bar['value'] = current_count
+        status_label_var.set(f"正在複製 {current_count} / {total_count} 個檔案...")
+        return
+    snapshot = current_stats.snapshot()
+    done_bytes = snapshot['bytes_done'] + snapshot['bytes_skipped']
+    if progress_bar:
+        progress_bar['maximum'] = max(1, snapshot['total_bytes'])
+        progress_bar['value'] = done_bytes
+    eta = snapshot['eta_seconds']
+    eta_text = f"，剩餘約 {eta:.0f} 秒" if eta is not None else ""
+    # 多目標備份：其他目標各自的寫入量與速度 (慢的目標落後時可以看出來)
+    fanout_text = "".join(f"；其他目標 {format_size(s.bytes_done)} ({s.current_rate() / 1e6:.1f} MB/s)"
+                          for s in fanout_stats or ())
+    status_label_var.set(f"正在複製 {current_count} / {total_count} 個檔案，"
+                         f"{format_size(done_bytes)} / {format_size(snapshot['total_bytes'])} "
+                         f"({snapshot['current_mb_per_second']:.1f} MB/s{eta_text}){fanout_text}")
 
 # --- 檔案預覽功能 ---
 def show_file_preview():
-    """顯示將要複製的檔案列表預覽視窗"""
-    global files_to_copy_list, source_dir_var, total_files_count
+    """顯示將要複製的檔案列表預覽視窗 (依資料夾分組，可搜尋)
+
+    列表是虛擬化的：Listbox 只放目前看得到的列，捲動時再換成對應的內容，
+    幾十萬個檔案也能立即開啟與捲動。
+    """
+    global files_to_copy_list, source_dir_var, total_files_count, preview_index
 
-    if not files_to_copy_list:
+    if not has_pending_work(current_scan):
         messagebox.showinfo("預覽", "目前沒有計算出需要複製的檔案。")
         return
 
-    source_dir = source_dir_var.get()
-    if not source_dir:
-        messagebox.showerror("錯誤", "無法獲取來源資料夾路徑以顯示相對路徑。")
-        return
+    source_dir = current_scan.source_dir
+    # 索引只在每次計算後建立一次，重新開啟預覽視窗時直接使用
+    if preview_index is None:
+        preview_index = PreviewIndex(current_scan)
+    index = preview_index
 
     preview_window = tk.Toplevel(root)
-    preview_window.title(f"預覽複製檔案 ({total_files_count} 個)")
-    preview_window.geometry("600x400") # 設定預設大小
+    incremental = current_scan.incremental
+    if isinstance(current_scan, MirrorPlan): # 鏡像模式顯示新增/更新/刪除數量
+        preview_window.title(f"預覽鏡像同步 ({total_files_count - current_scan.update_count} 個新增 / "
+                             f"{current_scan.update_count} 個更新 / {current_scan.delete_count} 個刪除)")
+    elif incremental: # 增量模式顯示變更/未變更數量
+        preview_window.title(f"預覽複製檔案 ({total_files_count} 個已變更 / {unchanged_files_count} 個未變更)")
+    else:
+        preview_window.title(f"預覽複製檔案 ({total_files_count} 個)")
+    preview_window.geometry("700x500") # 設定預設大小
 
     # 加入來源和目標路徑標籤
     path_frame = tk.Frame(preview_window)
     path_frame.pack(pady=5, fill=tk.X, padx=10)
     tk.Label(path_frame, text=f"來源: {source_dir}").pack(anchor='w')
-    # tk.Label(path_frame, text=f"目標: {dest_dir_var.get()}").pack(anchor='w') # 目標路徑可選顯示
-
-    # 建立 Listbox 和 Scrollbar
+    if incremental:
+        tk.Label(path_frame, text=f"增量備份：{total_files_count} 個已變更 / {unchanged_files_count} 個未變更 (未變更的檔案不列出)").pack(anchor='w')
+
+    # 搜尋列：輸入時即時篩選 (比對相對路徑，不分大小寫)
+    search_frame = tk.Frame(preview_window)
+    search_frame.pack(fill=tk.X, padx=10)
+    tk.Label(search_frame, text="搜尋:").pack(side=tk.LEFT)
+    search_var = tk.StringVar()
+    search_entry = tk.Entry(search_frame, textvariable=search_var)
+    search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+    summary_var = tk.StringVar()
+    tk.Label(search_frame, textvariable=summary_var).pack(side=tk.LEFT)
+
+    # 建立 Listbox 和 Scrollbar (垂直捲軸由程式控制，只顯示可見範圍的列)
     list_frame = tk.Frame(preview_window)
     list_frame.pack(expand=True, fill=tk.BOTH, padx=10, pady=5)
 
     scrollbar_y = tk.Scrollbar(list_frame, orient=tk.VERTICAL)
     scrollbar_x = tk.Scrollbar(list_frame, orient=tk.HORIZONTAL)
     listbox = tk.Listbox(list_frame,
-                        yscrollcommand=scrollbar_y.set,
                         xscrollcommand=scrollbar_x.set,
-                        selectmode=tk.EXTENDED)
-
-    scrollbar_y.config(command=listbox.yview)
+                        selectmode=tk.EXTENDED,
+                        activestyle='none')
     scrollbar_x.config(command=listbox.xview)
 
     scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
     scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
     listbox.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
 
-    # 填充 Listbox
-    try:
-        for src_path, _ in files_to_copy_list:
-            relative_path = os.path.relpath(src_path, source_dir)
-            listbox.insert(tk.END, relative_path)
-    except ValueError as e:
-        messagebox.showerror("錯誤", f"計算相對路徑時出錯: {e}\n請確保來源路徑有效。")
-        preview_window.destroy()
-        return
+    line_height = max(1, tkfont.Font(root=preview_window, font=listbox.cget('font')).metrics('linespace') + 1)
+    view = {'rows': [], 'stats': {}, 'top': 0, 'pending': None}
+
+    def visible_count():
+        return max(1, listbox.winfo_height() // line_height)
+
+    def render():
+        """只把目前可見範圍的列放進 Listbox"""
+        rows = view['rows']
+        visible = visible_count()
+        top = max(0, min(view['top'], len(rows) - visible))
+        view['top'] = top
+        shown = rows[top:top + visible]
+        listbox.delete(0, tk.END)
+        if shown:
+            listbox.insert(tk.END, *(index.format_row(row, view['stats']) for row in shown))
+            for i, row in enumerate(shown):
+                if row < 0: # 資料夾標題列
+                    listbox.itemconfig(i, foreground='navy', background='#eef2f8')
+        if rows:
+            scrollbar_y.set(top / len(rows), min(1.0, (top + visible) / len(rows)))
+        else:
+            scrollbar_y.set(0.0, 1.0)
+
+    def scroll_to(top):
+        view['top'] = top
+        render()
+
+    def on_scrollbar(action, amount, unit=None):
+        if action == 'moveto':
+            scroll_to(int(float(amount) * len(view['rows'])))
+        elif action == 'scroll':
+            step = visible_count() if unit == 'pages' else 1
+            scroll_to(view['top'] + int(amount) * step)
+
+    def on_mousewheel(event):
+        if getattr(event, 'num', None) in (4, 5): # X11
+            delta = -3 if event.num == 4 else 3
+        else:
+            delta = -3 if event.delta > 0 else 3
+        scroll_to(view['top'] + delta)
+        return "break"
+
+    def apply_filter():
+        view['pending'] = None
+        matches = index.search(search_var.get())
+        view['rows'], view['stats'] = index.build_rows(matches)
+        matched_bytes = sum(total for _, total in view['stats'].values())
+        summary_var.set(f"{len(matches)} / {len(index)} 個檔案，{len(view['stats'])} 個資料夾，{format_size(matched_bytes)}")
+        scroll_to(0)
+
+    def on_search_change(*args):
+        # 連續輸入時稍微延後，只在停頓後篩選一次
+        if view['pending'] is not None:
+            preview_window.after_cancel(view['pending'])
+        view['pending'] = preview_window.after(120, apply_filter)
+
+    scrollbar_y.config(command=on_scrollbar)
+    listbox.bind("<Configure>", lambda event: render())
+    for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+        listbox.bind(sequence, on_mousewheel)
+    listbox.bind("<Prior>", lambda event: on_scrollbar('scroll', -1, 'pages') or "break")
+    listbox.bind("<Next>", lambda event: on_scrollbar('scroll', 1, 'pages') or "break")
+    search_var.trace_add('write', on_search_change)
+    apply_filter()
+    search_entry.focus_set()
 
     # 關閉按鈕
     close_button = tk.Button(preview_window, text="關閉", command=preview_window.destroy)
@@ -351,89 +1110,136 @@ def show_file_preview():
 def load_config():
     """載入設定檔 (路徑和排除規則)"""
     global source_dir_var, dest_dir_var, excluded_exact_list, excluded_prefix_list
-    global EXCLUDED_FOLDERS_EXACT_LOWER, EXCLUDED_FOLDERS_PREFIX_LOWER
+    global exclude_patterns_list, use_gitignore
     global append_timestamp_var # 包含時間戳記變數
+    global scan_workers, copy_method, copy_buffer_size, archive_level, scan_cache_file
+    global copy_retries, retry_delay, mirror_prune_excluded, stats_dir, plan_memory_mb
+    global watch_debounce, watch_poll_interval, large_file_mb, delta_transfer, delta_file_mb
+    global extra_dest_dirs, fanout_lag_mb
 
-    config = {}
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"讀取設定檔 {CONFIG_FILE} 時發生錯誤: {e}")
-        # 即使讀取失敗也繼續，使用預設值或空值啟動
-    except Exception as e:
-        print(f"載入設定時發生未預期錯誤: {e}")
+    # 讀取與預設值補齊交給 backup_core，這裡只負責同步到介面變數
+    config = backup_core.load_config(CONFIG_FILE)
 
     # 載入路徑
-    source_dir = config.get('source_dir', '')
-    dest_dir = config.get('dest_dir', '')
+    source_dir = config['source_dir']
+    dest_dir = config['dest_dir']
     if source_dir and os.path.isdir(source_dir):
         source_dir_var.set(source_dir)
     if dest_dir and os.path.isdir(dest_dir):
          dest_dir_var.set(dest_dir)
 
     # 載入排除規則 (若無則使用預設值)
-    excluded_exact_list = config.get('excluded_exact', list(DEFAULT_EXCLUDED_FOLDERS_EXACT))
-    excluded_prefix_list = config.get('excluded_prefix', list(DEFAULT_EXCLUDED_FOLDERS_PREFIX))
-
-    # 更新小寫集合供 is_excluded 使用
-    EXCLUDED_FOLDERS_EXACT_LOWER = {f.lower() for f in excluded_exact_list}
-    EXCLUDED_FOLDERS_PREFIX_LOWER = {p.lower() for p in excluded_prefix_list}
+    excluded_exact_list = list(config['excluded_exact'])
+    excluded_prefix_list = list(config['excluded_prefix'])
+    exclude_patterns_list = list(config['exclude_patterns'])
+    use_gitignore = bool(config['use_gitignore'])
 
     # 載入時間戳記開關狀態
     if append_timestamp_var:
-        append_timestamp_var.set(config.get('append_timestamp', False))
+        append_timestamp_var.set(config['append_timestamp'])
+    # 載入增量備份設定
+    if incremental_var:
+        incremental_var.set(config['incremental'])
+    if manifest_hash_var:
+        manifest_hash_var.set(config['manifest_hash'])
+    # 載入複製執行緒數
+    if copy_workers_var:
+        copy_workers_var.set(config['copy_workers'])
+    # 載入快照硬連結開關
+    if snapshot_links_var:
+        snapshot_links_var.set(config['snapshot_links'])
+    scan_workers = config['scan_workers']
+    copy_method = config['copy_method']
+    copy_buffer_size = config['copy_buffer_size']
+    # 載入輸出方式
+    if output_mode_var:
+        output_mode_var.set(config['output_mode'])
+    archive_level = config['archive_level']
+    scan_cache_file = config['scan_cache_file']
+    # 載入續傳與重試設定
+    if resume_journal_var:
+        resume_journal_var.set(config['resume_journal'])
+    copy_retries = config['copy_retries']
+    # 載入鏡像模式設定
+    if mirror_var:
+        mirror_var.set(config['mirror'])
+    mirror_prune_excluded = bool(config['mirror_prune_excluded'])
+    retry_delay = config['retry_delay']
+    # 載入校驗碼設定
+    if verify_var:
+        verify_var.set(config['verify'])
+    stats_dir = config['stats_dir']
+    plan_memory_mb = config['plan_memory_mb']
+    large_file_mb = config['large_file_mb']
+    delta_transfer = bool(config['delta_transfer'])
+    delta_file_mb = config['delta_file_mb']
+    extra_dest_dirs = list(config['extra_dest_dirs'])
+    fanout_lag_mb = config['fanout_lag_mb']
+    watch_debounce = config['watch_debounce']
+    watch_poll_interval = config['watch_poll_interval']
 
 def save_config():
     """儲存目前的設定 (路徑、排除規則和時間戳記開關)"""
     global excluded_exact_list, excluded_prefix_list, append_timestamp_var # 包含時間戳記變數
-    config = {
+    # 保留設定檔中介面沒有的項目 (例如只給命令列使用的設定)
+    config = backup_core.load_config(CONFIG_FILE)
+    config.update({
         'source_dir': source_dir_var.get(),
         'dest_dir': dest_dir_var.get(),
         'excluded_exact': excluded_exact_list,
         'excluded_prefix': excluded_prefix_list,
-        'append_timestamp': append_timestamp_var.get() if append_timestamp_var else False # 儲存開關狀態
-    }
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-    except IOError as e:
-        print(f"儲存設定檔 {CONFIG_FILE} 時發生錯誤: {e}")
-    except Exception as e:
-        print(f"儲存設定時發生未預期錯誤: {e}")
+        'exclude_patterns': exclude_patterns_list,
+        'use_gitignore': use_gitignore,
+        'copy_workers': get_copy_workers(),
+        'append_timestamp': append_timestamp_var.get() if append_timestamp_var else False, # 儲存開關狀態
+        'incremental': incremental_var.get() if incremental_var else False,
+        'manifest_hash': manifest_hash_var.get() if manifest_hash_var else False,
+        'snapshot_links': snapshot_links_var.get() if snapshot_links_var else False,
+        'output_mode': get_output_mode(),
+        'resume_journal': get_resume(),
+        'mirror': bool(mirror_var and mirror_var.get()),
+        'verify': bool(verify_var and verify_var.get())
+    })
+    backup_core.save_config(config, CONFIG_FILE)
 
 # --- 排除規則編輯器 --- #
 def show_exclusion_editor():
     """顯示排除規則編輯視窗"""
-    global excluded_exact_list, excluded_prefix_list
-    global EXCLUDED_FOLDERS_EXACT_LOWER, EXCLUDED_FOLDERS_PREFIX_LOWER
+    global excluded_exact_list, excluded_prefix_list, exclude_patterns_list
 
     editor_window = tk.Toplevel(root)
     editor_window.title("編輯排除規則")
-    editor_window.geometry("500x450")
+    editor_window.geometry("560x640")
     editor_window.transient(root)
     editor_window.grab_set()
 
     # --- 內部 Helper 函式 ---
-    def update_lower_sets():
-        """根據目前的列表更新小寫集合"""
-        global EXCLUDED_FOLDERS_EXACT_LOWER, EXCLUDED_FOLDERS_PREFIX_LOWER
-        EXCLUDED_FOLDERS_EXACT_LOWER = {f.lower() for f in excluded_exact_list}
-        EXCLUDED_FOLDERS_PREFIX_LOWER = {p.lower() for p in excluded_prefix_list}
-
     def add_item(entry_widget, listbox_widget, target_list):
         item = entry_widget.get().strip()
         if item and item not in target_list:
             target_list.append(item)
             listbox_widget.insert(tk.END, item)
             entry_widget.delete(0, tk.END)
-            update_lower_sets() # 更新集合
         elif item in target_list:
             messagebox.showwarning("提示", f"'{item}' 已存在於列表中。", parent=editor_window)
         else:
             messagebox.showwarning("提示", "請輸入要新增的項目。", parent=editor_window)
 
+    def add_pattern():
+        """新增 gitignore 格式規則 (允許重複，因為反向規則的順序有意義)，先檢查能否編譯"""
+        item = pattern_entry.get().strip()
+        if not item:
+            messagebox.showwarning("提示", "請輸入要新增的項目。", parent=editor_window)
+            return
+        try:
+            ExclusionRules(patterns=[item])
+        except re.error as e:
+            messagebox.showwarning("提示", f"'{item}' 不是有效的規則：{e}", parent=editor_window)
+            return
+        exclude_patterns_list.append(item)
+        pattern_listbox.insert(tk.END, item)
+        pattern_entry.delete(0, tk.END)
+
     def remove_selected(listbox_widget, target_list):
         selected_indices = listbox_widget.curselection()
         if not selected_indices:
@@ -445,7 +1251,10 @@ def show_exclusion_editor():
             listbox_widget.delete(i)
             if item_to_remove in target_list:
                 target_list.remove(item_to_remove)
-        update_lower_sets() # 更新集合
+
+    def toggle_gitignore():
+        global use_gitignore
+        use_gitignore = use_gitignore_var.get()
 
     def save_and_close():
         save_config() # 儲存目前的規則
@@ -465,9 +1274,11 @@ def show_exclusion_editor():
     main_editor_frame = tk.Frame(editor_window, padx=10, pady=10)
     main_editor_frame.pack(expand=True, fill=tk.BOTH)
 
-    # 分成左右兩欄
-    left_frame = tk.Frame(main_editor_frame)
-    right_frame = tk.Frame(main_editor_frame)
+    # 上方分成左右兩欄 (資料夾名稱規則)，下方為 gitignore 格式規則
+    columns_frame = tk.Frame(main_editor_frame)
+    columns_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+    left_frame = tk.Frame(columns_frame)
+    right_frame = tk.Frame(columns_frame)
     left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
     right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=5)
 
@@ -513,6 +1324,31 @@ def show_exclusion_editor():
     prefix_remove_button = tk.Button(right_frame, text="移除選定", command=lambda: remove_selected(prefix_listbox, excluded_prefix_list))
     prefix_remove_button.pack(fill=tk.X)
 
+    # --- gitignore 格式規則 (下方) ---
+    pattern_frame = tk.Frame(main_editor_frame)
+    pattern_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=5, pady=(10, 0))
+    tk.Label(pattern_frame, text="萬用字元規則 (gitignore 格式，例如 *.log、dist/、**/coverage、!keep.log，依順序套用):").pack(anchor='w')
+    pattern_list_frame = tk.Frame(pattern_frame)
+    pattern_list_frame.pack(fill=tk.BOTH, expand=True)
+    pattern_scrollbar = tk.Scrollbar(pattern_list_frame)
+    pattern_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    pattern_listbox = tk.Listbox(pattern_list_frame, yscrollcommand=pattern_scrollbar.set, selectmode=tk.EXTENDED, height=6)
+    pattern_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    pattern_scrollbar.config(command=pattern_listbox.yview)
+    for item in exclude_patterns_list:
+        pattern_listbox.insert(tk.END, item)
+
+    pattern_input_frame = tk.Frame(pattern_frame)
+    pattern_input_frame.pack(fill=tk.X, pady=5)
+    pattern_entry = tk.Entry(pattern_input_frame)
+    pattern_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+    tk.Button(pattern_input_frame, text="新增", command=add_pattern).pack(side=tk.LEFT)
+    tk.Button(pattern_input_frame, text="移除選定",
+              command=lambda: remove_selected(pattern_listbox, exclude_patterns_list)).pack(side=tk.LEFT, padx=(5, 0))
+    use_gitignore_var = tk.BooleanVar(value=use_gitignore)
+    tk.Checkbutton(pattern_frame, text="同時套用專案內各層的 .gitignore",
+                   variable=use_gitignore_var, command=toggle_gitignore).pack(anchor='w')
+
     # --- 底部按鈕 --- #
     bottom_frame = tk.Frame(main_editor_frame)
     bottom_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(10, 0))
@@ -524,6 +1360,7 @@ def show_exclusion_editor():
     # --- 綁定 Enter 鍵 --- #
     exact_entry.bind("<Return>", lambda event: add_item(exact_entry, exact_listbox, excluded_exact_list))
     prefix_entry.bind("<Return>", lambda event: add_item(prefix_entry, prefix_listbox, excluded_prefix_list))
+    pattern_entry.bind("<Return>", lambda event: add_pattern())
 
     # --- 等待視窗關閉 ---
     root.wait_window(editor_window)
@@ -531,75 +1368,163 @@ def show_exclusion_editor():
 
 
 # --- GUI 設定 ---
-root = tk.Tk()
-root.title("專案檔案選擇性複製工具")
-
-# 設定 StringVars
-source_dir_var = tk.StringVar()
-dest_dir_var = tk.StringVar()
-status_label_var = tk.StringVar()
-
-# --- 新增：時間戳記開關變數 --- #
-append_timestamp_var = tk.BooleanVar()
-# --- 新增結束 --- #
-
-# 載入設定檔 (路徑、排除規則和時間戳記狀態)
-load_config()
-
-# --- 介面佈局 ---
-main_frame = tk.Frame(root, padx=10, pady=10)
-main_frame.pack(fill=tk.BOTH, expand=True)
-
-# 來源資料夾
-source_frame = tk.Frame(main_frame)
-source_frame.pack(fill=tk.X, pady=5)
-tk.Label(source_frame, text="來源專案資料夾:").pack(side=tk.LEFT, padx=5)
-source_entry = tk.Entry(source_frame, textvariable=source_dir_var, width=50)
-source_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-tk.Button(source_frame, text="瀏覽...", command=lambda: select_directory(source_dir_var, "選擇來源專案資料夾")).pack(side=tk.LEFT)
-
-# 目標資料夾
-dest_frame = tk.Frame(main_frame)
-dest_frame.pack(fill=tk.X, pady=5)
-tk.Label(dest_frame, text="複製到目標資料夾:").pack(side=tk.LEFT, padx=5)
-dest_entry = tk.Entry(dest_frame, textvariable=dest_dir_var, width=50)
-dest_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-tk.Button(dest_frame, text="瀏覽...", command=lambda: select_directory(dest_dir_var, "選擇儲存複製檔案的資料夾")).pack(side=tk.LEFT)
-
-# 操作按鈕
-button_frame = tk.Frame(main_frame)
-button_frame.pack(pady=10)
-calculate_button = tk.Button(button_frame, text="計算檔案數量 (排除)", command=calculate_files_to_copy) # 修改按鈕文字
-calculate_button.pack(side=tk.LEFT, padx=5) # 調整 padding
-# 新增計算 (完整) 按鈕
-calculate_full_button = tk.Button(button_frame, text="計算檔案數量 (完整)", command=calculate_files_for_full_copy)
-calculate_full_button.pack(side=tk.LEFT, padx=5)
-copy_button = tk.Button(button_frame, text="開始複製", command=start_copying, state=tk.DISABLED)
-copy_button.pack(side=tk.LEFT, padx=5)
-preview_button = tk.Button(button_frame, text="預覽檔案", command=show_file_preview, state=tk.DISABLED)
-preview_button.pack(side=tk.LEFT, padx=5)
-
-# 編輯規則按鈕移到按鈕區
-editor_button = tk.Button(button_frame, text="編輯排除規則", command=show_exclusion_editor)
-editor_button.pack(side=tk.LEFT, padx=5)
-
-# --- 新增：時間戳記 Checkbutton --- #
-timestamp_check = tk.Checkbutton(main_frame, text="目標資料夾附加時間戳記 (例如：目標_YYYYMMDD_HHMMSS)",
-                                 variable=append_timestamp_var,
-                                 command=save_config) # 點擊即儲存狀態
-timestamp_check.pack(pady=5, anchor='w')
-# --- 新增結束 --- #
-
-# 進度條
-progress_bar = ttk.Progressbar(main_frame, orient=tk.HORIZONTAL, length=300, mode='determinate')
-progress_bar.pack(pady=10, fill=tk.X)
-
-# 狀態顯示
-status_label = tk.Label(main_frame, textvariable=status_label_var, justify=tk.LEFT, wraplength=450) # wraplength 自動換行
-status_label.pack(pady=5, fill=tk.X) # 調整 padding
-
-# 初始化狀態
-reset_calculation()
-
-# --- 啟動 GUI ---
-root.mainloop()
\ No newline at end of file
+def main():
+    """建立主視窗並啟動 GUI (匯入此模組時不會建立視窗)"""
+    global root, source_dir_var, dest_dir_var, status_label_var
+    global calculate_button, calculate_full_button, copy_button, preview_button, editor_button, stream_button
+    global verify_button, watch_button, restore_button
+    global append_timestamp_var, incremental_var, manifest_hash_var, copy_workers_var, progress_bar
+    global snapshot_links_var, output_mode_var, resume_journal_var, mirror_var, verify_var
+
+    root = tk.Tk()
+    root.title("專案檔案選擇性複製工具")
+
+    # 設定 StringVars
+    source_dir_var = tk.StringVar()
+    dest_dir_var = tk.StringVar()
+    status_label_var = tk.StringVar()
+
+    # --- 新增：時間戳記開關變數 --- #
+    append_timestamp_var = tk.BooleanVar()
+    # --- 新增結束 --- #
+    # --- 新增：增量備份開關變數 --- #
+    incremental_var = tk.BooleanVar()
+    manifest_hash_var = tk.BooleanVar()
+    # --- 新增：複製執行緒數變數 --- #
+    copy_workers_var = tk.IntVar(value=DEFAULT_COPY_WORKERS)
+    # --- 新增：快照硬連結開關變數 --- #
+    snapshot_links_var = tk.BooleanVar()
+    # --- 新增：輸出方式變數 --- #
+    output_mode_var = tk.StringVar(value='folder')
+    # --- 新增：續傳日誌開關變數 --- #
+    resume_journal_var = tk.BooleanVar(value=True)
+    # --- 新增：鏡像模式開關變數 --- #
+    mirror_var = tk.BooleanVar()
+    # --- 新增：複製時計算校驗碼開關變數 --- #
+    verify_var = tk.BooleanVar()
+
+    # 載入設定檔 (路徑、排除規則和時間戳記狀態)
+    load_config()
+
+    # --- 介面佈局 ---
+    main_frame = tk.Frame(root, padx=10, pady=10)
+    main_frame.pack(fill=tk.BOTH, expand=True)
+
+    # 來源資料夾
+    source_frame = tk.Frame(main_frame)
+    source_frame.pack(fill=tk.X, pady=5)
+    tk.Label(source_frame, text="來源專案資料夾:").pack(side=tk.LEFT, padx=5)
+    source_entry = tk.Entry(source_frame, textvariable=source_dir_var, width=50)
+    source_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+    tk.Button(source_frame, text="瀏覽...", command=lambda: select_directory(source_dir_var, "選擇來源專案資料夾")).pack(side=tk.LEFT)
+
+    # 目標資料夾
+    dest_frame = tk.Frame(main_frame)
+    dest_frame.pack(fill=tk.X, pady=5)
+    tk.Label(dest_frame, text="複製到目標資料夾:").pack(side=tk.LEFT, padx=5)
+    dest_entry = tk.Entry(dest_frame, textvariable=dest_dir_var, width=50)
+    dest_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+    tk.Button(dest_frame, text="瀏覽...", command=lambda: select_directory(dest_dir_var, "選擇儲存複製檔案的資料夾")).pack(side=tk.LEFT)
+
+    # 操作按鈕
+    button_frame = tk.Frame(main_frame)
+    button_frame.pack(pady=10)
+    calculate_button = tk.Button(button_frame, text="計算檔案數量 (排除)", command=calculate_files_to_copy) # 修改按鈕文字
+    calculate_button.pack(side=tk.LEFT, padx=5) # 調整 padding
+    # 新增計算 (完整) 按鈕
+    calculate_full_button = tk.Button(button_frame, text="計算檔案數量 (完整)", command=calculate_files_for_full_copy)
+    calculate_full_button.pack(side=tk.LEFT, padx=5)
+    copy_button = tk.Button(button_frame, text="開始複製", command=start_copying, state=tk.DISABLED)
+    copy_button.pack(side=tk.LEFT, padx=5)
+    preview_button = tk.Button(button_frame, text="預覽檔案", command=show_file_preview, state=tk.DISABLED)
+    preview_button.pack(side=tk.LEFT, padx=5)
+    # 新增串流備份按鈕 (不需先計算)
+    stream_button = tk.Button(button_frame, text="直接備份 (邊掃描邊複製)", command=start_streaming)
+    stream_button.pack(side=tk.LEFT, padx=5)
+
+    # 編輯規則按鈕移到按鈕區
+    editor_button = tk.Button(button_frame, text="編輯排除規則", command=show_exclusion_editor)
+    editor_button.pack(side=tk.LEFT, padx=5)
+    # 新增驗證備份按鈕 (依複製時記錄的校驗碼檢查)
+    verify_button = tk.Button(button_frame, text="驗證備份", command=start_verify)
+    verify_button.pack(side=tk.LEFT, padx=5)
+    # 新增持續同步按鈕 (監看來源，只複製有變更的檔案；再按一次停止)
+    watch_button = tk.Button(button_frame, text="持續同步", command=toggle_watch)
+    watch_button.pack(side=tk.LEFT, padx=5)
+    # 新增從備份還原按鈕 (選擇快照與項目，平行還原)
+    restore_button = tk.Button(button_frame, text="從備份還原", command=show_restore_dialog)
+    restore_button.pack(side=tk.LEFT, padx=5)
+
+    # --- 新增：時間戳記 Checkbutton --- #
+    timestamp_check = tk.Checkbutton(main_frame, text="目標資料夾附加時間戳記 (例如：目標_YYYYMMDD_HHMMSS)",
+                                     variable=append_timestamp_var,
+                                     command=save_config) # 點擊即儲存狀態
+    timestamp_check.pack(pady=5, anchor='w')
+    # --- 新增結束 --- #
+    # --- 新增：快照硬連結 Checkbutton --- #
+    snapshot_links_check = tk.Checkbutton(main_frame, text="時間戳記快照以硬連結共用上一個快照中未變更的檔案 (節省空間與時間)",
+                                          variable=snapshot_links_var,
+                                          command=save_config)
+    snapshot_links_check.pack(anchor='w')
+
+    # --- 新增：增量備份 Checkbutton (變更設定需重新計算) --- #
+    incremental_check = tk.Checkbutton(main_frame, text="增量備份 (只複製上次備份後新增或變更的檔案)",
+                                       variable=incremental_var,
+                                       command=on_incremental_toggle)
+    incremental_check.pack(anchor='w')
+    manifest_hash_check = tk.Checkbutton(main_frame, text="增量清單記錄內容雜湊 (修改時間不同時比對內容，較慢)",
+                                         variable=manifest_hash_var,
+                                         command=on_incremental_toggle)
+    manifest_hash_check.pack(anchor='w')
+    # --- 新增：續傳 Checkbutton --- #
+    resume_check = tk.Checkbutton(main_frame, text="記錄複製日誌 (中斷後重新執行時從停下的地方繼續，被鎖住的檔案會稍後重試)",
+                                  variable=resume_journal_var,
+                                  command=save_config)
+    resume_check.pack(anchor='w')
+    # --- 新增：鏡像模式 Checkbutton (變更設定需重新計算) --- #
+    mirror_check = tk.Checkbutton(main_frame, text="鏡像模式 (刪除目標中來源已不存在的檔案，計算後可先預覽)",
+                                  variable=mirror_var,
+                                  command=on_incremental_toggle)
+    mirror_check.pack(anchor='w')
+    # --- 新增：校驗碼 Checkbutton --- #
+    verify_check = tk.Checkbutton(main_frame, text="複製時計算校驗碼 (不需再讀一次檔案，之後可用「驗證備份」檢查是否完整)",
+                                  variable=verify_var,
+                                  command=save_config)
+    verify_check.pack(anchor='w')
+
+    # --- 新增：複製執行緒數 Spinbox --- #
+    workers_frame = tk.Frame(main_frame)
+    workers_frame.pack(anchor='w', pady=5)
+    tk.Label(workers_frame, text="同時複製的執行緒數:").pack(side=tk.LEFT)
+    workers_spinbox = tk.Spinbox(workers_frame, from_=1, to=MAX_COPY_WORKERS, width=5,
+                                 textvariable=copy_workers_var,
+                                 command=save_config)
+    workers_spinbox.pack(side=tk.LEFT, padx=5)
+    workers_spinbox.bind("<FocusOut>", lambda event: save_config())
+
+    # --- 新增：輸出方式 Combobox (資料夾或單一壓縮封存檔) --- #
+    output_frame = tk.Frame(main_frame)
+    output_frame.pack(anchor='w', pady=5)
+    tk.Label(output_frame, text="輸出方式 (folder 為資料夾，pack 為去重的封包庫，其餘寫成封存檔；zip 只以單執行緒壓縮):").pack(side=tk.LEFT)
+    output_combobox = ttk.Combobox(output_frame, textvariable=output_mode_var, values=OUTPUT_MODES,
+                                   state='readonly', width=10)
+    output_combobox.pack(side=tk.LEFT, padx=5)
+    output_combobox.bind("<<ComboboxSelected>>", on_output_mode_change)
+
+    # 進度條
+    progress_bar = ttk.Progressbar(main_frame, orient=tk.HORIZONTAL, length=300, mode='determinate')
+    progress_bar.pack(pady=10, fill=tk.X)
+
+    # 狀態顯示
+    status_label = tk.Label(main_frame, textvariable=status_label_var, justify=tk.LEFT, wraplength=450) # wraplength 自動換行
+    status_label.pack(pady=5, fill=tk.X) # 調整 padding
+
+    # 初始化狀態
+    reset_calculation()
+
+    # --- 啟動 GUI ---
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()